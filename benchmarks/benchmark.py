@@ -0,0 +1,345 @@
+# ical2vdir - convert .ics file to vdir directory
+#
+# Copyright (C) 2020 Fabian Peter Hammerle <fabian@hammerle.me>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Times ical2vdir on synthetic calendars.
+# Prints results as JSON, e.g.:
+# $ python3 benchmarks/benchmark.py --events 10000 > results.json
+# Additional arguments after "--" are passed to ical2vdir:
+# $ python3 benchmarks/benchmark.py -- --stream --jobs 4
+
+import argparse
+import contextlib
+import datetime
+import functools
+import io
+import json
+import logging
+import pathlib
+import platform
+import random
+import sys
+import tempfile
+import time
+import typing
+import unittest.mock
+
+import icalendar
+
+import ical2vdir
+import ical2vdir._cli
+
+# pylint: disable=protected-access
+
+_PROFILED_FUNCTION_NAMES = [
+    "_sync_event",
+    "_events_equal",
+    "_write_item",
+]
+
+_VTIMEZONE_ICAL = """BEGIN:VTIMEZONE
+TZID:Europe/Vienna
+X-LIC-LOCATION:Europe/Vienna
+BEGIN:DAYLIGHT
+TZOFFSETFROM:+0100
+TZOFFSETTO:+0200
+TZNAME:CEST
+DTSTART:19700329T020000
+RRULE:FREQ=YEARLY;BYMONTH=3;BYDAY=-1SU
+END:DAYLIGHT
+BEGIN:STANDARD
+TZOFFSETFROM:+0200
+TZOFFSETTO:+0100
+TZNAME:CET
+DTSTART:19701025T030000
+RRULE:FREQ=YEARLY;BYMONTH=10;BYDAY=-1SU
+END:STANDARD
+END:VTIMEZONE
+"""
+
+
+def _fold(content_line: str) -> str:
+    # https://tools.ietf.org/html/rfc5545#section-3.1
+    return "\n ".join(
+        content_line[index : index + 74] for index in range(0, len(content_line), 74)
+    )
+
+
+def _basic_format(dt_obj: datetime.datetime) -> str:
+    return dt_obj.strftime("%Y%m%dT%H%M%S")
+
+
+def _generate_component_icals(
+    *,
+    events: int,
+    recurring_share: float,
+    override_share: float,
+    todo_share: float,
+    description_size: int,
+    exdates: int,
+    seed: int,
+) -> typing.Iterator[str]:
+    # pylint: disable=too-many-arguments,too-many-locals; parameters
+    rand = random.Random(seed)
+    start = datetime.datetime(2026, 1, 5, 9, 0)
+    dtstamp = "20260101T000000"
+    for index in range(events):
+        uid = f"{index:08d}@ical2vdir-benchmark"
+        dtstart = start + datetime.timedelta(hours=rand.randrange(24 * 365))
+        if rand.random() < todo_share:
+            yield "\n".join(
+                [
+                    "BEGIN:VTODO",
+                    f"UID:{uid}",
+                    f"DTSTAMP:{dtstamp}Z",
+                    f"SUMMARY:task {index}",
+                    f"DUE;VALUE=DATE:{dtstart.strftime('%Y%m%d')}",
+                    "END:VTODO",
+                ]
+            )
+            continue
+        lines = [
+            "BEGIN:VEVENT",
+            f"UID:{uid}",
+            f"DTSTAMP:{dtstamp}Z",
+            f"SUMMARY:event {index}",
+            f"DTSTART;TZID=Europe/Vienna:{_basic_format(dtstart)}",
+            "DTEND;TZID=Europe/Vienna:"
+            + _basic_format(dtstart + datetime.timedelta(hours=1)),
+        ]
+        if description_size:
+            lines.append(
+                _fold(
+                    "DESCRIPTION:"
+                    + "".join(
+                        rand.choice("abcdefghijklmnopqrstuvwxyz ")
+                        for _ in range(description_size)
+                    )
+                )
+            )
+        recurring = rand.random() < recurring_share
+        if recurring:
+            lines.append("RRULE:FREQ=WEEKLY")
+            lines.extend(
+                "EXDATE;TZID=Europe/Vienna:"
+                + _basic_format(dtstart + datetime.timedelta(weeks=week))
+                for week in range(1, exdates + 1)
+            )
+        yield "\n".join(lines + ["END:VEVENT"])
+        if recurring and rand.random() < override_share:
+            recurrence_id = dtstart + datetime.timedelta(weeks=exdates + 1)
+            yield "\n".join(
+                [
+                    "BEGIN:VEVENT",
+                    f"UID:{uid}",
+                    f"DTSTAMP:{dtstamp}Z",
+                    f"SUMMARY:event {index} override",
+                    f"DTSTART;TZID=Europe/Vienna:{_basic_format(recurrence_id)}",
+                    "DTEND;TZID=Europe/Vienna:"
+                    + _basic_format(recurrence_id + datetime.timedelta(hours=2)),
+                    f"RECURRENCE-ID;TZID=Europe/Vienna:{_basic_format(recurrence_id)}",
+                    "END:VEVENT",
+                ]
+            )
+
+
+def _generate_calendar_ical(component_icals: typing.Iterable[str]) -> bytes:
+    # > Content lines are delimited by a line break,
+    # > which is a CRLF sequence [...]
+    # https://tools.ietf.org/html/rfc5545#section-3.1
+    return (
+        "\n".join(
+            [
+                "BEGIN:VCALENDAR",
+                "PRODID:-//ical2vdir//benchmark//EN",
+                "VERSION:2.0",
+                _VTIMEZONE_ICAL.rstrip("\n"),
+                *component_icals,
+                "END:VCALENDAR",
+                "",
+            ]
+        )
+        .replace("\n", "\r\n")
+        .encode()
+    )
+
+
+def _change_components(
+    component_icals: list[str], share: float, seed: int
+) -> list[str]:
+    rand = random.Random(seed)
+    return [
+        (
+            component_ical.replace("SUMMARY:", "SUMMARY:changed ", 1)
+            if rand.random() < share
+            else component_ical
+        )
+        for component_ical in component_icals
+    ]
+
+
+class _Profiler:
+    def __init__(self) -> None:
+        self.calls: dict[str, int] = {}
+        self.seconds: dict[str, float] = {}
+
+    def wrap(
+        self, name: str, func: typing.Callable[..., typing.Any]
+    ) -> typing.Callable[..., typing.Any]:
+        @functools.wraps(func)
+        def wrapper(*args: typing.Any, **kwargs: typing.Any) -> typing.Any:
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.calls[name] = self.calls.get(name, 0) + 1
+                self.seconds[name] = (
+                    self.seconds.get(name, 0.0) + time.perf_counter() - start
+                )
+
+        return wrapper
+
+    def results(self) -> dict[str, dict[str, float]]:
+        return {
+            name: {"calls": self.calls[name], "seconds": self.seconds[name]}
+            for name in sorted(self.calls)
+        }
+
+
+def _run(
+    calendar_ical: bytes, output_dir_path: pathlib.Path, args: list[str]
+) -> dict[str, typing.Any]:
+    profiler = _Profiler()
+    with contextlib.ExitStack() as stack:
+        for name in _PROFILED_FUNCTION_NAMES:
+            stack.enter_context(
+                unittest.mock.patch.object(
+                    ical2vdir, name, profiler.wrap(name, getattr(ical2vdir, name))
+                )
+            )
+        stack.enter_context(unittest.mock.patch("sys.stdin", io.BytesIO(calendar_ical)))
+        stack.enter_context(
+            unittest.mock.patch(
+                "sys.argv",
+                ["ical2vdir", "--output-dir", str(output_dir_path), "--silent"] + args,
+            )
+        )
+        start = time.perf_counter()
+        ical2vdir._cli._main()
+        seconds = time.perf_counter() - start
+    return {"seconds": seconds, "functions": profiler.results()}
+
+
+def _run_scenarios(
+    component_icals: list[str], args: argparse.Namespace
+) -> typing.Iterator[tuple[str, dict[str, typing.Any]]]:
+    calendar_ical = _generate_calendar_ical(component_icals)
+    with tempfile.TemporaryDirectory(prefix="ical2vdir-benchmark-") as temp_dir:
+        output_dir_path = pathlib.Path(temp_dir)
+        yield "cold", _run(calendar_ical, output_dir_path, args.ical2vdir_args)
+        # servers like Google Calendar set DTSTAMP to the time of the download
+        yield "unchanged", _run(
+            calendar_ical.replace(b"DTSTAMP:20260101T", b"DTSTAMP:20260102T"),
+            output_dir_path,
+            args.ical2vdir_args,
+        )
+        yield "changed", _run(
+            _generate_calendar_ical(
+                _change_components(
+                    component_icals, share=args.changed_share, seed=args.seed
+                )
+            ),
+            output_dir_path,
+            args.ical2vdir_args,
+        )
+        yield "delete", _run(
+            _generate_calendar_ical(
+                component_icals[: int(len(component_icals) * (1 - args.removed_share))]
+            ),
+            output_dir_path,
+            args.ical2vdir_args + ["--delete"],
+        )
+
+
+def _main() -> None:
+    argparser = argparse.ArgumentParser(
+        description="Time ical2vdir on a synthetic calendar. Prints JSON."
+    )
+    argparser.add_argument("--events", type=int, default=1000)
+    argparser.add_argument("--recurring-share", type=float, default=0.2)
+    argparser.add_argument(
+        "--override-share",
+        type=float,
+        default=0.5,
+        help="Share of recurring events with an override (RECURRENCE-ID)",
+    )
+    argparser.add_argument("--todo-share", type=float, default=0.1)
+    argparser.add_argument(
+        "--description-size", type=int, default=512, metavar="CHARACTERS"
+    )
+    argparser.add_argument(
+        "--exdates", type=int, default=8, help="EXDATEs per recurring event"
+    )
+    argparser.add_argument("--changed-share", type=float, default=0.01)
+    argparser.add_argument("--removed-share", type=float, default=0.5)
+    argparser.add_argument("--repeat", type=int, default=1)
+    argparser.add_argument("--seed", type=int, default=0)
+    argparser.add_argument(
+        "ical2vdir_args",
+        nargs="*",
+        metavar="-- ical2vdir_args",
+        help="e.g. -- --stream --jobs 4",
+    )
+    args = argparser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    component_icals = list(
+        _generate_component_icals(
+            events=args.events,
+            recurring_share=args.recurring_share,
+            override_share=args.override_share,
+            todo_share=args.todo_share,
+            description_size=args.description_size,
+            exdates=args.exdates,
+            seed=args.seed,
+        )
+    )
+    scenarios: dict[str, list[dict[str, typing.Any]]] = {}
+    for _ in range(args.repeat):
+        for name, result in _run_scenarios(component_icals, args):
+            scenarios.setdefault(name, []).append(result)
+    json.dump(
+        {
+            "python": platform.python_version(),
+            "icalendar": getattr(icalendar, "__version__", None),
+            "parameters": vars(args),
+            "components": len(component_icals),
+            "input_bytes": len(_generate_calendar_ical(component_icals)),
+            "scenarios": {
+                name: {
+                    "min_seconds": min(r["seconds"] for r in results),
+                    "runs": results,
+                }
+                for name, results in scenarios.items()
+            },
+        },
+        sys.stdout,
+        indent=2,
+    )
+    sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    _main()
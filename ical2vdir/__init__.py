@@ -15,24 +15,83 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
-import argparse
-import datetime
+from __future__ import annotations
+
+import collections
+import concurrent.futures
+import contextlib
+import hashlib
+import io
 import logging
 import os
 import pathlib
-import shutil
-import sys
-import tempfile
+import re
+import threading
 import typing
 
-import icalendar
+from ical2vdir._common import (
+    _FSYNC_NEVER,
+    _VDIR_EVENT_FILE_EXTENSION,
+    DeleteLimitExceeded,
+    SyncResult,
+    _AtomicWriter,
+    _event_vdir_filename,
+    _is_event,
+    _read_state_file,
+    _save_state,
+    _State,
+    _state_entry,
+    _state_entry_matches,
+    _SyncContext,
+)
+from ical2vdir._dates import _memoized_date_parsing
+from ical2vdir._input import (
+    _content_line_name,
+    _iter_component_icals,
+    _iter_content_lines,
+    _iter_paths_component_icals,
+    _paths_digest,
+)
+from ical2vdir._layout import (
+    _LAYOUT_FLAT,
+    _item_linked,
+    _item_path,
+    _link_item,
+    _new_scan,
+    _Scan,
+    _shard_mtimes,
+    _write_item,
+)
+from ical2vdir._progress import _PROGRESS_ITEMS, _ProgressReporter
+from ical2vdir._scan import _item_stat
+
+if typing.TYPE_CHECKING:  # pragma: no cover
+    # imported lazily to speed up --help & runs with unchanged input
+    import icalendar
+
+    from ical2vdir._delete import _DeletePolicy
+    from ical2vdir._incremental import _IncrementalInput
+    from ical2vdir._stats import _Stats
+    from ical2vdir._watch import _SyncCache
+
+__all__ = ["DeleteLimitExceeded", "SyncResult", "sync"]
 
 _LOGGER = logging.getLogger(__name__)
 
-_VDIR_EVENT_FILE_EXTENSION = ".ics"
+# list of paths: files are memory-mapped (see --input)
+_Source = typing.Union[bytes, typing.BinaryIO, "icalendar.Calendar", list[pathlib.Path]]
+
+# ignored by _events_equal, not folded by icalendar
+_DTSTAMP_LINE_PATTERN = re.compile(
+    rb"^DTSTAMP[:;][^\r\n]*\r?\n", flags=re.MULTILINE | re.IGNORECASE
+)
+
+_T = typing.TypeVar("_T")
 
 
 def _event_prop_equal(prop_a: typing.Any, prop_b: typing.Any) -> bool:
+    import icalendar  # pylint: disable=import-outside-toplevel
+
     if isinstance(prop_a, list):
         return (
             isinstance(prop_b, list)
@@ -49,8 +108,15 @@ def _event_prop_equal(prop_a: typing.Any, prop_b: typing.Any) -> bool:
             and len(prop_a.dts) == len(prop_b.dts)
             and all(_event_prop_equal(*pair) for pair in zip(prop_a.dts, prop_b.dts))
         )
-    if isinstance(prop_a, (icalendar.prop.vDDDTypes, icalendar.prop.vCategory)):
-        # pylint: disable=unidiomatic-typecheck
+    # pylint: disable=unidiomatic-typecheck
+    if isinstance(prop_a, icalendar.prop.vDDDTypes):
+        # cheaper than comparing vars() (dt & params)
+        return (
+            type(prop_a) == type(prop_b)
+            and prop_a.dt == prop_b.dt
+            and prop_a.params == prop_b.params
+        )
+    if isinstance(prop_a, icalendar.prop.vCategory):
         return type(prop_a) == type(prop_b) and vars(prop_a) == vars(prop_b)
     return typing.cast(bool, prop_a == prop_b and prop_a.params == prop_b.params)
 
@@ -80,131 +146,545 @@ def _events_equal(
     return True
 
 
-def _datetime_basic_isoformat(dt_obj: datetime.datetime) -> str:
-    # .isoformat() inserts unwanted separators
-    return dt_obj.strftime("%Y%m%dT%H%M%S%z")
+def _ical_digest(ical: bytes) -> str:
+    # unfolded & with normalized line breaks,
+    # excluding DTSTAMP (ignored by _events_equal)
+    digest = hashlib.sha256()
+    for content_line, _ in _iter_content_lines(ical.splitlines()):
+        if _content_line_name(content_line) != b"DTSTAMP":
+            digest.update(content_line + b"\r\n")
+    return digest.hexdigest()
 
 
-def _event_vdir_filename(event: icalendar.cal.Component) -> str:
-    # > An item should contain a UID property as described by the vCard and iCalendar standards.
-    # > [...] The filename should have similar properties as the UID of the file content.
-    # > However, there is no requirement for these two to be the same.
-    # > Programs may choose to store additional metadata in that filename, [...]
-    # https://vdirsyncer.readthedocs.io/en/stable/vdir.html#basic-structure
-    output_filename = str(event["UID"])
-    if "RECURRENCE-ID" in event:
-        recurrence_id = event["RECURRENCE-ID"]
-        if isinstance(recurrence_id.dt, datetime.datetime):
-            output_filename += "." + _datetime_basic_isoformat(recurrence_id.dt)
-        else:
-            assert isinstance(recurrence_id.dt, datetime.date), vars(recurrence_id)
-            output_filename += "." + recurrence_id.dt.strftime("%Y%m%d")
-    return output_filename + _VDIR_EVENT_FILE_EXTENSION
-
-
-def _write_event(event: icalendar.cal.Component, path: pathlib.Path) -> None:
-    if path.is_dir():
-        raise IsADirectoryError(path)  # similar to os.rename
-    # > Creating and modifying items or metadata files should happen atomically.
-    # https://vdirsyncer.readthedocs.io/en/stable/vdir.html#writing-to-vdirs
-    temp_fd, temp_path = tempfile.mkstemp(
-        prefix="ical2vdir-", suffix=_VDIR_EVENT_FILE_EXTENSION
+def _icals_equal_ignoring_dtstamp(ical_a: bytes, ical_b: bytes) -> bool:
+    # byte-level, without unfolding lines (see _ical_digest)
+    if ical_a == ical_b:
+        return True
+    return _DTSTAMP_LINE_PATTERN.sub(b"", ical_a) == _DTSTAMP_LINE_PATTERN.sub(
+        b"", ical_b
     )
-    try:
-        # > Content lines are delimited by a line break,
-        # > which is a CRLF sequence [...]
-        # https://tools.ietf.org/html/rfc5545#section-3.1
-        os.write(temp_fd, event.to_ical())
-        os.close(temp_fd)
-        shutil.move(temp_path, path)
-    finally:
-        if os.path.exists(temp_path):
-            os.unlink(temp_path)
+
+
+def _event_ical(event: icalendar.cal.Component) -> bytes:
+    # canonical serialization (properties & parameters sorted by name),
+    # computed once per synced component for digest, comparison & writing.
+    # items written by ical2vdir are thus byte-comparable with the input.
+    return typing.cast(bytes, event.to_ical(sorted=True))
+
+
+def _input_unchanged(
+    state_file: dict[str, typing.Any],
+    scan: _Scan,
+    input_digest: str,
+    delete: bool,
+) -> bool:
+    previous_input_info = state_file.get("input")
+    if previous_input_info is None or previous_input_info["sha256"] != input_digest:
+        return False
+    items: _State = state_file["items"]
+    for filename, entry in items.items():
+        if not _state_entry_matches(entry, entry["digest"], scan.stat(filename)):
+            _LOGGER.debug("%s was modified since last run", scan.path / filename)
+            return False
+        if not _item_linked(scan, filename):
+            _LOGGER.debug(
+                "symlink %s was modified since last run", scan.path / filename
+            )
+            return False
+    return not delete or scan.file_names(_VDIR_EVENT_FILE_EXTENSION) <= items.keys()
+
+
+def _item_up_to_date(
+    event: icalendar.cal.Component,
+    event_ical: bytes,
+    event_digest: str,
+    output_path: pathlib.Path,
+    stats: _Stats,
+) -> bool:
+    import icalendar  # pylint: disable=import-outside-toplevel
+
+    with stats.measure("read_items"), output_path.open("rb") as current_file:
+        current_ical = current_file.read()
+    stats.count("item_bytes_read", len(current_ical))
+    with stats.measure("compare"):
+        # written by previous run & upstream changed at most DTSTAMP
+        if _icals_equal_ignoring_dtstamp(current_ical, event_ical):
+            return True
+        # equal digests imply equal events.
+        # events with differing digests might still be considered equal,
+        # e.g. if parameters are ordered differently in the current file.
+        if _ical_digest(current_ical) == event_digest:
+            return True
+    with stats.measure("read_items"):
+        current_event = icalendar.Event.from_ical(current_ical)
+    with stats.measure("compare"):
+        return _events_equal(event, current_event)
 
 
 def _sync_event(
-    event: icalendar.cal.Component, output_dir_path: pathlib.Path
-) -> pathlib.Path:
-    output_path = output_dir_path.joinpath(_event_vdir_filename(event))
-    if not output_path.exists():
-        _LOGGER.info("creating %s", output_path)
-        _write_event(event, output_path)
+    event: icalendar.cal.Component,
+    output_dir_path: pathlib.Path,
+    context: _SyncContext | None = None,
+) -> tuple[pathlib.Path, str]:
+    # returns path & action ("created", "updated" or "unchanged")
+    if context is None:
+        context = _SyncContext()
+    state, stats, scan = context.state, context.stats, context.scan
+    output_filename = _event_vdir_filename(event)
+    output_path = output_dir_path.joinpath(output_filename)
+    # differs from output_path with sharded --layout
+    item_path = _item_path(output_dir_path, output_filename, context.layout)
+    with stats.measure("compare"):
+        event_ical = _event_ical(event)
+        event_digest = _ical_digest(event_ical)
+        up_to_date = state is not None and _state_entry_matches(
+            state.get(output_filename), event_digest, _item_stat(item_path, scan)
+        )
+    if up_to_date:
+        _LOGGER.debug("%s is up to date (index)", output_path)
+        _link_unchanged_item(output_dir_path, output_filename, context)
+        stats.count("unchanged")
+        return output_path, "unchanged"
+    # created & updated items are logged by context.progress
+    if not (item_path.exists() if scan is None else scan.exists(output_filename)):
+        action = "created"
+    elif _item_up_to_date(event, event_ical, event_digest, item_path, stats):
+        _LOGGER.debug("%s is up to date", output_path)
+        action = "unchanged"
     else:
-        with output_path.open("rb") as current_file:
-            current_event = icalendar.Event.from_ical(current_file.read())
-        if _events_equal(event, current_event):
-            _LOGGER.debug("%s is up to date", output_path)
-        else:
-            _LOGGER.info("updating %s", output_path)
-            _write_event(event, output_path)
-    return output_path
+        action = "updated"
+    output_stat: os.stat_result | None = None
+    if action == "unchanged":
+        _link_unchanged_item(output_dir_path, output_filename, context)
+        # cached by scan after comparison with index
+        output_stat = _item_stat(item_path, scan) if state is not None else None
+    elif context.plan is not None:
+        context.plan.add(action, output_path, event_ical, _item_stat(item_path, scan))
+    else:
+        with stats.measure("write"):
+            output_stat = _write_item(
+                event_ical,
+                output_dir_path,
+                output_filename,
+                context.layout,
+                context.writer,
+            )
+        stats.count("item_bytes_written", output_stat.st_size)
+        if scan is not None:
+            scan.written(output_filename)
+    stats.count(action)
+    if state is not None and output_stat is not None:
+        state[output_filename] = _state_entry(event, event_digest, output_stat)
+    return output_path, action
 
 
-def _main() -> None:
-    # https://docs.python.org/3/library/logging.html#levels
-    logging.basicConfig(
-        format="%(message)s",
-        # datefmt='%Y-%m-%dT%H:%M:%S%z',
-        level=logging.INFO,
-    )
-    argparser = argparse.ArgumentParser(
-        description="Convert iCalendar .ics file to vdir directory."
-        " Reads from stdin."
-    )
-    argparser.add_argument(
-        "-o",
-        "--output",
-        "--output-dir",
-        default=os.getcwd(),
-        type=pathlib.Path,
-        metavar="path",
-        dest="output_dir_path",
-        help="Path to output directory (default: current workings dir)",
-    )
-    argparser.add_argument(
-        "--delete",
-        action="store_true",
-        help="Delete events not in input from output directory.",
-    )
-    argparser.add_argument(
-        "-s",
-        "--silent",
-        "-q",
-        "--quiet",
-        action="store_true",
-        help="Reduce verbosity.",
-    )
-    argparser.add_argument(
-        "-v",
-        "--verbose",
-        action="store_true",
-        help="Increase verbosity",
-    )
-    args = argparser.parse_args()
-    if args.verbose:
-        logging.getLogger().setLevel(level=logging.DEBUG)
-    elif args.silent:
-        logging.getLogger().setLevel(level=logging.WARNING)
-    calendar = icalendar.Calendar.from_ical(sys.stdin.read())
-    _LOGGER.debug("%d subcomponents", len(calendar.subcomponents))
-    extra_paths = set(
-        path
-        for path in args.output_dir_path.iterdir()
-        if path.is_file() and path.name.endswith(_VDIR_EVENT_FILE_EXTENSION)
-    )
-    for component in calendar.subcomponents:
-        if isinstance(component, (icalendar.cal.Event, icalendar.cal.Todo)):
-            extra_paths.discard(
-                _sync_event(event=component, output_dir_path=args.output_dir_path)
-            )
+def _link_unchanged_item(
+    output_dir_path: pathlib.Path, filename: str, context: _SyncContext
+) -> None:
+    # --layout sharded: flat view might have been modified by vdir readers
+    if context.plan is None:
+        _link_item(output_dir_path, filename, context.layout, context.writer)
+
+
+def _parse_component_icals(
+    component_icals: typing.Iterable[bytes],
+) -> typing.Iterator[icalendar.cal.Component]:
+    # VTIMEZONE components are parsed as well,
+    # as icalendar caches their definitions for subsequent TZID lookups.
+    import icalendar  # pylint: disable=import-outside-toplevel
+
+    for component_ical in component_icals:
+        yield icalendar.cal.Component.from_ical(component_ical)
+
+
+# loggers used by _sync_event
+_WORKER_LOGGER_NAMES = (__name__, f"{__name__}._layout")
+
+
+class _OrderedLogFilter(logging.Filter):
+
+    # Defers log records of worker threads,
+    # so that the main thread can emit them in input order.
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._local = threading.local()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        records = getattr(self._local, "records", None)
+        if records is None:
+            return True
+        records.append(record)
+        return False
+
+    @contextlib.contextmanager
+    def attached(self) -> typing.Iterator[None]:
+        # filters do not apply to records propagated from child loggers
+        loggers = [logging.getLogger(name) for name in _WORKER_LOGGER_NAMES]
+        for logger in loggers:
+            logger.addFilter(self)
+        try:
+            yield
+        finally:
+            for logger in loggers:
+                logger.removeFilter(self)
+
+    def call(
+        self, func: typing.Callable[..., _T], *args: typing.Any
+    ) -> tuple[_T, list[logging.LogRecord]]:
+        records: list[logging.LogRecord] = []
+        self._local.records = records
+        try:
+            return func(*args), records
+        finally:
+            self._local.records = None
+
+
+def _sync_event_after(
+    previous_future: concurrent.futures.Future[typing.Any] | None,
+    event: icalendar.cal.Component,
+    output_dir_path: pathlib.Path,
+    context: _SyncContext,
+) -> tuple[pathlib.Path, str]:
+    # input may contain multiple components with the same filename
+    # (see ical2vdir._duplicates)
+    if previous_future is not None:
+        previous_future.result()
+    return _sync_event(event, output_dir_path, context)
+
+
+_PendingSync = tuple[
+    concurrent.futures.Future[tuple[tuple[pathlib.Path, str], list[logging.LogRecord]]]
+    | None,
+    "icalendar.cal.Component",
+]
+
+
+def _sync_events_concurrently(
+    components: typing.Iterable[icalendar.cal.Component],
+    output_dir_path: pathlib.Path,
+    jobs: int,
+    context: _SyncContext,
+) -> typing.Iterator[tuple[pathlib.Path, str]]:
+    log_filter = _OrderedLogFilter()
+    # bounded to keep memory usage independent of input size
+    pending: collections.deque[_PendingSync] = collections.deque()
+    last_future_by_filename: dict[str, concurrent.futures.Future[typing.Any]] = {}
+
+    def complete_oldest() -> typing.Iterator[tuple[pathlib.Path, str]]:
+        future, component = pending.popleft()
+        if future is None:
+            _LOGGER.debug("%s", component)
+            context.stats.count("skipped")
+            return
+        (output_path, action), records = future.result()
+        for record in records:
+            logging.getLogger(record.name).handle(record)
+        if last_future_by_filename.get(output_path.name) is future:
+            del last_future_by_filename[output_path.name]
+        yield output_path, action
+
+    with log_filter.attached(), concurrent.futures.ThreadPoolExecutor(
+        max_workers=jobs
+    ) as executor:
+        for component in components:
+            future = None
+            if _is_event(component):
+                filename = _event_vdir_filename(component)
+                future = executor.submit(
+                    log_filter.call,
+                    _sync_event_after,
+                    last_future_by_filename.get(filename),
+                    component,
+                    output_dir_path,
+                    context,
+                )
+                last_future_by_filename[filename] = future
+            pending.append((future, component))
+            if len(pending) > jobs * 2:
+                yield from complete_oldest()
+        while pending:
+            yield from complete_oldest()
+
+
+def _sync_events(
+    components: typing.Iterable[icalendar.cal.Component],
+    output_dir_path: pathlib.Path,
+    *,
+    jobs: int = 1,
+    context: _SyncContext | None = None,
+) -> typing.Iterator[tuple[pathlib.Path, str]]:
+    # yields paths of synced items & actions in input order
+    if context is None:
+        context = _SyncContext()
+    if jobs > 1:
+        yield from _sync_events_concurrently(components, output_dir_path, jobs, context)
+        return
+    for component in components:
+        if _is_event(component):
+            yield _sync_event(component, output_dir_path, context)
         else:
             _LOGGER.debug("%s", component)
+            context.stats.count("skipped")
+
+
+def _prune_state(state: _State, synced_filenames: set[str]) -> _State:
+    # drops entries of items not in input
+    return {
+        filename: entry
+        for filename, entry in state.items()
+        if filename in synced_filenames
+    }
+
+
+def _iter_source_components(
+    source: _Source,
+    stream: bool,
+    context: _SyncContext,
+    incremental_input: _IncrementalInput | None = None,
+    output_dir_path: pathlib.Path | None = None,
+) -> typing.Iterable[icalendar.cal.Component]:
+    import icalendar  # pylint: disable=import-outside-toplevel
+
+    # pylint: disable=import-outside-toplevel
+    from ical2vdir._duplicates import _filter_superseded, _resolve_duplicates
+
+    stats = context.stats
+    if isinstance(source, icalendar.Calendar):
+        # copy: source remains unchanged
+        return _resolve_duplicates(list(source.subcomponents), context)
+    if isinstance(source, list):
+        stats.count("input_bytes", sum(p.stat().st_size for p in source))
+        component_icals = _iter_paths_component_icals(source)
+    elif stream or incremental_input is not None:
+        if isinstance(source, bytes):
+            source = io.BytesIO(source)
+        component_icals = _iter_component_icals(
+            stats.count_bytes("input_bytes", source)
+        )
+    else:
+        with stats.measure("parse_input"):
+            if not isinstance(source, bytes):
+                source = source.read()
+            calendar = icalendar.Calendar.from_ical(source)
+        stats.count("input_bytes", len(source))
+        _LOGGER.debug("%d subcomponents", len(calendar.subcomponents))
+        return _resolve_duplicates(
+            typing.cast(list[icalendar.cal.Component], calendar.subcomponents),
+            context,
+        )
+    if incremental_input is None:
+        components = _parse_component_icals(component_icals)
+    else:
+        assert output_dir_path is not None
+        components = incremental_input.iter_changed_components(
+            component_icals, output_dir_path, context
+        )
+    return _filter_superseded(stats.measure_iter("parse_input", components), context)
+
+
+def _source_digest(source: _Source) -> tuple[str | None, int]:
+    # sha256 & size of raw input
+    if isinstance(source, bytes):
+        return hashlib.sha256(source).hexdigest(), len(source)
+    if isinstance(source, list):
+        return _paths_digest(source), sum(p.stat().st_size for p in source)
+    return None, 0
+
+
+def _unchanged_input_result(
+    state_file: dict[str, typing.Any],
+    output_dir_path: pathlib.Path,
+    input_size: int,
+    context: _SyncContext,
+) -> SyncResult:
+    # without importing icalendar
+    _LOGGER.debug("input unchanged since last run")
+    context.stats.count("input_bytes", input_size)
+    context.stats.count("unchanged", len(state_file["items"]))
+    if context.collect_paths:
+        context.result.unchanged.extend(
+            output_dir_path.joinpath(n) for n in state_file["items"]
+        )
+    context.progress.finish(context.stats)
+    context.result.stats = context.stats.as_dict()
+    if context.plan is not None:  # no changes
+        context.result.plan = context.plan.as_dict()
+    return context.result
+
+
+def _output_dir_scan(
+    output_dir_path: pathlib.Path,
+    layout: str,
+    state_file: dict[str, typing.Any],
+    cache: _SyncCache | None,
+) -> _Scan:
+    if cache is None:
+        return _new_scan(output_dir_path, layout, state_file)
+    if cache.scan is None:
+        cache.scan = _new_scan(output_dir_path, layout, state_file)
+    return cache.scan
+
+
+def _sync_components(
+    components: typing.Iterable[icalendar.cal.Component],
+    output_dir_path: pathlib.Path,
+    delete_policy: _DeletePolicy | None,
+    jobs: int,
+    context: _SyncContext,
+) -> None:
+    assert context.scan is not None
+    existing_filenames = context.scan.file_names(_VDIR_EVENT_FILE_EXTENSION)
+    # components are dropped as soon as their item was synced,
+    # only their filenames are kept
+    for output_path, action in _sync_events(
+        components, output_dir_path, jobs=jobs, context=context
+    ):
+        context.record(action, output_path)
+    if context.stats.counts["duplicates"]:
+        _LOGGER.info(
+            "%d components with UID & RECURRENCE-ID of a previous component",
+            context.stats.counts["duplicates"],
+        )
+    # including items skipped by _IncrementalInput
+    extra_filenames = existing_filenames - context.synced_filenames
     _LOGGER.debug(
         "%d pre-existing items not in input: %s",
-        len(extra_paths),
-        ", ".join(p.name for p in extra_paths),
+        len(extra_filenames),
+        ", ".join(extra_filenames),
+    )
+    if delete_policy is not None:
+        with context.stats.measure("delete"):
+            delete_policy.delete_items(
+                [output_dir_path.joinpath(n) for n in extra_filenames],
+                len(existing_filenames),
+                context,
+            )
+
+
+def sync(  # pylint: disable=too-many-arguments,too-many-locals
+    source: _Source,
+    output_dir: pathlib.Path | str,
+    delete: bool = False,
+    *,
+    stream: bool = False,
+    jobs: int = 1,
+    state: bool = False,
+    incremental: bool = False,
+    fsync: str = _FSYNC_NEVER,
+    max_delete: int | None = None,
+    max_delete_fraction: float | None = None,
+    delete_batch_size: int | None = None,
+    delete_interval: float = 0.0,
+    progress: str = _PROGRESS_ITEMS,
+    progress_interval: float = 10.0,
+    event_log: pathlib.Path | str | None = None,
+    collect_paths: bool = True,
+    dry_run: bool = False,
+    layout: str = _LAYOUT_FLAT,
+    cache: _SyncCache | None = None,
+) -> SyncResult:
+    """
+    Sync events & tasks from iCalendar data (bytes, binary file object,
+    parsed icalendar.Calendar or list of paths of files to memory-map)
+    to vdir directory output_dir.
+
+    Keyword arguments correspond to command line options of ical2vdir.
+    Raises DeleteLimitExceeded (before removing any item)
+    if more items than allowed would be removed.
+    collect_paths=False leaves the path lists of the result empty,
+    so that memory usage does not grow with the number of items
+    (counts are available in the result's stats).
+    dry_run=True neither writes nor removes items (nor the --state index),
+    the changes are returned as JSON change plan in the result's plan.
+    cache keeps the listing of output_dir & the index in memory
+    between runs (see --watch).
+    Does not configure logging.
+    """
+    output_dir_path = pathlib.Path(output_dir)
+    state = state or incremental
+    context = _SyncContext(
+        writer=_AtomicWriter(fsync=fsync),
+        progress=_ProgressReporter(
+            mode=progress,
+            interval=progress_interval,
+            event_log_path=None if event_log is None else pathlib.Path(event_log),
+            dry_run=dry_run,
+        ),
+        collect_paths=collect_paths,
+        layout=layout,
     )
-    if args.delete:
-        for path in extra_paths:
-            _LOGGER.info("removing %s", path)
-            path.unlink()
+    if dry_run:
+        # pylint: disable=import-outside-toplevel
+        from ical2vdir._plan import _Plan
+
+        context.plan = _Plan(output_dir_path, layout)
+    with context.stats.measure("total"):
+        state_file = _read_state_file(output_dir_path, cache) if state else {}
+        context.state = state_file.get("items", {}) if state else None
+        with context.stats.measure("scan"):
+            context.scan = _output_dir_scan(output_dir_path, layout, state_file, cache)
+        if state and not stream and hasattr(source, "read"):
+            with context.stats.measure("parse_input"):
+                source = typing.cast(typing.BinaryIO, source).read()
+        input_digest, input_size = _source_digest(source) if state else (None, 0)
+        if input_digest is not None and _input_unchanged(
+            state_file, context.scan, input_digest, delete
+        ):
+            return _unchanged_input_result(
+                state_file, output_dir_path, input_size, context
+            )
+        incremental_input = None
+        if incremental and not hasattr(source, "subcomponents"):
+            # pylint: disable=import-outside-toplevel
+            from ical2vdir._incremental import _IncrementalInput
+
+            incremental_input = _IncrementalInput(
+                # None if last run was without --incremental
+                state_file.get("components")
+                or {}
+            )
+        delete_policy = None
+        if delete:
+            # pylint: disable=import-outside-toplevel
+            from ical2vdir._delete import _DeletePolicy
+
+            delete_policy = _DeletePolicy(
+                max_count=max_delete,
+                max_fraction=max_delete_fraction,
+                batch_size=delete_batch_size,
+                batch_interval=delete_interval,
+            )
+        with _memoized_date_parsing(), context.progress.open_event_log():
+            _sync_components(
+                _iter_source_components(
+                    source, stream, context, incremental_input, output_dir_path
+                ),
+                output_dir_path,
+                delete_policy,
+                jobs,
+                context,
+            )
+        context.progress.finish(context.stats)
+        if context.state is not None and context.plan is None:
+            state_file = _save_state(
+                _prune_state(context.state, context.synced_filenames),
+                output_dir_path,
+                writer=context.writer,
+                metadata={
+                    # identifies the input of the last successful run
+                    "input": None if input_digest is None else {"sha256": input_digest},
+                    "components": (
+                        None if incremental_input is None else incremental_input.current
+                    ),
+                    # shards containing exactly the indexed items
+                    "shards": _shard_mtimes(context.scan) if delete else None,
+                },
+            )
+            if cache is not None:
+                cache.saved_state_file(state_file)
+        context.writer.flush()
+    context.result.stats = context.stats.as_dict()
+    if context.plan is not None:
+        context.result.plan = context.plan.as_dict()
+    return context.result
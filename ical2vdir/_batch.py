@@ -0,0 +1,161 @@
+# ical2vdir - convert .ics file to vdir directory
+#
+# Copyright (C) 2020 Fabian Peter Hammerle <fabian@hammerle.me>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import concurrent.futures
+import dataclasses
+import json
+import logging
+import pathlib
+import sys
+import typing
+
+import ical2vdir
+
+_LOGGER = logging.getLogger(__name__)
+
+_BATCH_OPTIONS = (
+    "delete",
+    "stream",
+    "jobs",
+    "state",
+    "incremental",
+    "fsync",
+    "max_delete",
+    "max_delete_fraction",
+    "delete_batch_size",
+    "delete_interval",
+    "progress",
+    "progress_interval",
+    "layout",
+)
+
+
+@dataclasses.dataclass
+class _BatchEntry:
+    input_path: pathlib.Path
+    output_dir_path: pathlib.Path
+    options: dict[str, typing.Any]
+
+
+def _load_batch_manifest(
+    manifest_path: pathlib.Path, defaults: dict[str, typing.Any]
+) -> list[_BatchEntry]:
+    # > [[calendars]]
+    # > input = "work.ics"
+    # > output_dir = "calendars/work"
+    # > delete = true
+    # or {"calendars": [{"input": "work.ics", "output_dir": …, "delete": true}]}
+    with manifest_path.open("rb") as manifest_file:
+        if manifest_path.suffix == ".toml":
+            # pylint: disable=import-outside-toplevel
+            try:
+                if sys.version_info >= (3, 11):
+                    import tomllib
+                else:  # pragma: no cover
+                    import tomli as tomllib
+            except ImportError as exc:
+                raise ValueError(
+                    f"{manifest_path}: TOML requires python>=3.11 or tomli"
+                ) from exc
+            manifest = tomllib.load(manifest_file)
+        else:
+            manifest = json.load(manifest_file)
+    entries = []
+    for calendar in manifest["calendars"]:
+        unknown_keys = set(calendar.keys()) - {"input", "output_dir", *_BATCH_OPTIONS}
+        if unknown_keys:
+            raise ValueError(
+                f"{manifest_path}: unknown keys {', '.join(sorted(unknown_keys))}"
+            )
+        entries.append(
+            _BatchEntry(
+                # relative to manifest
+                input_path=manifest_path.parent.joinpath(calendar["input"]),
+                output_dir_path=manifest_path.parent.joinpath(calendar["output_dir"]),
+                options={
+                    key: calendar.get(key, defaults.get(key))
+                    for key in _BATCH_OPTIONS
+                    if key in calendar or key in defaults
+                },
+            )
+        )
+    return entries
+
+
+def _sync_batch_entry(entry: _BatchEntry) -> dict[str, typing.Any]:
+    summary: dict[str, typing.Any] = {
+        "input": str(entry.input_path),
+        "output_dir": str(entry.output_dir_path),
+    }
+    try:
+        with entry.input_path.open("rb") as input_file:
+            result = ical2vdir.sync(
+                input_file,
+                entry.output_dir_path,
+                collect_paths=False,
+                **entry.options,
+            )
+    except Exception as exc:  # pylint: disable=broad-exception-caught
+        _LOGGER.error(
+            "failed to sync %s to %s: %s", entry.input_path, entry.output_dir_path, exc
+        )
+        summary["error"] = str(exc) or type(exc).__name__
+        return summary
+    summary.update(
+        {
+            "created": result.stats["created"],
+            "updated": result.stats["updated"],
+            "unchanged": result.stats["unchanged"],
+            "removed": result.stats["removed"],
+            "seconds": result.stats["seconds"]["total"],
+            "error": None,
+        }
+    )
+    return summary
+
+
+def _init_batch_worker(log_level: int) -> None:
+    logging.basicConfig(format="%(message)s")
+    logging.getLogger().setLevel(log_level)
+
+
+def _sync_batch(
+    entries: list[_BatchEntry], jobs: int, log_level: int
+) -> list[dict[str, typing.Any]]:
+    # returns one summary per entry, in manifest order
+    if jobs <= 1:
+        return [_sync_batch_entry(entry) for entry in entries]
+    # processes avoid contention on the global interpreter lock
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=jobs, initializer=_init_batch_worker, initargs=(log_level,)
+    ) as executor:
+        return list(executor.map(_sync_batch_entry, entries))
+
+
+def _main_batch(
+    manifest_path: pathlib.Path, defaults: dict[str, typing.Any], jobs: int
+) -> None:
+    # prints a JSON summary, fails if syncing any of the calendars failed
+    summaries = _sync_batch(
+        _load_batch_manifest(manifest_path, defaults=defaults),
+        jobs=jobs,
+        log_level=logging.getLogger().level,
+    )
+    json.dump(summaries, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+    if any(s["error"] for s in summaries):
+        sys.exit(1)
@@ -0,0 +1,370 @@
+# ical2vdir - convert .ics file to vdir directory
+#
+# Copyright (C) 2020 Fabian Peter Hammerle <fabian@hammerle.me>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+import pathlib
+import sys
+import typing
+
+import ical2vdir
+from ical2vdir._common import (
+    _FSYNC_MODES,
+    _FSYNC_NEVER,
+    _STATE_FILENAME,
+    DeleteLimitExceeded,
+    SyncResult,
+)
+from ical2vdir._layout import _LAYOUT_FLAT, _LAYOUTS, _SHARDS_DIRNAME
+from ical2vdir._progress import _PROGRESS_ITEMS, _PROGRESS_MODES
+from ical2vdir._stats import _print_stats
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def _parse_args() -> argparse.Namespace:
+    argparser = argparse.ArgumentParser(
+        description="Convert iCalendar .ics file to vdir directory."
+        " Reads from stdin unless --input is given."
+    )
+    input_argument_group = argparser.add_mutually_exclusive_group()
+    input_argument_group.add_argument(
+        "-i",
+        "--input",
+        type=pathlib.Path,
+        action="append",
+        metavar="path",
+        dest="input_paths",
+        help="Path to .ics file to memory-map instead of reading stdin."
+        " May be repeated to sync multiple files into the output directory.",
+    )
+    input_argument_group.add_argument(
+        "--url",
+        help="Download calendar from URL instead of reading stdin."
+        " Stores ETag & Last-Modified of the response in the output directory"
+        " and skips the sync if the server responds 304 Not Modified.",
+    )
+    input_argument_group.add_argument(
+        "--apply",
+        type=pathlib.Path,
+        metavar="plan",
+        dest="apply_plan_path",
+        help="Apply JSON change plan created by --dry-run instead of reading"
+        " input. Fails without changing any item if any of the planned items"
+        " was modified since.",
+    )
+    input_argument_group.add_argument(
+        "--export",
+        action="store_true",
+        help="Write all items of the output directory to stdout as a single"
+        " VCALENDAR instead of syncing (VTIMEZONE components deduplicated by TZID)."
+        " Up to --jobs items are read concurrently. If all items are in the index"
+        " (see --state) & unchanged, the export is cached in the output directory.",
+    )
+    argparser.add_argument(
+        "-o",
+        "--output",
+        "--output-dir",
+        default=os.getcwd(),
+        type=pathlib.Path,
+        metavar="path",
+        dest="output_dir_path",
+        help="Path to output directory (default: current workings dir)",
+    )
+    argparser.add_argument(
+        "--delete",
+        action="store_true",
+        help="Delete events not in input from output directory"
+        " (after all events in input were synced).",
+    )
+    argparser.add_argument(
+        "--max-delete",
+        type=int,
+        metavar="N",
+        help="With --delete: abort without removing any item"
+        " if more than N items would be removed.",
+    )
+    argparser.add_argument(
+        "--max-delete-fraction",
+        type=float,
+        metavar="FRACTION",
+        help="With --delete: abort without removing any item if more than"
+        " FRACTION (e.g. 0.1) of the pre-existing items would be removed.",
+    )
+    argparser.add_argument(
+        "--delete-batch-size",
+        type=int,
+        metavar="N",
+        help="With --delete: pause for --delete-interval after removing N items.",
+    )
+    argparser.add_argument(
+        "--delete-interval",
+        type=float,
+        default=0.0,
+        metavar="SECONDS",
+        help="Pause between batches of --delete-batch-size removals"
+        " (e.g. to reduce load of network filesystems, default: 0).",
+    )
+    argparser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Compare input with output directory without writing or removing"
+        " items. Prints a JSON change plan of items to be created, updated"
+        " & removed to stdout (see --apply).",
+    )
+    argparser.add_argument(
+        "-s",
+        "--silent",
+        "-q",
+        "--quiet",
+        action="store_true",
+        help="Reduce verbosity.",
+    )
+    argparser.add_argument(
+        "-v",
+        "--verbose",
+        action="store_true",
+        help="Increase verbosity",
+    )
+    argparser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Sync each event as soon as it was read from stdin"
+        " instead of parsing the entire calendar first."
+        " Memory usage is bounded by the largest single event.",
+    )
+    argparser.add_argument(
+        "--state",
+        action="store_true",
+        help=f"Keep an index of synced items in {_STATE_FILENAME} in the output"
+        " directory. Items unchanged in input and output since the last run"
+        " are skipped without reading them."
+        " Runs with input identical to the last run finish without parsing.",
+    )
+    argparser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Implies --state. Additionally index a digest of each input"
+        " component (by UID & RECURRENCE-ID) and skip parsing components"
+        " unchanged since the last run (ignoring DTSTAMP).",
+    )
+    argparser.add_argument(
+        "--layout",
+        choices=_LAYOUTS,
+        default=_LAYOUT_FLAT,
+        help="flat: write items to output directory (default)."
+        " sharded: write items to 256 subdirectories of"
+        f" {_SHARDS_DIRNAME} & symlink them from output directory"
+        " (for vdir readers). With --state & --delete, only subdirectories"
+        " modified since the last run are listed.",
+    )
+    argparser.add_argument(
+        "--fsync",
+        choices=_FSYNC_MODES,
+        default=_FSYNC_NEVER,
+        help="never: leave flushing to the operating system (default)."
+        " batch: fsync all written items & the output directory once at the end."
+        " always: fsync each item before replacing the previous version.",
+    )
+    argparser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        metavar="N",
+        help="Number of events to sync concurrently,"
+        " e.g. to hide latency of network filesystems (default: 1)."
+        " Log messages stay in input order.",
+    )
+    argparser.add_argument(
+        "--progress",
+        choices=_PROGRESS_MODES,
+        default=_PROGRESS_ITEMS,
+        help="items: log each created & updated item (default)."
+        " counter: log number of created, updated, unchanged, removed"
+        " & skipped components every --progress-interval seconds & at the end."
+        " none: log neither (see --stats).",
+    )
+    argparser.add_argument(
+        "--progress-interval",
+        type=float,
+        default=10.0,
+        metavar="SECONDS",
+        help="Interval of --progress counter (default: 10).",
+    )
+    argparser.add_argument(
+        "--event-log",
+        type=pathlib.Path,
+        metavar="path",
+        dest="event_log_path",
+        help="Append one JSON object per created, updated & removed item"
+        ' ({"action": "created", "path": …}) to file.',
+    )
+    argparser.add_argument(
+        "--watch",
+        action="store_true",
+        help="Keep running & sync again whenever an --input file was changed"
+        " (inotify, polling if unavailable). Implies --incremental."
+        " The listing of the output directory is kept in memory"
+        " (updated on changes by other processes).",
+    )
+    argparser.add_argument(
+        "--watch-debounce",
+        type=float,
+        default=1.0,
+        metavar="SECONDS",
+        help="With --watch: sync after input files were left unchanged"
+        " for SECONDS (default: 1).",
+    )
+    argparser.add_argument(
+        "--watch-poll-interval",
+        type=float,
+        default=2.0,
+        metavar="SECONDS",
+        help="With --watch: interval of checking input files"
+        " if inotify is unavailable (default: 2).",
+    )
+    argparser.add_argument(
+        "--stats",
+        nargs="?",
+        choices=("text", "json"),
+        const="text",
+        help="Report time spent per phase, number of created, updated, unchanged,"
+        " removed, skipped & duplicate components and bytes read & written."
+        " text: to stderr (default), json: to stdout",
+    )
+    argparser.add_argument(
+        "--batch",
+        type=pathlib.Path,
+        metavar="manifest",
+        dest="batch_manifest_path",
+        help="Sync multiple .ics files listed in a JSON or TOML manifest"
+        " (see README) instead of stdin. Up to --jobs calendars are synced"
+        " concurrently in separate processes. Prints a JSON summary."
+        " Fails if syncing any of the calendars failed.",
+    )
+    args = argparser.parse_args()
+    if args.jobs < 1:
+        argparser.error("--jobs must be at least 1")
+    if args.delete_batch_size is not None and args.delete_batch_size < 1:
+        argparser.error("--delete-batch-size must be at least 1")
+    if args.batch_manifest_path and args.event_log_path:
+        argparser.error("--event-log is not supported with --batch")
+    if args.dry_run and (args.batch_manifest_path or args.apply_plan_path):
+        argparser.error("--dry-run is not supported with --batch & --apply")
+    if args.watch and not args.input_paths:
+        argparser.error("--watch requires --input")
+    if args.watch and args.dry_run:
+        argparser.error("--dry-run is not supported with --watch")
+    if args.export and (args.batch_manifest_path or args.delete or args.dry_run):
+        argparser.error("--export does not support --batch, --delete & --dry-run")
+    if args.dry_run and args.stats == "json":
+        argparser.error("--dry-run prints the plan to stdout, use --stats text")
+    return args
+
+
+def _main() -> None:
+    # https://docs.python.org/3/library/logging.html#levels
+    logging.basicConfig(
+        format="%(message)s",
+        # datefmt='%Y-%m-%dT%H:%M:%S%z',
+        level=logging.INFO,
+    )
+    args = _parse_args()
+    if args.verbose:
+        logging.getLogger().setLevel(level=logging.DEBUG)
+    elif args.silent:
+        logging.getLogger().setLevel(level=logging.WARNING)
+    sync_kwargs: dict[str, typing.Any] = {
+        "delete": args.delete,
+        "stream": args.stream,
+        "jobs": args.jobs,
+        "state": args.state,
+        "incremental": args.incremental,
+        "fsync": args.fsync,
+        "max_delete": args.max_delete,
+        "max_delete_fraction": args.max_delete_fraction,
+        "delete_batch_size": args.delete_batch_size,
+        "delete_interval": args.delete_interval,
+        "progress": args.progress,
+        "progress_interval": args.progress_interval,
+        "event_log": args.event_log_path,
+        # path lists of result are not reported
+        "collect_paths": False,
+        "dry_run": args.dry_run,
+        "layout": args.layout,
+    }
+    if args.batch_manifest_path:
+        # pylint: disable=import-outside-toplevel
+        from ical2vdir._batch import _main_batch
+
+        # --jobs: number of calendars synced concurrently
+        _main_batch(
+            args.batch_manifest_path,
+            defaults={k: v for k, v in sync_kwargs.items() if k != "jobs"},
+            jobs=args.jobs,
+        )
+        return
+    if args.export:
+        # pylint: disable=import-outside-toplevel
+        from ical2vdir._export import _main_export
+
+        _main_export(args.output_dir_path, jobs=args.jobs)
+        return
+    if args.watch:
+        # pylint: disable=import-outside-toplevel
+        from ical2vdir._watch import _main_watch
+
+        _main_watch(args, sync_kwargs)
+        return
+    if args.apply_plan_path:
+        # pylint: disable=import-outside-toplevel
+        from ical2vdir._plan import _main_apply
+
+        result = _main_apply(args.apply_plan_path, fsync=args.fsync)
+    else:
+        result = _main_sync(args, sync_kwargs)
+    if args.dry_run:
+        json.dump(result.plan, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    if args.stats:
+        _print_stats(result.stats, args.stats)
+
+
+def _main_sync(
+    args: argparse.Namespace, sync_kwargs: dict[str, typing.Any]
+) -> SyncResult:
+    try:
+        if args.url:
+            # pylint: disable=import-outside-toplevel
+            from ical2vdir._http import _sync_url
+
+            return _sync_url(args.url, args.output_dir_path, **sync_kwargs)
+        return ical2vdir.sync(
+            args.input_paths
+            # tests replace sys.stdin with binary file objects
+            or typing.cast(typing.BinaryIO, getattr(sys.stdin, "buffer", sys.stdin)),
+            args.output_dir_path,
+            **sync_kwargs,
+        )
+    except DeleteLimitExceeded as exc:
+        _LOGGER.error("%s", exc)
+        sys.exit(1)
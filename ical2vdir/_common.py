@@ -0,0 +1,284 @@
+# ical2vdir - convert .ics file to vdir directory
+#
+# Copyright (C) 2020 Fabian Peter Hammerle <fabian@hammerle.me>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Shared by sync() & the modules implementing its options:
+# vdir item names, atomic writes, state of a run & the index (see --state).
+
+from __future__ import annotations
+
+import contextlib
+import dataclasses
+import datetime
+import json
+import logging
+import os
+import pathlib
+import tempfile
+import typing
+
+from ical2vdir._layout import _LAYOUT_FLAT
+from ical2vdir._progress import _ProgressReporter
+from ical2vdir._stats import _Stats
+
+if typing.TYPE_CHECKING:  # pragma: no cover
+    import icalendar
+
+    from ical2vdir._layout import _Scan
+    from ical2vdir._plan import _Plan
+    from ical2vdir._watch import _SyncCache
+
+_LOGGER = logging.getLogger(__name__)
+
+_VDIR_EVENT_FILE_EXTENSION = ".ics"
+
+# > Metadata files [...] have no file extensions.
+# https://vdirsyncer.readthedocs.io/en/stable/vdir.html#metadata
+_STATE_FILENAME = ".ical2vdir-state"
+_STATE_VERSION = 1
+
+_State = dict[str, dict[str, typing.Any]]
+
+_FSYNC_NEVER = "never"
+_FSYNC_BATCH = "batch"
+_FSYNC_ALWAYS = "always"
+_FSYNC_MODES = (_FSYNC_NEVER, _FSYNC_BATCH, _FSYNC_ALWAYS)
+
+
+def _datetime_basic_isoformat(dt_obj: datetime.datetime) -> str:
+    # .isoformat() inserts unwanted separators
+    return dt_obj.strftime("%Y%m%dT%H%M%S%z")
+
+
+def _event_vdir_filename(event: icalendar.cal.Component) -> str:
+    # > An item should contain a UID property as described by the vCard and iCalendar standards.
+    # > [...] The filename should have similar properties as the UID of the file content.
+    # > However, there is no requirement for these two to be the same.
+    # > Programs may choose to store additional metadata in that filename, [...]
+    # https://vdirsyncer.readthedocs.io/en/stable/vdir.html#basic-structure
+    output_filename = str(event["UID"])
+    if "RECURRENCE-ID" in event:
+        recurrence_id = event["RECURRENCE-ID"]
+        if isinstance(recurrence_id.dt, datetime.datetime):
+            output_filename += "." + _datetime_basic_isoformat(recurrence_id.dt)
+        else:
+            assert isinstance(recurrence_id.dt, datetime.date), vars(recurrence_id)
+            output_filename += "." + recurrence_id.dt.strftime("%Y%m%d")
+    return output_filename + _VDIR_EVENT_FILE_EXTENSION
+
+
+class _AtomicWriter:
+
+    # > Creating and modifying items or metadata files should happen atomically.
+    # https://vdirsyncer.readthedocs.io/en/stable/vdir.html#writing-to-vdirs
+    # Temporary files are created in the target directory
+    # so that os.replace never falls back to copying across filesystems.
+
+    def __init__(self, fsync: str = _FSYNC_NEVER) -> None:
+        assert fsync in _FSYNC_MODES, fsync
+        self._fsync = fsync
+        self._unsynced_paths: list[pathlib.Path] = []
+        self._unsynced_dir_paths: set[pathlib.Path] = set()
+
+    def write(self, data: bytes, path: pathlib.Path) -> os.stat_result:
+        # returns stat of written file (preserved by os.replace)
+        # hidden & without .ics extension to be ignored by vdir readers
+        temp_fd, temp_path = tempfile.mkstemp(
+            prefix=".ical2vdir-", suffix=".tmp", dir=path.parent
+        )
+        try:
+            with os.fdopen(temp_fd, "wb") as temp_file:
+                temp_file.write(data)
+                temp_file.flush()
+                if self._fsync == _FSYNC_ALWAYS:
+                    os.fsync(temp_file.fileno())
+                stat = os.fstat(temp_file.fileno())
+            # raises IsADirectoryError if path is a directory
+            os.replace(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+        if self._fsync == _FSYNC_BATCH:
+            self._unsynced_paths.append(path)
+        if self._fsync != _FSYNC_NEVER:
+            self._unsynced_dir_paths.add(path.parent)
+        return stat
+
+    def mkdir(self, path: pathlib.Path) -> None:
+        # including parents, no-op if path exists
+        try:
+            path.mkdir()
+        except FileExistsError:
+            return
+        except FileNotFoundError:
+            self.mkdir(path.parent)
+            try:
+                path.mkdir()
+            except FileExistsError:  # created concurrently, e.g. with --jobs
+                return
+        if self._fsync != _FSYNC_NEVER:
+            self._unsynced_dir_paths.add(path.parent)
+
+    def symlink(self, target: str, path: pathlib.Path) -> bool:
+        # replaces pre-existing file at path, False if already linked
+        with contextlib.suppress(OSError):  # missing or not a symlink
+            if os.readlink(path) == target:
+                return False
+        temp_path = path.parent.joinpath(f".ical2vdir-{os.urandom(8).hex()}.tmp")
+        os.symlink(target, temp_path)
+        os.replace(temp_path, path)
+        if self._fsync != _FSYNC_NEVER:
+            self._unsynced_dir_paths.add(path.parent)
+        return True
+
+    def flush(self) -> None:
+        # one fsync per directory persists all renames within
+        for path in self._unsynced_paths + sorted(self._unsynced_dir_paths):
+            fd = os.open(path, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        self._unsynced_paths.clear()
+        self._unsynced_dir_paths.clear()
+
+
+@dataclasses.dataclass
+class SyncResult:
+    """
+    Paths of items created, updated, left unchanged & removed by sync().
+    """
+
+    created: list[pathlib.Path] = dataclasses.field(default_factory=list)
+    updated: list[pathlib.Path] = dataclasses.field(default_factory=list)
+    unchanged: list[pathlib.Path] = dataclasses.field(default_factory=list)
+    removed: list[pathlib.Path] = dataclasses.field(default_factory=list)
+    # see --stats
+    stats: dict[str, typing.Any] = dataclasses.field(default_factory=dict)
+    # JSON change plan computed by sync(dry_run=True), see --apply
+    plan: dict[str, typing.Any] | None = None
+
+
+class DeleteLimitExceeded(Exception):
+    """
+    Raised by sync() instead of removing more items than allowed
+    by max_delete or max_delete_fraction.
+    """
+
+
+@dataclasses.dataclass
+class _SyncContext:  # pylint: disable=too-many-instance-attributes
+    # shared by all events synced within one run
+    state: _State | None = None
+    writer: _AtomicWriter = dataclasses.field(default_factory=_AtomicWriter)
+    stats: _Stats = dataclasses.field(default_factory=_Stats)
+    result: SyncResult = dataclasses.field(default_factory=SyncResult)
+    # output directory, None to access filesystem directly
+    scan: _Scan | None = None
+    # see --layout
+    layout: str = _LAYOUT_FLAT
+    progress: _ProgressReporter = dataclasses.field(default_factory=_ProgressReporter)
+    # False: keep path lists of result empty (see sync())
+    collect_paths: bool = True
+    # names of items created, updated or left unchanged (for --delete & --state)
+    synced_filenames: set[str] = dataclasses.field(default_factory=set)
+    # --dry-run: record changes instead of writing & removing items
+    plan: _Plan | None = None
+
+    def record(self, action: str, path: pathlib.Path) -> None:
+        if action != "removed":
+            self.synced_filenames.add(path.name)
+        if self.collect_paths:
+            getattr(self.result, action).append(path)
+        self.progress.item(action, path, self.stats)
+
+
+def _read_state_file(
+    output_dir_path: pathlib.Path, cache: _SyncCache | None = None
+) -> dict[str, typing.Any]:
+    state_path = output_dir_path.joinpath(_STATE_FILENAME)
+    cached_state_file = None if cache is None else cache.pop_state_file()
+    if cached_state_file is not None:
+        return cached_state_file
+    try:
+        with state_path.open("rb") as state_file:
+            state = json.load(state_file)
+    except FileNotFoundError:
+        return {}
+    except ValueError as exc:
+        _LOGGER.warning("ignoring invalid index %s: %s", state_path, exc)
+        return {}
+    if not isinstance(state, dict) or state.get("version") != _STATE_VERSION:
+        _LOGGER.warning("ignoring index %s of unsupported version", state_path)
+        return {}
+    return state
+
+
+def _save_state(
+    state: _State,
+    output_dir_path: pathlib.Path,
+    writer: _AtomicWriter | None = None,
+    metadata: dict[str, typing.Any] | None = None,
+) -> dict[str, typing.Any]:
+    # returns saved index
+    state_file = {"version": _STATE_VERSION, "items": state, **(metadata or {})}
+    (writer or _AtomicWriter()).write(
+        json.dumps(state_file, separators=(",", ":"), sort_keys=True).encode(),
+        output_dir_path.joinpath(_STATE_FILENAME),
+    )
+    return state_file
+
+
+def _state_entry(
+    event: icalendar.cal.Component, digest: str, stat: os.stat_result
+) -> dict[str, typing.Any]:
+    return {
+        "uid": str(event["UID"]),
+        "recurrence_id": (
+            event["RECURRENCE-ID"].to_ical().decode()
+            if "RECURRENCE-ID" in event
+            else None
+        ),
+        "digest": digest,
+        "mtime_ns": stat.st_mtime_ns,
+        "size": stat.st_size,
+    }
+
+
+def _state_entry_matches(
+    entry: dict[str, typing.Any] | None, digest: str, stat: os.stat_result | None
+) -> bool:
+    if entry is None or entry["digest"] != digest or stat is None:
+        return False
+    # detects external modifications
+    return bool(stat.st_mtime_ns == entry["mtime_ns"] and stat.st_size == entry["size"])
+
+
+def _is_event(component: icalendar.cal.Component) -> bool:
+    import icalendar  # pylint: disable=import-outside-toplevel
+
+    return isinstance(component, (icalendar.cal.Event, icalendar.cal.Todo))
+
+
+_T = typing.TypeVar("_T")
+
+
+def _drain(items: list[_T]) -> typing.Iterator[_T]:
+    # yields & drops items in order,
+    # so that each can be garbage collected as soon as it was consumed
+    items.reverse()
+    while items:
+        yield items.pop()
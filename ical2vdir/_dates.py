@@ -0,0 +1,115 @@
+# ical2vdir - convert .ics file to vdir directory
+#
+# Copyright (C) 2020 Fabian Peter Hammerle <fabian@hammerle.me>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# icalendar parses each DTSTART, DTEND, RECURRENCE-ID, EXDATE, … value
+# separately. Large calendars repeat the same values
+# (e.g. EXDATEs of recurring events) many times.
+
+from __future__ import annotations
+
+import contextlib
+import datetime
+import threading
+import typing
+
+# distinct values & TZIDs kept per run (cleared when exceeded)
+_MEMO_MAXSIZE = 2**16
+
+
+def _time_zone_known(value: typing.Any) -> bool:
+    # icalendar returns naive date-times for TZIDs not (yet) defined.
+    # periods are tuples.
+    return not any(
+        isinstance(v, datetime.datetime) and v.tzinfo is None
+        for v in (value if isinstance(value, tuple) else (value,))
+    )
+
+
+class _DateParsingMemo:
+
+    # Replaces icalendar.prop.vDDDTypes.from_ical with a memoized version
+    # while at least one sync is running (potentially in multiple threads).
+    # Other threads (e.g. of library users parsing concurrently) call the
+    # original method.
+    # Values with TZID are memoized once their time zone is known:
+    # icalendar resolves a TZID to the same time zone for the rest of the
+    # process (known zones & the first VTIMEZONE with that TZID take
+    # precedence), but a VTIMEZONE might be defined after the first value
+    # referencing it.
+
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._users = 0
+        self._original_from_ical: typing.Any = None
+        self._thread_users = threading.local()
+
+    def _active(self) -> bool:
+        return bool(getattr(self._thread_users, "count", 0))
+
+    def _install(self) -> None:
+        import icalendar  # pylint: disable=import-outside-toplevel
+
+        self._original_from_ical = vars(icalendar.prop.vDDDTypes)["from_ical"]
+        parse = icalendar.prop.vDDDTypes.from_ical
+        memo: dict[tuple[str, str | None], typing.Any] = {}
+
+        def from_ical(ical: typing.Any, timezone: typing.Any = None) -> typing.Any:
+            if (
+                not isinstance(ical, str)
+                or not isinstance(timezone, (str, type(None)))
+                or not self._active()
+            ):
+                return parse(ical, timezone=timezone)
+            key = (ical, timezone)
+            with contextlib.suppress(KeyError):
+                return memo[key]
+            value = parse(ical, timezone=timezone)
+            # results (date, datetime, time, timedelta or tuple) are immutable
+            if timezone is None or _time_zone_known(value):
+                if len(memo) >= _MEMO_MAXSIZE:
+                    memo.clear()
+                memo[key] = value
+            return value
+
+        icalendar.prop.vDDDTypes.from_ical = staticmethod(from_ical)
+
+    def _uninstall(self) -> None:
+        import icalendar  # pylint: disable=import-outside-toplevel
+
+        icalendar.prop.vDDDTypes.from_ical = self._original_from_ical
+        self._original_from_ical = None
+
+    @contextlib.contextmanager
+    def __call__(self) -> typing.Iterator[None]:
+        with self._lock:
+            if not self._users:
+                self._install()
+            self._users += 1
+        self._thread_users.count = getattr(self._thread_users, "count", 0) + 1
+        try:
+            yield
+        finally:
+            self._thread_users.count -= 1
+            with self._lock:
+                self._users -= 1
+                if not self._users:
+                    self._uninstall()
+
+
+_memoized_date_parsing = _DateParsingMemo()
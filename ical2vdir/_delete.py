@@ -0,0 +1,92 @@
+# ical2vdir - convert .ics file to vdir directory
+#
+# Copyright (C) 2020 Fabian Peter Hammerle <fabian@hammerle.me>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from __future__ import annotations
+
+import dataclasses
+import logging
+import pathlib
+import time
+import typing
+
+from ical2vdir._common import DeleteLimitExceeded, _SyncContext
+from ical2vdir._layout import _remove_item
+from ical2vdir._scan import _item_stat
+
+_LOGGER = logging.getLogger(__name__)
+
+
+@dataclasses.dataclass
+class _DeletePolicy:
+    # limits on items removed by --delete (None: unlimited)
+    max_count: int | None = None
+    # relative to number of pre-existing items
+    max_fraction: float | None = None
+    # unlink up to batch_size items, then pause for batch_interval seconds
+    batch_size: int | None = None
+    batch_interval: float = 0.0
+
+    def check(self, delete_count: int, existing_count: int) -> None:
+        # a truncated input (e.g. error page instead of calendar)
+        # must not wipe the output directory
+        if self.max_count is not None and delete_count > self.max_count:
+            raise DeleteLimitExceeded(
+                f"refusing to remove {delete_count} of {existing_count} items"
+                f" (limit: {self.max_count} items)"
+            )
+        if (
+            self.max_fraction is not None
+            and delete_count > self.max_fraction * existing_count
+        ):
+            raise DeleteLimitExceeded(
+                f"refusing to remove {delete_count} of {existing_count} items"
+                f" (limit: {self.max_fraction:.0%})"
+            )
+
+    def delete_items(
+        self,
+        paths: typing.Collection[pathlib.Path],
+        existing_count: int,
+        context: _SyncContext,
+    ) -> None:
+        # separate phase after all input components were synced:
+        # nothing is removed if the limits are exceeded
+        self.check(len(paths), existing_count)
+        for index, path in enumerate(sorted(paths)):
+            if context.plan is not None:
+                context.plan.add(
+                    "removed",
+                    path,
+                    None,
+                    _item_stat(path, context.scan)
+                    # regular file left by --layout flat
+                    or _item_stat(path, None),
+                )
+            else:
+                if index and self.batch_size and index % self.batch_size == 0:
+                    time.sleep(self.batch_interval)
+                _remove_item(path, context.layout)
+                if context.scan is not None:
+                    context.scan.removed(path.name)
+            context.stats.count("removed")
+            context.record("removed", path)
+        if paths:
+            _LOGGER.info(
+                "%s %d items not in input",
+                "removed" if context.plan is None else "would remove",
+                len(paths),
+            )
@@ -0,0 +1,110 @@
+# ical2vdir - convert .ics file to vdir directory
+#
+# Copyright (C) 2020 Fabian Peter Hammerle <fabian@hammerle.me>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from __future__ import annotations
+
+import datetime
+import logging
+import typing
+
+from ical2vdir._common import _drain, _event_vdir_filename, _is_event, _SyncContext
+
+if typing.TYPE_CHECKING:  # pragma: no cover
+    import icalendar
+
+_LOGGER = logging.getLogger(__name__)
+
+# Input may contain multiple components mapping to the same item
+# (equal UID & RECURRENCE-ID, e.g. in Exchange exports).
+# The component with the highest SEQUENCE, then LAST-MODIFIED wins,
+# the last one in input if both are equal.
+
+
+def _precedence(component: icalendar.cal.Component) -> tuple[int, float]:
+    last_modified = component.get("LAST-MODIFIED")
+    timestamp = float("-inf")
+    if last_modified is not None and isinstance(last_modified.dt, datetime.datetime):
+        # > The value MUST be specified in the UTC time format.
+        # https://tools.ietf.org/html/rfc5545#section-3.8.7.3
+        timestamp = (
+            last_modified.dt.replace(tzinfo=datetime.timezone.utc)
+            if last_modified.dt.tzinfo is None
+            else last_modified.dt
+        ).timestamp()
+    return int(component.get("SEQUENCE", 0)), timestamp
+
+
+def _resolve_duplicates(
+    components: list[icalendar.cal.Component], context: _SyncContext
+) -> typing.Iterator[icalendar.cal.Component]:
+    # pre-pass over entirely parsed input:
+    # yields one component per item (in input order) & drops components
+    # from the list as they are consumed (see _drain)
+    with context.stats.measure("parse_input"):
+        winner_indices: dict[str, int] = {}
+        precedences: dict[str, tuple[int, float]] = {}
+        for index, component in enumerate(components):
+            if not _is_event(component):
+                continue
+            filename = _event_vdir_filename(component)
+            precedence = _precedence(component)
+            if filename in winner_indices:
+                context.stats.count("duplicates")
+                if precedence < precedences[filename]:
+                    continue
+            winner_indices[filename] = index
+            precedences[filename] = precedence
+        del precedences
+        synced_indices = set(winner_indices.values())
+        del winner_indices
+    for index, component in enumerate(_drain(components)):
+        if index in synced_indices or not _is_event(component):
+            yield component
+        else:
+            _LOGGER.debug("ignoring superseded %s", component)
+
+
+_DEFAULT_PRECEDENCE = (0, float("-inf"))
+
+
+def _filter_superseded(
+    components: typing.Iterable[icalendar.cal.Component],
+    context: _SyncContext,
+) -> typing.Iterator[icalendar.cal.Component]:
+    # streamed input: compares components with those yielded before,
+    # independent of when they are synced (concurrently with --jobs).
+    # names are recorded in context.synced_filenames once yielded,
+    # precedences only if SEQUENCE or LAST-MODIFIED is set.
+    precedences: dict[str, tuple[int, float]] = {}
+    for component in components:
+        if _is_event(component):
+            filename = _event_vdir_filename(component)
+            precedence = _precedence(component)
+            if filename in context.synced_filenames:
+                context.stats.count("duplicates")
+                if precedence < precedences.get(filename, _DEFAULT_PRECEDENCE):
+                    _LOGGER.debug("ignoring superseded %s", component)
+                    continue
+            if precedence == _DEFAULT_PRECEDENCE:
+                precedences.pop(filename, None)
+            else:
+                precedences[filename] = precedence
+            yield component
+            # resumed after synced or, with --jobs, submitted
+            context.synced_filenames.add(filename)
+        else:
+            yield component
@@ -0,0 +1,248 @@
+# ical2vdir - convert .ics file to vdir directory
+#
+# Copyright (C) 2020 Fabian Peter Hammerle <fabian@hammerle.me>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Concatenates the items of a vdir into a single VCALENDAR (see --export).
+
+from __future__ import annotations
+
+import collections
+import concurrent.futures
+import contextlib
+import hashlib
+import logging
+import os
+import pathlib
+import re
+import shutil
+import sys
+import tempfile
+import typing
+
+from ical2vdir._common import (
+    _VDIR_EVENT_FILE_EXTENSION,
+    _read_state_file,
+    _state_entry_matches,
+)
+from ical2vdir._input import (
+    _BOUNDARY_LINE_PATTERN,
+    _iter_mapped_component_icals,
+    _map_file,
+)
+from ical2vdir._scan import _DirectoryScan
+
+_LOGGER = logging.getLogger(__name__)
+
+_CALENDAR_HEADER = b"BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:-//ical2vdir//EN\r\n"
+_CALENDAR_FOOTER = b"END:VCALENDAR\r\n"
+# hidden & without .ics extension, ignored by --delete & vdir readers
+_CACHE_FILENAME_PREFIX = ".ical2vdir-export-"
+# first TZID line of VTIMEZONE (STANDARD & DAYLIGHT have no TZID)
+_TZID_PATTERN = re.compile(
+    rb"^TZID(?:;[^:\r\n]*)?:([^\r\n]*)", flags=re.MULTILINE | re.IGNORECASE
+)
+# TZID parameter of (unfolded) content line, e.g. DTSTART;TZID=Europe/Vienna:…
+_TZID_PARAMETER_PATTERN = re.compile(
+    rb'^[^:;\r\n]+(?:;(?:[^;:"\r\n]|"[^"\r\n]*")*)*?;TZID=("[^"\r\n]*"|[^;:,\r\n]*)',
+    flags=re.MULTILINE | re.IGNORECASE,
+)
+_FOLD_PATTERN = re.compile(rb"\r?\n[ \t]")
+
+
+def _read_item(path: pathlib.Path) -> list[bytes]:
+    # components of item, empty if removed since listed.
+    # items written by ical2vdir contain a single component,
+    # items written by other tools (e.g. vdirsyncer) a VCALENDAR.
+    try:
+        with path.open("rb") as item_file, _map_file(item_file) as mapped:
+            match = _BOUNDARY_LINE_PATTERN.search(mapped)
+            if match is None:
+                _LOGGER.warning("ignoring item %s without component", path)
+                return []
+            if match.group(0).split(b":", 1)[1].strip().upper() == b"VCALENDAR":
+                return list(_iter_mapped_component_icals(mapped))
+            item_ical = mapped[:]
+    except FileNotFoundError:
+        _LOGGER.debug("%s was removed since listed", path)
+        return []
+    except ValueError as exc:
+        _LOGGER.warning("ignoring invalid item %s: %s", path, exc)
+        return []
+    return [item_ical if item_ical.endswith(b"\n") else item_ical + b"\r\n"]
+
+
+def _iter_items_component_icals(
+    paths: typing.Iterable[pathlib.Path], jobs: int
+) -> typing.Iterator[list[bytes]]:
+    # in order of paths.
+    # at most 2 items per job are kept in memory.
+    if jobs == 1:
+        yield from map(_read_item, paths)
+        return
+    pending: collections.deque[concurrent.futures.Future[list[bytes]]]
+    pending = collections.deque()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+        for path in paths:
+            pending.append(executor.submit(_read_item, path))
+            if len(pending) > jobs * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def _referenced_timezone_ids(component_ical: bytes) -> set[bytes]:
+    return {
+        match.group(1).strip(b'"')
+        for match in _TZID_PARAMETER_PATTERN.finditer(
+            _FOLD_PATTERN.sub(b"", component_ical)
+        )
+    }
+
+
+def _generate_timezone_icals(timezone_ids: typing.Iterable[bytes]) -> list[bytes]:
+    # RFC 5545 section 3.6.5 requires a VTIMEZONE for each referenced TZID.
+    # items written by ical2vdir contain none.
+    import icalendar  # pylint: disable=import-outside-toplevel
+
+    # icalendar>=6
+    from_tzid = getattr(icalendar.Timezone, "from_tzid", None)
+    timezone_icals = []
+    for timezone_id in sorted(timezone_ids):
+        name = timezone_id.decode(errors="surrogateescape")
+        if from_tzid is None:
+            _LOGGER.warning(
+                "missing VTIMEZONE %s (generating requires icalendar>=6)", name
+            )
+            continue
+        try:
+            timezone_icals.append(from_tzid(name).to_ical())
+        except ValueError as exc:
+            _LOGGER.warning("missing VTIMEZONE %s: %s", name, exc)
+    return timezone_icals
+
+
+def _write_calendar(
+    paths: typing.Iterable[pathlib.Path],
+    outputs: list[typing.BinaryIO],
+    jobs: int,
+) -> None:
+    # VTIMEZONE components with equal TZID are only written once
+    # (RFC 5545 does not require them to precede components referencing them)
+    timezone_ids: set[bytes] = set()
+    referenced_timezone_ids: set[bytes] = set()
+    for output in outputs:
+        output.write(_CALENDAR_HEADER)
+    for component_icals in _iter_items_component_icals(paths, jobs=jobs):
+        for component_ical in component_icals:
+            if component_ical[:15].upper() == b"BEGIN:VTIMEZONE":
+                match = _TZID_PATTERN.search(component_ical)
+                timezone_id = b"" if match is None else match.group(1).strip()
+                if timezone_id in timezone_ids:
+                    continue
+                timezone_ids.add(timezone_id)
+            else:
+                referenced_timezone_ids |= _referenced_timezone_ids(component_ical)
+            for output in outputs:
+                output.write(component_ical)
+    for timezone_ical in _generate_timezone_icals(
+        referenced_timezone_ids - timezone_ids
+    ):
+        for output in outputs:
+            output.write(timezone_ical)
+    for output in outputs:
+        output.write(_CALENDAR_FOOTER)
+
+
+def _cache_key(
+    output_dir_path: pathlib.Path, scan: _DirectoryScan, names: list[str]
+) -> str | None:
+    # None unless all items are in the index (see --state)
+    # & unmodified since indexed
+    items = _read_state_file(output_dir_path).get("items")
+    if not items or items.keys() != set(names):
+        return None
+    digest = hashlib.sha256()
+    for name in names:
+        entry = items[name]
+        if not _state_entry_matches(entry, entry["digest"], scan.stat(name)):
+            return None
+        # size & modification time: DTSTAMP is excluded from digest
+        digest.update(
+            f"{name}\0{entry['digest']}\0{entry['mtime_ns']}\0{entry['size']}\n".encode(
+                errors="surrogateescape"
+            )
+        )
+    return digest.hexdigest()
+
+
+def _export_cached(
+    paths: list[pathlib.Path],
+    output: typing.BinaryIO,
+    jobs: int,
+    cache_path: pathlib.Path,
+) -> None:
+    if cache_path.exists():
+        _LOGGER.debug("items unchanged, copying %s", cache_path)
+        with cache_path.open("rb") as cache_file:
+            shutil.copyfileobj(cache_file, output)
+        return
+    try:
+        temp_fd, temp_path = tempfile.mkstemp(
+            prefix=".ical2vdir-", suffix=".tmp", dir=cache_path.parent
+        )
+    except OSError as exc:  # e.g. read-only output directory
+        _LOGGER.debug("not caching export: %s", exc)
+        _write_calendar(paths, [output], jobs=jobs)
+        return
+    try:
+        with os.fdopen(temp_fd, "wb") as temp_file:
+            _write_calendar(paths, [output, temp_file], jobs=jobs)
+        os.replace(temp_path, cache_path)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(temp_path)
+        raise
+    for stale_path in cache_path.parent.glob(_CACHE_FILENAME_PREFIX + "*"):
+        if stale_path != cache_path:
+            _LOGGER.debug("removing stale %s", stale_path)
+            with contextlib.suppress(FileNotFoundError):
+                stale_path.unlink()
+
+
+def _export(
+    output_dir_path: pathlib.Path, output: typing.BinaryIO, jobs: int = 1
+) -> None:
+    # Writes all items as a single VCALENDAR, sorted by filename.
+    # Memory usage is bounded by the largest items read concurrently.
+    scan = _DirectoryScan(output_dir_path)
+    # symlinks of --layout sharded are followed
+    names = sorted(scan.file_names(_VDIR_EVENT_FILE_EXTENSION))
+    paths = [output_dir_path.joinpath(n) for n in names]
+    cache_key = _cache_key(output_dir_path, scan, names)
+    if cache_key is None:
+        _write_calendar(paths, [output], jobs=jobs)
+    else:
+        _export_cached(
+            paths,
+            output,
+            jobs=jobs,
+            cache_path=output_dir_path.joinpath(_CACHE_FILENAME_PREFIX + cache_key),
+        )
+    output.flush()
+
+
+def _main_export(output_dir_path: pathlib.Path, jobs: int) -> None:
+    _export(output_dir_path, sys.stdout.buffer, jobs=jobs)
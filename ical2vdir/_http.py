@@ -0,0 +1,107 @@
+# ical2vdir - convert .ics file to vdir directory
+#
+# Copyright (C) 2020 Fabian Peter Hammerle <fabian@hammerle.me>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import json
+import logging
+import pathlib
+import typing
+import urllib.error
+import urllib.request
+
+import ical2vdir
+from ical2vdir._common import _FSYNC_NEVER, SyncResult, _AtomicWriter
+from ical2vdir._layout import _LAYOUT_FLAT
+from ical2vdir._plan import _Plan
+from ical2vdir._stats import _Stats
+
+_LOGGER = logging.getLogger(__name__)
+
+# validators (ETag & Last-Modified) of the last synced response
+_VALIDATORS_FILENAME = ".ical2vdir-http"
+
+_TIMEOUT_SECONDS = 60
+
+
+def _load_validators(output_dir_path: pathlib.Path, url: str) -> dict[str, str]:
+    validators_path = output_dir_path.joinpath(_VALIDATORS_FILENAME)
+    try:
+        with validators_path.open("rb") as validators_file:
+            validators = json.load(validators_file)
+    except FileNotFoundError:
+        return {}
+    except ValueError as exc:
+        _LOGGER.warning("ignoring invalid %s: %s", validators_path, exc)
+        return {}
+    if not isinstance(validators, dict) or validators.get("url") != url:
+        return {}
+    return validators
+
+
+def _conditional_request(
+    url: str, validators: dict[str, str]
+) -> urllib.request.Request:
+    # https://www.rfc-editor.org/rfc/rfc9110#section-13.1
+    request = urllib.request.Request(url, headers={"User-Agent": "ical2vdir"})
+    if validators.get("etag"):
+        request.add_header("If-None-Match", validators["etag"])
+    if validators.get("last_modified"):
+        request.add_header("If-Modified-Since", validators["last_modified"])
+    return request
+
+
+def _sync_url(
+    url: str, output_dir_path: pathlib.Path, **sync_kwargs: typing.Any
+) -> SyncResult:
+    # skips sync if server responds "304 Not Modified"
+    request = _conditional_request(url, _load_validators(output_dir_path, url))
+    try:
+        # pylint: disable=consider-using-with; closed below
+        response = urllib.request.urlopen(request, timeout=_TIMEOUT_SECONDS)
+    except urllib.error.HTTPError as exc:
+        if exc.code != 304:
+            raise
+        exc.close()
+        _LOGGER.debug("%s not modified since last run", url)
+        return SyncResult(
+            stats=_Stats().as_dict(),
+            plan=(
+                _Plan(
+                    output_dir_path,
+                    sync_kwargs.get("layout", _LAYOUT_FLAT),
+                ).as_dict()
+                if sync_kwargs.get("dry_run")
+                else None
+            ),
+        )
+    with response:
+        # parse while downloading
+        result = ical2vdir.sync(
+            response, output_dir_path, **{**sync_kwargs, "stream": True}
+        )
+        validators = {
+            "url": url,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+        }
+    if sync_kwargs.get("dry_run"):
+        return result
+    writer = _AtomicWriter(fsync=sync_kwargs.get("fsync", _FSYNC_NEVER))
+    writer.write(
+        json.dumps(validators).encode(), output_dir_path.joinpath(_VALIDATORS_FILENAME)
+    )
+    writer.flush()
+    return result
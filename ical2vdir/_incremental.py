@@ -0,0 +1,128 @@
+# ical2vdir - convert .ics file to vdir directory
+#
+# Copyright (C) 2020 Fabian Peter Hammerle <fabian@hammerle.me>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import pathlib
+import typing
+
+from ical2vdir._common import _event_vdir_filename, _state_entry_matches, _SyncContext
+from ical2vdir._input import _content_line_name, _iter_content_lines
+from ical2vdir._scan import _item_stat
+
+if typing.TYPE_CHECKING:  # pragma: no cover
+    import icalendar
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def _scan_component_ical(ical: bytes) -> tuple[bytes, str | None, str]:
+    # returns name (e.g. b"VEVENT"), key identifying the component
+    # (UID & RECURRENCE-ID as in input) & digest (see _ical_digest)
+    digest = hashlib.sha256()
+    name, uid, recurrence_id = b"", None, b""
+    depth = 0
+    for content_line, _ in _iter_content_lines(ical.splitlines()):
+        line_name = _content_line_name(content_line)
+        if line_name == b"DTSTAMP":
+            continue
+        digest.update(content_line + b"\r\n")
+        if line_name == b"BEGIN":
+            depth += 1
+            name = name or content_line[len(b"BEGIN:") :].upper()
+        elif line_name == b"END":
+            depth -= 1
+        elif depth == 1 and line_name == b"UID":
+            uid = content_line
+        elif depth == 1 and line_name == b"RECURRENCE-ID":
+            recurrence_id = content_line
+    key = (
+        None if uid is None else (uid + b"\n" + recurrence_id).decode(errors="replace")
+    )
+    return name, key, digest.hexdigest()
+
+
+class _IncrementalInput:
+
+    # Compares digests of input components with the previous run's
+    # before parsing them, see --incremental.
+
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, previous: dict[str, dict[str, str]]) -> None:
+        self.previous = previous
+        self.current: dict[str, dict[str, str]] = {}
+
+    def _unchanged_path(
+        self,
+        key: str,
+        digest: str,
+        output_dir_path: pathlib.Path,
+        context: _SyncContext,
+    ) -> pathlib.Path | None:
+        previous = self.previous.get(key)
+        if previous is None or previous["digest"] != digest:
+            return None
+        assert context.state is not None
+        entry = context.state.get(previous["filename"])
+        path = output_dir_path.joinpath(previous["filename"])
+        if entry is None or not _state_entry_matches(
+            entry, entry["digest"], _item_stat(path, context.scan)
+        ):
+            return None
+        self.current[key] = previous
+        return path
+
+    def iter_changed_components(
+        self,
+        component_icals: typing.Iterable[bytes],
+        output_dir_path: pathlib.Path,
+        context: _SyncContext,
+    ) -> typing.Iterator[icalendar.cal.Component]:
+        import icalendar  # pylint: disable=import-outside-toplevel
+
+        assert context.state is not None
+        # VTIMEZONE components are only parsed if required by a changed event
+        pending_icals: list[bytes] = []
+        for component_ical in component_icals:
+            name, key, digest = _scan_component_ical(component_ical)
+            if name not in {b"VEVENT", b"VTODO"}:
+                pending_icals.append(component_ical)
+                continue
+            unchanged_path = (
+                None
+                if key is None
+                else self._unchanged_path(key, digest, output_dir_path, context)
+            )
+            if unchanged_path is not None:
+                _LOGGER.debug("%s is up to date (input unchanged)", unchanged_path)
+                context.stats.count("unchanged")
+                context.record("unchanged", unchanged_path)
+                continue
+            for pending_ical in pending_icals:
+                yield icalendar.cal.Component.from_ical(pending_ical)
+            pending_icals.clear()
+            event = icalendar.cal.Component.from_ical(component_ical)
+            if key is not None:
+                self.current[key] = {
+                    "digest": digest,
+                    "filename": _event_vdir_filename(event),
+                }
+            yield event
+        context.stats.count("skipped", len(pending_icals))
@@ -0,0 +1,172 @@
+# ical2vdir - convert .ics file to vdir directory
+#
+# Copyright (C) 2020 Fabian Peter Hammerle <fabian@hammerle.me>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Splits input into components without parsing them.
+
+import contextlib
+import hashlib
+import mmap
+import os
+import pathlib
+import re
+import typing
+
+# https://tools.ietf.org/html/rfc5545#section-3.1
+_CONTENT_LINE_NAME_PATTERN = re.compile(rb"[^;:]*")
+
+# BEGIN & END lines are short enough to never be folded
+# https://tools.ietf.org/html/rfc5545#section-3.1
+_BOUNDARY_LINE_PATTERN = re.compile(
+    rb"^(BEGIN|END):[^\r\n]*(?:\r?\n|$)", flags=re.MULTILINE | re.IGNORECASE
+)
+
+
+def _iter_content_lines(
+    lines: typing.Iterable[bytes],
+) -> typing.Iterator[tuple[bytes, list[bytes]]]:
+    # > Lines of text SHOULD NOT be longer than 75 octets [...]
+    # > Unfolding is accomplished by removing the CRLF and the linear
+    # > white-space character that immediately follows.
+    # https://tools.ietf.org/html/rfc5545#section-3.1
+    physical_lines: list[bytes] = []
+    for line in lines:
+        if physical_lines and line[:1] in {b" ", b"\t"}:
+            physical_lines.append(line)
+            continue
+        if physical_lines:
+            yield _unfold_content_line(physical_lines), physical_lines
+        physical_lines = [line]
+    if physical_lines:
+        yield _unfold_content_line(physical_lines), physical_lines
+
+
+def _content_line_name(content_line: bytes) -> bytes:
+    match = _CONTENT_LINE_NAME_PATTERN.match(content_line)
+    assert match is not None  # pattern matches empty string
+    return match.group(0).upper()
+
+
+def _unfold_content_line(physical_lines: list[bytes]) -> bytes:
+    return b"".join(
+        line.rstrip(b"\r\n")[(1 if index > 0 else 0) :]
+        for index, line in enumerate(physical_lines)
+    )
+
+
+def _is_calendar_begin(content_line: bytes) -> bool:
+    return content_line.rstrip().upper() == b"BEGIN:VCALENDAR"
+
+
+def _check_outside_calendar(content: bytes, closed: bool) -> None:
+    # input without VCALENDAR (e.g. empty or error page) would otherwise
+    # be synced as empty calendar & remove all items with --delete
+    if not content.strip():
+        return
+    if closed:
+        raise ValueError("unexpected content after END:VCALENDAR")
+    raise ValueError("input does not start with BEGIN:VCALENDAR")
+
+
+def _check_closed(depth: int, closed: bool) -> None:
+    # input truncated between components (e.g. interrupted download)
+    # would remove all following items with --delete
+    if depth > 0:
+        raise ValueError("unexpected end of input, VCALENDAR was not closed")
+    if not closed:
+        raise ValueError("input does not contain a VCALENDAR")
+
+
+def _iter_component_icals(lines: typing.Iterable[bytes]) -> typing.Iterator[bytes]:
+    # yields subcomponents of VCALENDAR (VEVENT, VTODO, VTIMEZONE, …)
+    # as soon as their END line was read
+    depth = 0
+    closed = False
+    component_lines: list[bytes] = []
+    for content_line, physical_lines in _iter_content_lines(lines):
+        if depth == 0:
+            if closed or not _is_calendar_begin(content_line):
+                _check_outside_calendar(content_line, closed)
+                continue
+        name = _content_line_name(content_line)
+        if name == b"BEGIN":
+            depth += 1
+        if depth > 1:
+            component_lines.extend(physical_lines)
+        if name == b"END":
+            depth -= 1
+            if depth == 1:
+                yield b"".join(component_lines)
+                component_lines = []
+            closed = depth == 0
+    if component_lines:
+        raise ValueError("unexpected end of input within component")
+    _check_closed(depth, closed)
+
+
+def _map_file(input_file: typing.BinaryIO) -> mmap.mmap | contextlib.nullcontext[bytes]:
+    if not os.fstat(input_file.fileno()).st_size:  # mmap rejects empty files
+        return contextlib.nullcontext(b"")
+    return mmap.mmap(input_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _iter_mapped_component_icals(
+    mapped: bytes | mmap.mmap,
+) -> typing.Iterator[bytes]:
+    # Yields subcomponents of VCALENDAR (VEVENT, VTODO, VTIMEZONE, …)
+    # like ical2vdir._iter_component_icals, but only copies the slices
+    # of the mapped file containing components.
+    depth = 0
+    start = 0
+    end: int | None = None  # of END:VCALENDAR
+    for match in _BOUNDARY_LINE_PATTERN.finditer(mapped):
+        if depth == 0:
+            _check_outside_calendar(
+                mapped[(end or 0) : match.start()], closed=end is not None
+            )
+            if end is not None or not _is_calendar_begin(match.group(0)):
+                _check_outside_calendar(match.group(0), closed=end is not None)
+        if match.group(1).upper() == b"BEGIN":
+            depth += 1
+            if depth == 2:
+                start = match.start()
+        else:
+            depth -= 1
+            if depth == 1:
+                yield mapped[start : match.end()]
+            elif depth == 0:
+                end = match.end()
+    if depth > 1:
+        raise ValueError("unexpected end of input within component")
+    if depth == 0:
+        _check_outside_calendar(mapped[end or 0 :], closed=end is not None)
+    _check_closed(depth, closed=end is not None)
+
+
+def _iter_paths_component_icals(
+    paths: typing.Iterable[pathlib.Path],
+) -> typing.Iterator[bytes]:
+    for path in paths:
+        with path.open("rb") as input_file, _map_file(input_file) as mapped:
+            yield from _iter_mapped_component_icals(mapped)
+
+
+def _paths_digest(paths: typing.Iterable[pathlib.Path]) -> str:
+    digest = hashlib.sha256()
+    for path in paths:
+        with path.open("rb") as input_file, _map_file(input_file) as mapped:
+            digest.update(mapped)
+    return digest.hexdigest()
@@ -0,0 +1,245 @@
+# ical2vdir - convert .ics file to vdir directory
+#
+# Copyright (C) 2020 Fabian Peter Hammerle <fabian@hammerle.me>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from __future__ import annotations
+
+import contextlib
+import hashlib
+import logging
+import os
+import pathlib
+import time
+import typing
+
+from ical2vdir._scan import _DirectoryScan
+
+if typing.TYPE_CHECKING:  # pragma: no cover
+    from ical2vdir._common import _AtomicWriter
+
+_LOGGER = logging.getLogger(__name__)
+
+# flat: items in output directory (vdir)
+# sharded: items in .shards/<shard>/, symlinked from output directory
+# (flat view for vdir readers like khal, lookups & listings in small directories)
+_LAYOUT_FLAT = "flat"
+_LAYOUT_SHARDED = "sharded"
+_LAYOUTS = (_LAYOUT_FLAT, _LAYOUT_SHARDED)
+# hidden, ignored by vdir readers
+_SHARDS_DIRNAME = ".shards"
+# modification times of directories are not recorded in the index
+# if they might change again within their timestamp granularity
+_SHARD_MTIME_MARGIN_NS = 2_000_000_000
+
+
+def _shard_name(filename: str) -> str:
+    # 256 shards, independent of the UID's format
+    return hashlib.sha256(filename.encode(errors="surrogateescape")).hexdigest()[:2]
+
+
+def _shard_link_target(filename: str) -> str:
+    # relative: output directory may be moved
+    return os.path.join(_SHARDS_DIRNAME, _shard_name(filename), filename)
+
+
+def _item_path(
+    output_dir_path: pathlib.Path, filename: str, layout: str
+) -> pathlib.Path:
+    if layout == _LAYOUT_FLAT:
+        return output_dir_path.joinpath(filename)
+    return output_dir_path.joinpath(_shard_link_target(filename))
+
+
+def _write_item(
+    data: bytes,
+    output_dir_path: pathlib.Path,
+    filename: str,
+    layout: str,
+    writer: _AtomicWriter,
+) -> os.stat_result:
+    # returns stat of written file
+    item_path = _item_path(output_dir_path, filename, layout)
+    if layout == _LAYOUT_FLAT:
+        return writer.write(data, item_path)
+    writer.mkdir(item_path.parent)
+    stat = writer.write(data, item_path)
+    # replaces regular files written with flat layout
+    writer.symlink(_shard_link_target(filename), output_dir_path.joinpath(filename))
+    return stat
+
+
+def _link_item(
+    output_dir_path: pathlib.Path, filename: str, layout: str, writer: _AtomicWriter
+) -> None:
+    # unchanged items: restores symlinks of flat view
+    # (e.g. removed by vdir readers)
+    link_path = output_dir_path.joinpath(filename)
+    if layout == _LAYOUT_SHARDED and writer.symlink(
+        _shard_link_target(filename), link_path
+    ):
+        _LOGGER.info("restored symlink %s", link_path)
+
+
+def _item_linked(scan: _Scan, filename: str) -> bool:
+    # --layout sharded: symlink of flat view might have been removed
+    # or replaced since the last run (e.g. by vdir readers)
+    if not isinstance(scan, _ShardedDirectoryScan):
+        return True
+    try:
+        return os.readlink(scan.path.joinpath(filename)) == _shard_link_target(filename)
+    except OSError:  # missing or no symlink
+        return False
+
+
+def _remove_item(path: pathlib.Path, layout: str) -> None:
+    # path in output directory
+    if layout == _LAYOUT_SHARDED:
+        # symlink and/or regular file left by --layout flat
+        for item_path in (_item_path(path.parent, path.name, layout), path):
+            with contextlib.suppress(FileNotFoundError):
+                item_path.unlink()
+        return
+    path.unlink()
+
+
+class _ShardedDirectoryScan:
+
+    # Interface of _DirectoryScan for items in the shards of path.
+    # Shard directories are listed on first access.
+    # Shards unmodified since the last run with --delete & --state
+    # are not listed at all, their items are known from the index.
+    # file_names() includes regular files in path (e.g. left by --layout flat).
+
+    def __init__(
+        self,
+        path: pathlib.Path,
+        known_shard_mtimes: dict[str, int] | None,
+        known_names: typing.Iterable[str],
+    ) -> None:
+        self.path = path
+        self._shards_path = path.joinpath(_SHARDS_DIRNAME)
+        self._shard_mtimes = self._stat_shards()
+        self._known_names: dict[str, list[str]] = {
+            shard: []
+            for shard, mtime_ns in (known_shard_mtimes or {}).items()
+            if self._shard_mtimes.get(shard) == mtime_ns
+        }
+        if self._known_names:
+            for name in known_names:
+                shard_names = self._known_names.get(_shard_name(name))
+                if shard_names is not None:
+                    shard_names.append(name)
+        self._scans: dict[str, _DirectoryScan] = {}
+        # regular files in path, listed on first access.
+        # known_shard_mtimes is None unless the last run used --layout sharded
+        # & --delete & thereby replaced or removed all regular files.
+        self._flat_names: set[str] | None = (
+            None if known_shard_mtimes is None else set()
+        )
+
+    def _stat_shards(self) -> dict[str, int]:
+        try:
+            with os.scandir(self._shards_path) as entries:
+                return {
+                    entry.name: entry.stat().st_mtime_ns
+                    for entry in entries
+                    if entry.is_dir()
+                }
+        except FileNotFoundError:
+            return {}
+
+    def _shard_scan(self, shard: str) -> _DirectoryScan:
+        if shard not in self._scans:
+            names: list[str] | None = self._known_names.pop(shard, None)
+            if names is None and shard not in self._shard_mtimes:
+                names = []  # created after scan
+            self._scans[shard] = _DirectoryScan(
+                self._shards_path.joinpath(shard), names
+            )
+        return self._scans[shard]
+
+    def _list_flat_names(self) -> set[str]:
+        if self._flat_names is None:
+            with os.scandir(self.path) as entries:
+                self._flat_names = {
+                    entry.name
+                    for entry in entries
+                    if entry.is_file(follow_symlinks=False)
+                }
+        return self._flat_names
+
+    def file_names(self, suffix: str) -> set[str]:
+        # ignores files in other shards than their name's
+        return set(
+            name
+            for shard in self._shard_mtimes
+            for name in self._shard_scan(shard).file_names(suffix)
+            if _shard_name(name) == shard
+        ) | {n for n in self._list_flat_names() if n.endswith(suffix)}
+
+    def exists(self, name: str) -> bool:
+        return self._shard_scan(_shard_name(name)).exists(name)
+
+    def stat(self, name: str) -> os.stat_result | None:
+        return self._shard_scan(_shard_name(name)).stat(name)
+
+    def written(self, name: str) -> None:
+        self._shard_scan(_shard_name(name)).written(name)
+        if self._flat_names is not None:  # replaced by symlink
+            self._flat_names.discard(name)
+
+    def removed(self, name: str) -> None:
+        self._shard_scan(_shard_name(name)).removed(name)
+        if self._flat_names is not None:
+            self._flat_names.discard(name)
+
+    def invalidate(self, name: str) -> None:
+        self._shard_scan(_shard_name(name)).invalidate(name)
+        if self._flat_names is not None:
+            self._flat_names.discard(name)
+            path = self.path.joinpath(name)
+            if path.is_file() and not path.is_symlink():
+                self._flat_names.add(name)
+
+    def shard_mtimes(self) -> dict[str, int]:
+        # for the index, after all items were synced & removed
+        max_mtime_ns = time.time_ns() - _SHARD_MTIME_MARGIN_NS
+        return {
+            shard: mtime_ns
+            for shard, mtime_ns in self._stat_shards().items()
+            if mtime_ns < max_mtime_ns
+        }
+
+
+_Scan = typing.Union[_DirectoryScan, _ShardedDirectoryScan]
+
+
+def _new_scan(
+    output_dir_path: pathlib.Path, layout: str, state_file: dict[str, typing.Any]
+) -> _Scan:
+    if layout == _LAYOUT_FLAT:
+        return _DirectoryScan(output_dir_path)
+    return _ShardedDirectoryScan(
+        output_dir_path,
+        known_shard_mtimes=state_file.get("shards"),
+        known_names=state_file.get("items", {}),
+    )
+
+
+def _shard_mtimes(scan: _Scan) -> dict[str, int] | None:
+    if isinstance(scan, _ShardedDirectoryScan):
+        return scan.shard_mtimes()
+    return None
@@ -0,0 +1,131 @@
+# ical2vdir - convert .ics file to vdir directory
+#
+# Copyright (C) 2020 Fabian Peter Hammerle <fabian@hammerle.me>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import pathlib
+import sys
+import typing
+
+from ical2vdir._common import _FSYNC_NEVER, SyncResult, _AtomicWriter, _SyncContext
+from ical2vdir._layout import _item_path, _remove_item, _write_item
+from ical2vdir._scan import _item_stat
+
+_LOGGER = logging.getLogger(__name__)
+
+_PLAN_VERSION = 1
+
+
+class _Plan:
+
+    # Changes computed by sync(dry_run=True) instead of writing
+    # or removing items, applied by --apply.
+    # Size & modification time of pre-existing items are recorded
+    # to detect modifications between planning & applying.
+
+    def __init__(self, output_dir_path: pathlib.Path, layout: str) -> None:
+        self.output_dir_path = output_dir_path
+        self.layout = layout
+        # duplicates in streamed input: last change wins
+        self._items: dict[str, dict[str, typing.Any]] = {}
+
+    def add(
+        self,
+        action: str,
+        path: pathlib.Path,
+        ical: bytes | None,
+        stat: os.stat_result | None,
+    ) -> None:
+        item: dict[str, typing.Any] = {"action": action, "filename": path.name}
+        if ical is not None:
+            item["ical"] = ical.decode("utf-8", errors="surrogateescape")
+        if stat is not None:
+            item.update({"mtime_ns": stat.st_mtime_ns, "size": stat.st_size})
+        self._items[path.name] = item
+
+    def as_dict(self) -> dict[str, typing.Any]:
+        return {
+            "version": _PLAN_VERSION,
+            "output_dir": str(self.output_dir_path.absolute()),
+            "layout": self.layout,
+            "items": list(self._items.values()),
+        }
+
+
+def _item_modified(
+    output_dir_path: pathlib.Path, layout: str, item: dict[str, typing.Any]
+) -> bool:
+    stat = _item_stat(_item_path(output_dir_path, item["filename"], layout), None)
+    if stat is None and item["action"] == "removed":
+        # regular file left by --layout flat (see ical2vdir._delete)
+        stat = _item_stat(output_dir_path.joinpath(item["filename"]), None)
+    if item["action"] == "created":
+        return stat is not None
+    return (
+        stat is None
+        or stat.st_mtime_ns != item["mtime_ns"]
+        or stat.st_size != item["size"]
+    )
+
+
+def _apply_plan(plan: dict[str, typing.Any], fsync: str = _FSYNC_NEVER) -> SyncResult:
+    if plan.get("version") != _PLAN_VERSION:
+        raise ValueError("unsupported plan version")
+    output_dir_path = pathlib.Path(plan["output_dir"])
+    layout = plan["layout"]
+    items = [(output_dir_path.joinpath(i["filename"]), i) for i in plan["items"]]
+    # nothing is changed if any item was modified since planning
+    modified_paths = [
+        path for path, item in items if _item_modified(output_dir_path, layout, item)
+    ]
+    if modified_paths:
+        raise ValueError(
+            f"{len(modified_paths)} items were modified since the plan was created: "
+            + ", ".join(str(p) for p in modified_paths)
+        )
+    context = _SyncContext(writer=_AtomicWriter(fsync=fsync))
+    for path, item in items:
+        if item["action"] == "removed":
+            _remove_item(path, layout)
+        else:
+            with context.stats.measure("write"):
+                stat = _write_item(
+                    item["ical"].encode("utf-8", errors="surrogateescape"),
+                    output_dir_path,
+                    path.name,
+                    layout,
+                    context.writer,
+                )
+            context.stats.count("item_bytes_written", stat.st_size)
+        context.stats.count(item["action"])
+        context.record(item["action"], path)
+    context.writer.flush()
+    context.result.stats = context.stats.as_dict()
+    return context.result
+
+
+def _main_apply(plan_path: pathlib.Path, fsync: str) -> SyncResult:
+    with plan_path.open("rb") as plan_file:
+        plan = json.load(plan_file)
+    try:
+        return _apply_plan(plan, fsync=fsync)
+    except ValueError as exc:
+        _LOGGER.error("%s: %s", plan_path, exc)
+        sys.exit(1)
@@ -0,0 +1,112 @@
+# ical2vdir - convert .ics file to vdir directory
+#
+# Copyright (C) 2020 Fabian Peter Hammerle <fabian@hammerle.me>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from __future__ import annotations
+
+import contextlib
+import json
+import logging
+import pathlib
+import time
+import typing
+
+from ical2vdir._stats import _Stats
+
+_LOGGER = logging.getLogger(__name__)
+
+_PROGRESS_ITEMS = "items"
+_PROGRESS_COUNTER = "counter"
+_PROGRESS_NONE = "none"
+_PROGRESS_MODES = (_PROGRESS_ITEMS, _PROGRESS_COUNTER, _PROGRESS_NONE)
+
+
+class _ProgressReporter:
+
+    # items: logs each created & updated item (default).
+    # counter: logs aggregated counters every interval seconds & at the end
+    # instead of one line per item.
+    # none: logs neither (see --stats).
+    # dry_run: logs planned instead of applied changes (see --dry-run).
+    # Each created, updated & removed item is additionally
+    # appended as JSON object to event_log_path, one per line.
+
+    _COUNTERS = ("created", "updated", "unchanged", "removed", "skipped")
+    _VERBS = {"created": "creating", "updated": "updating", "removed": "removing"}
+    _DRY_RUN_VERBS = {
+        "created": "would create",
+        "updated": "would update",
+        "removed": "would remove",
+    }
+
+    def __init__(
+        self,
+        mode: str = _PROGRESS_ITEMS,
+        interval: float = 10.0,
+        event_log_path: pathlib.Path | None = None,
+        dry_run: bool = False,
+    ) -> None:
+        self.mode = mode
+        self.interval = interval
+        self.event_log_path = event_log_path
+        self.dry_run = dry_run
+        self._event_log: typing.TextIO | None = None
+        self._last_report = time.monotonic()
+
+    @contextlib.contextmanager
+    def open_event_log(self) -> typing.Iterator[None]:
+        if self.event_log_path is None:
+            yield
+            return
+        with self.event_log_path.open("a", encoding="utf-8") as event_log:
+            self._event_log = event_log
+            try:
+                yield
+            finally:
+                self._event_log = None
+
+    def item(self, action: str, path: pathlib.Path, stats: _Stats) -> None:
+        verb = (self._DRY_RUN_VERBS if self.dry_run else self._VERBS).get(action)
+        if verb is not None:
+            _LOGGER.log(
+                (
+                    logging.INFO
+                    if self.mode == _PROGRESS_ITEMS and action != "removed"
+                    else logging.DEBUG
+                ),
+                "%s %s",
+                verb,
+                path,
+            )
+            if self._event_log is not None:
+                json.dump({"action": action, "path": str(path)}, self._event_log)
+                self._event_log.write("\n")
+        if (
+            self.mode == _PROGRESS_COUNTER
+            and time.monotonic() - self._last_report >= self.interval
+        ):
+            self.report_counts(stats)
+
+    def report_counts(self, stats: _Stats) -> None:
+        self._last_report = time.monotonic()
+        _LOGGER.info(
+            "%s",
+            ", ".join(f"{stats.counts[c]} {c}" for c in self._COUNTERS),
+        )
+
+    def finish(self, stats: _Stats) -> None:
+        if self.mode == _PROGRESS_COUNTER:
+            self.report_counts(stats)
@@ -0,0 +1,106 @@
+# ical2vdir - convert .ics file to vdir directory
+#
+# Copyright (C) 2020 Fabian Peter Hammerle <fabian@hammerle.me>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from __future__ import annotations
+
+import os
+import pathlib
+import typing
+
+if typing.TYPE_CHECKING:  # pragma: no cover
+    from ical2vdir._layout import _Scan
+
+
+class _DirectoryScan:
+
+    # Lists a directory once with os.scandir.
+    # Existence & type checks of items read the cached entries,
+    # stat calls are performed at most once per item
+    # (metadata requests are expensive on network filesystems).
+
+    def __init__(
+        self, path: pathlib.Path, names: typing.Iterable[str] | None = None
+    ) -> None:
+        self.path = path
+        self._entries: dict[str, os.DirEntry[str] | None]
+        if names is None:
+            with os.scandir(path) as entries:
+                self._entries = {entry.name: entry for entry in entries}
+        else:  # known files (e.g. from index) instead of listing
+            self._entries = dict.fromkeys(names)
+        self._stats: dict[str, os.stat_result | None] = {}
+        # stats of items written since the scan are not cached
+        # to keep memory usage independent of the number of items
+        self._written: set[str] = set()
+
+    def file_names(self, suffix: str) -> set[str]:
+        return set(
+            name
+            for name, entry in self._entries.items()
+            if name.endswith(suffix) and (entry is None or entry.is_file())
+        )
+
+    def exists(self, name: str) -> bool:
+        if name in self._written:
+            return True
+        if name in self._stats:
+            return self._stats[name] is not None
+        return name in self._entries
+
+    def stat(self, name: str) -> os.stat_result | None:
+        if name in self._written:
+            return _item_stat(self.path.joinpath(name), None)
+        if name not in self._stats:
+            if name not in self._entries:
+                self._stats[name] = None
+            else:
+                entry = self._entries[name]
+                try:
+                    self._stats[name] = (
+                        self.path.joinpath(name).stat()
+                        if entry is None
+                        else entry.stat()
+                    )
+                except FileNotFoundError:  # removed after scan
+                    self._stats[name] = None
+        return self._stats[name]
+
+    def written(self, name: str) -> None:
+        self._written.add(name)
+        self._stats.pop(name, None)
+
+    def removed(self, name: str) -> None:
+        self._written.discard(name)
+        self._stats[name] = None
+
+    def invalidate(self, name: str) -> None:
+        # changed by another process (see --watch)
+        self._written.discard(name)
+        self._stats.pop(name, None)
+        if os.path.lexists(self.path.joinpath(name)):
+            self._entries[name] = None  # stat on demand
+        else:
+            self._entries.pop(name, None)
+
+
+def _item_stat(path: pathlib.Path, scan: _Scan | None) -> os.stat_result | None:
+    if scan is not None:
+        return scan.stat(path.name)
+    try:
+        return path.stat()
+    except FileNotFoundError:
+        return None
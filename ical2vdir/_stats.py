@@ -0,0 +1,106 @@
+# ical2vdir - convert .ics file to vdir directory
+#
+# Copyright (C) 2020 Fabian Peter Hammerle <fabian@hammerle.me>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import contextlib
+import json
+import sys
+import threading
+import time
+import typing
+
+_T = typing.TypeVar("_T")
+
+
+class _Stats:
+
+    # wall time per phase & counters reported by --stats.
+    # with --jobs, time spent in worker threads is summed up.
+
+    PHASES = (
+        "parse_input",
+        "scan",
+        "read_items",
+        "compare",
+        "write",
+        "delete",
+        "total",
+    )
+    COUNTERS = (
+        "created",
+        "updated",
+        "unchanged",
+        "removed",
+        "skipped",
+        "duplicates",
+        "input_bytes",
+        "item_bytes_read",
+        "item_bytes_written",
+    )
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.seconds = dict.fromkeys(self.PHASES, 0.0)
+        self.counts = dict.fromkeys(self.COUNTERS, 0)
+
+    @contextlib.contextmanager
+    def measure(self, phase: str) -> typing.Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            with self._lock:
+                self.seconds[phase] += duration
+
+    def measure_iter(
+        self, phase: str, iterable: typing.Iterable[_T]
+    ) -> typing.Iterator[_T]:
+        iterator = iter(iterable)
+        while True:
+            with self.measure(phase):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def count(self, counter: str, value: int = 1) -> None:
+        with self._lock:
+            self.counts[counter] += value
+
+    def count_bytes(
+        self, counter: str, chunks: typing.Iterable[bytes]
+    ) -> typing.Iterator[bytes]:
+        for chunk in chunks:
+            self.count(counter, len(chunk))
+            yield chunk
+
+    def as_dict(self) -> dict[str, typing.Any]:
+        return {"seconds": dict(self.seconds), **self.counts}
+
+
+def _print_stats(stats: dict[str, typing.Any], output_format: str) -> None:
+    if output_format == "json":
+        json.dump(stats, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+        return
+    for key, value in stats.items():
+        if key == "seconds":
+            for phase, seconds in value.items():
+                sys.stderr.write(f"{phase}: {seconds:.3f}s\n")
+        else:
+            sys.stderr.write(f"{key}: {value}\n")
@@ -0,0 +1,282 @@
+# ical2vdir - convert .ics file to vdir directory
+#
+# Copyright (C) 2020 Fabian Peter Hammerle <fabian@hammerle.me>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from __future__ import annotations
+
+import argparse
+import ctypes
+import logging
+import os
+import pathlib
+import select
+import struct
+import time
+import typing
+
+import ical2vdir
+from ical2vdir._common import (
+    _STATE_FILENAME,
+    _VDIR_EVENT_FILE_EXTENSION,
+    DeleteLimitExceeded,
+)
+from ical2vdir._layout import _SHARDS_DIRNAME, _Scan
+from ical2vdir._stats import _print_stats
+
+_LOGGER = logging.getLogger(__name__)
+
+# https://man7.org/linux/man-pages/man7/inotify.7.html
+_INOTIFY_EVENT = struct.Struct("iIII")  # wd, mask, cookie, len
+_IN_MODIFY = 0x2
+_IN_ATTRIB = 0x4
+_IN_CLOSE_WRITE = 0x8
+_IN_MOVED_FROM = 0x40
+_IN_MOVED_TO = 0x80
+_IN_CREATE = 0x100
+_IN_DELETE = 0x200
+_IN_Q_OVERFLOW = 0x4000
+# written completely or replaced atomically
+_INPUT_EVENTS = _IN_CLOSE_WRITE | _IN_MOVED_TO
+_OUTPUT_EVENTS = (
+    _IN_MODIFY
+    | _IN_ATTRIB
+    | _IN_CLOSE_WRITE
+    | _IN_MOVED_FROM
+    | _IN_MOVED_TO
+    | _IN_CREATE
+    | _IN_DELETE
+)
+
+_FileSignature = typing.Optional[tuple[int, int, int]]
+
+
+def _file_signature(path: pathlib.Path) -> _FileSignature:
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+class _SyncCache:
+
+    # Kept in memory between runs of sync() (see --watch):
+    # listing of the output directory (updated by sync(), entries changed
+    # by other processes need to be invalidated) & index saved by the last run.
+
+    def __init__(self, output_dir_path: pathlib.Path) -> None:
+        self.scan: _Scan | None = None
+        self._state_path = output_dir_path.joinpath(_STATE_FILENAME)
+        self._state_file: dict[str, typing.Any] | None = None
+        self._state_signature: _FileSignature = None
+
+    def pop_state_file(self) -> dict[str, typing.Any] | None:
+        # None if modified since saved.
+        # modified in place by sync(), cached again when saved.
+        state_file, self._state_file = self._state_file, None
+        if state_file is None or (
+            _file_signature(self._state_path) != self._state_signature
+        ):
+            return None
+        return state_file
+
+    def saved_state_file(self, state_file: dict[str, typing.Any]) -> None:
+        self._state_file = state_file
+        self._state_signature = _file_signature(self._state_path)
+
+    def invalidate(self, name: str) -> None:
+        if self.scan is not None and name.endswith(_VDIR_EVENT_FILE_EXTENSION):
+            self.scan.invalidate(name)
+
+
+class _Inotify:
+
+    # inotify(7) via ctypes, raises OSError if unavailable (e.g. on macOS)
+
+    def __init__(self) -> None:
+        self._libc = ctypes.CDLL(None, use_errno=True)
+        if not hasattr(self._libc, "inotify_init1"):
+            raise OSError("inotify is not supported")
+        self._fd = self._libc.inotify_init1(os.O_CLOEXEC)
+        if self._fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        self.dir_paths: dict[int, pathlib.Path] = {}
+
+    def add_watch(self, dir_path: pathlib.Path, mask: int) -> None:
+        watch_descriptor = self._libc.inotify_add_watch(
+            self._fd, os.fsencode(dir_path), mask
+        )
+        if watch_descriptor < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), str(dir_path))
+        self.dir_paths[watch_descriptor] = dir_path
+
+    def read(self, timeout: float | None) -> list[tuple[pathlib.Path | None, int, str]]:
+        # (directory, mask, name) per event, empty after timeout
+        if not select.select([self._fd], [], [], timeout)[0]:
+            return []
+        data = os.read(self._fd, 64 * 1024)
+        events = []
+        offset = 0
+        while offset < len(data):
+            watch_descriptor, mask, _, name_length = _INOTIFY_EVENT.unpack_from(
+                data, offset
+            )
+            offset += _INOTIFY_EVENT.size
+            name = os.fsdecode(data[offset : offset + name_length].rstrip(b"\0"))
+            offset += name_length
+            events.append((self.dir_paths.get(watch_descriptor), mask, name))
+        return events
+
+    def close(self) -> None:
+        os.close(self._fd)
+
+
+class _Watcher:
+
+    # Waits until input files were changed & left unchanged for debounce seconds.
+    # Events in the output directory invalidate the cached listing.
+    # Without inotify, input files are polled & the output directory is
+    # listed again by every run.
+
+    def __init__(
+        self,
+        input_paths: list[pathlib.Path],
+        output_dir_path: pathlib.Path,
+        debounce: float,
+        poll_interval: float,
+    ) -> None:
+        self._input_paths = [p.absolute() for p in input_paths]
+        self._output_dir_path = output_dir_path.absolute()
+        self._debounce = debounce
+        self._poll_interval = poll_interval
+        # output directory & shards (see --layout)
+        self._item_dir_paths = {self._output_dir_path}
+        self._inotify: _Inotify | None = None
+        try:
+            self._inotify = _Inotify()
+        except OSError as exc:
+            _LOGGER.warning(
+                "inotify unavailable (%s), polling every %s seconds",
+                exc,
+                poll_interval,
+            )
+        else:
+            # one watch per directory
+            masks = {self._output_dir_path: _OUTPUT_EVENTS}
+            for path in self._input_paths:
+                masks[path.parent] = masks.get(path.parent, 0) | _INPUT_EVENTS
+            for dir_path, mask in masks.items():
+                self._inotify.add_watch(dir_path, mask)
+            self._watch_shards()
+        self._input_signatures = self._signatures()
+
+    def _signatures(self) -> list[_FileSignature]:
+        return [_file_signature(p) for p in self._input_paths]
+
+    def _watch_shards(self) -> None:
+        # --layout sharded: items are modified in shard directories.
+        # called again before waiting for shards created by sync()
+        assert self._inotify is not None
+        shards_path = self._output_dir_path.joinpath(_SHARDS_DIRNAME)
+        if not shards_path.is_dir():
+            return
+        for shard_path in shards_path.iterdir():
+            if shard_path not in self._item_dir_paths and shard_path.is_dir():
+                self._inotify.add_watch(shard_path, _OUTPUT_EVENTS)
+                self._item_dir_paths.add(shard_path)
+
+    def wait(self, cache: _SyncCache) -> None:
+        _LOGGER.debug("waiting for changes of input")
+        if self._inotify is None:
+            cache.scan = None  # changes in output directory are not tracked
+            self._poll()
+        else:
+            self._watch_shards()
+            self._read_events(cache)
+
+    def _read_events(self, cache: _SyncCache) -> None:
+        assert self._inotify is not None
+        deadline: float | None = None
+        while deadline is None or time.monotonic() < deadline:
+            timeout = (
+                None if deadline is None else max(0.0, deadline - time.monotonic())
+            )
+            for dir_path, mask, name in self._inotify.read(timeout):
+                if mask & _IN_Q_OVERFLOW:  # events were dropped
+                    cache.scan = None
+                    deadline = time.monotonic() + self._debounce
+                    continue
+                if dir_path in self._item_dir_paths:
+                    cache.invalidate(name)
+                if (
+                    dir_path is not None
+                    and dir_path.joinpath(name) in self._input_paths
+                ):
+                    _LOGGER.debug("%s changed", dir_path.joinpath(name))
+                    deadline = time.monotonic() + self._debounce
+
+    def _poll(self) -> None:
+        changed_at: float | None = None
+        while True:
+            time.sleep(self._poll_interval)
+            signatures = self._signatures()
+            if signatures != self._input_signatures:
+                _LOGGER.debug("input changed")
+                self._input_signatures = signatures
+                changed_at = time.monotonic()
+            elif (
+                changed_at is not None
+                and time.monotonic() - changed_at >= self._debounce
+            ):
+                return
+
+    def close(self) -> None:
+        if self._inotify is not None:
+            self._inotify.close()
+
+
+def _main_watch(args: argparse.Namespace, sync_kwargs: dict[str, typing.Any]) -> None:
+    # runs until interrupted
+    watcher = _Watcher(
+        args.input_paths,
+        args.output_dir_path,
+        debounce=args.watch_debounce,
+        poll_interval=args.watch_poll_interval,
+    )
+    cache = _SyncCache(args.output_dir_path)
+    try:
+        while True:
+            try:
+                result = ical2vdir.sync(
+                    args.input_paths,
+                    args.output_dir_path,
+                    cache=cache,
+                    **{**sync_kwargs, "incremental": True},
+                )
+            except (DeleteLimitExceeded, ValueError, OSError) as exc:
+                # e.g. input written partially, retried on next change
+                _LOGGER.error("%s", exc)
+                cache = _SyncCache(args.output_dir_path)
+            else:
+                if args.stats:
+                    _print_stats(result.stats, args.stats)
+            watcher.wait(cache)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
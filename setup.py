@@ -50,7 +50,7 @@ setuptools.setup(
     ],
     entry_points={
         "console_scripts": [
-            "ical2vdir = ical2vdir:_main",
+            "ical2vdir = ical2vdir._cli:_main",
         ]
     },
     # >=3.9 type hint dict[…] (PEP585)
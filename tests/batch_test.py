@@ -0,0 +1,177 @@
+# ical2vdir - convert .ics file to vdir directory
+#
+# Copyright (C) 2020 Fabian Peter Hammerle <fabian@hammerle.me>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import json
+import logging
+import pathlib
+import shutil
+import unittest.mock
+
+import pytest
+
+import ical2vdir
+import ical2vdir._batch
+import ical2vdir._cli
+
+# pylint: disable=protected-access
+
+_RESOURCES_PATH = pathlib.Path(__file__).parent.joinpath("resources")
+
+
+def _run_batch(
+    capsys: pytest.CaptureFixture[str], manifest_path: pathlib.Path, *args: str
+) -> list[dict[str, object]]:
+    with unittest.mock.patch(
+        "sys.argv", ["", "--batch", str(manifest_path), *args]
+    ), unittest.mock.patch("sys.stdin", None):
+        ical2vdir._cli._main()
+    return json.loads(capsys.readouterr().out)  # type: ignore[no-any-return]
+
+
+@pytest.mark.parametrize("jobs", ["1", "2"])
+def test__main_batch_json(
+    capsys: pytest.CaptureFixture[str], tmp_path: pathlib.Path, jobs: str
+) -> None:
+    shutil.copy(_RESOURCES_PATH.joinpath("google-calendar.ics"), tmp_path)
+    shutil.copy(_RESOURCES_PATH.joinpath("nextcloud-tasks.ics"), tmp_path)
+    tmp_path.joinpath("google").mkdir()
+    tmp_path.joinpath("google", "obsolete.ics").touch()
+    tmp_path.joinpath("tasks").mkdir()
+    tmp_path.joinpath("tasks", "kept.ics").touch()
+    manifest_path = tmp_path.joinpath("manifest.json")
+    manifest_path.write_text(
+        json.dumps(
+            {
+                "calendars": [
+                    {
+                        "input": "google-calendar.ics",
+                        "output_dir": "google",
+                        "delete": True,
+                    },
+                    {"input": "nextcloud-tasks.ics", "output_dir": "tasks"},
+                ]
+            }
+        )
+    )
+    summaries = _run_batch(capsys, manifest_path, "--jobs", jobs)
+    for summary in summaries:
+        assert isinstance(summary.pop("seconds"), float)
+    assert summaries == [
+        {
+            "input": str(tmp_path.joinpath("google-calendar.ics")),
+            "output_dir": str(tmp_path.joinpath("google")),
+            "created": 3,
+            "updated": 0,
+            "unchanged": 0,
+            "removed": 1,
+            "error": None,
+        },
+        {
+            "input": str(tmp_path.joinpath("nextcloud-tasks.ics")),
+            "output_dir": str(tmp_path.joinpath("tasks")),
+            "created": 2,
+            "updated": 0,
+            "unchanged": 0,
+            "removed": 0,
+            "error": None,
+        },
+    ]
+    assert len(list(tmp_path.joinpath("google").iterdir())) == 3
+    assert len(list(tmp_path.joinpath("tasks").iterdir())) == 3
+
+
+def test__main_batch_toml_failure(
+    capsys: pytest.CaptureFixture[str], tmp_path: pathlib.Path
+) -> None:
+    shutil.copy(_RESOURCES_PATH.joinpath("nextcloud-tasks.ics"), tmp_path)
+    tmp_path.joinpath("tasks").mkdir()
+    manifest_path = tmp_path.joinpath("manifest.toml")
+    manifest_path.write_text("""
+[[calendars]]
+input = "missing.ics"
+output_dir = "tasks"
+
+[[calendars]]
+input = "nextcloud-tasks.ics"
+output_dir = "tasks"
+state = true
+""")
+    with pytest.raises(SystemExit) as exc_info:
+        _run_batch(capsys, manifest_path)
+    assert exc_info.value.code == 1
+    summaries = json.loads(capsys.readouterr().out)
+    assert "No such file or directory" in summaries[0]["error"]
+    assert summaries[1]["error"] is None
+    assert summaries[1]["created"] == 2
+    assert tmp_path.joinpath("tasks", ".ical2vdir-state").exists()
+
+
+def test__load_batch_manifest_defaults(tmp_path: pathlib.Path) -> None:
+    manifest_path = tmp_path.joinpath("manifest.json")
+    manifest_path.write_text(
+        json.dumps(
+            {
+                "calendars": [
+                    {"input": "/a.ics", "output_dir": "a", "delete": False},
+                    {"input": "b.ics", "output_dir": "/b", "jobs": 4},
+                ]
+            }
+        )
+    )
+    entries = ical2vdir._batch._load_batch_manifest(
+        manifest_path, defaults={"delete": True, "fsync": "batch"}
+    )
+    assert entries == [
+        ical2vdir._batch._BatchEntry(
+            input_path=pathlib.Path("/a.ics"),
+            output_dir_path=tmp_path.joinpath("a"),
+            options={"delete": False, "fsync": "batch"},
+        ),
+        ical2vdir._batch._BatchEntry(
+            input_path=tmp_path.joinpath("b.ics"),
+            output_dir_path=pathlib.Path("/b"),
+            options={"delete": True, "jobs": 4, "fsync": "batch"},
+        ),
+    ]
+
+
+def test__load_batch_manifest_unknown_key(tmp_path: pathlib.Path) -> None:
+    manifest_path = tmp_path.joinpath("manifest.json")
+    manifest_path.write_text(
+        json.dumps({"calendars": [{"input": "a", "output_dir": "b", "dry": 1}]})
+    )
+    with pytest.raises(ValueError, match=r"unknown keys dry$"):
+        ical2vdir._batch._load_batch_manifest(manifest_path, defaults={})
+
+
+def test__load_batch_manifest_toml_unsupported(tmp_path: pathlib.Path) -> None:
+    manifest_path = tmp_path.joinpath("manifest.toml")
+    manifest_path.touch()
+    with unittest.mock.patch.dict(
+        "sys.modules", {"tomllib": None, "tomli": None}
+    ), pytest.raises(ValueError, match=r"TOML requires python>=3.11 or tomli$"):
+        ical2vdir._batch._load_batch_manifest(manifest_path, defaults={})
+
+
+def test__init_batch_worker() -> None:
+    root_logger = logging.getLogger()
+    level = root_logger.level
+    try:
+        ical2vdir._batch._init_batch_worker(logging.WARNING)
+        assert root_logger.level == logging.WARNING
+    finally:
+        root_logger.setLevel(level)
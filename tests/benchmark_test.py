@@ -0,0 +1,89 @@
+# ical2vdir - convert .ics file to vdir directory
+#
+# Copyright (C) 2020 Fabian Peter Hammerle <fabian@hammerle.me>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import json
+import pathlib
+import subprocess
+import sys
+
+import icalendar
+
+_BENCHMARK_PATH = pathlib.Path(__file__).parent.parent.joinpath(
+    "benchmarks", "benchmark.py"
+)
+
+
+def test_benchmark() -> None:
+    result = subprocess.run(
+        [
+            sys.executable,
+            str(_BENCHMARK_PATH),
+            "--events",
+            "64",
+            "--recurring-share",
+            "0.5",
+            "--changed-share",
+            "0.25",
+            "--",
+            "--jobs",
+            "2",
+        ],
+        check=True,
+        stdout=subprocess.PIPE,
+    )
+    report = json.loads(result.stdout)
+    assert report["parameters"]["ical2vdir_args"] == ["--jobs", "2"]
+    assert report["components"] > 64  # overrides
+    scenarios = report["scenarios"]
+    assert list(scenarios.keys()) == ["cold", "unchanged", "changed", "delete"]
+    (cold_run,) = scenarios["cold"]["runs"]
+    assert cold_run["functions"]["_write_item"]["calls"] == report["components"]
+    (unchanged_run,) = scenarios["unchanged"]["runs"]
+    assert "_write_item" not in unchanged_run["functions"]
+    (changed_run,) = scenarios["changed"]["runs"]
+    assert 0 < changed_run["functions"]["_write_item"]["calls"] < 64
+
+
+def test_generate_calendar_ical() -> None:
+    sys.path.insert(0, str(_BENCHMARK_PATH.parent))
+    try:
+        # pylint: disable=import-outside-toplevel,import-error
+        import benchmark
+    finally:
+        sys.path.pop(0)
+    # pylint: disable=protected-access
+    calendar = icalendar.Calendar.from_ical(
+        benchmark._generate_calendar_ical(
+            benchmark._generate_component_icals(
+                events=32,
+                recurring_share=1,
+                override_share=1,
+                todo_share=0.5,
+                description_size=200,
+                exdates=3,
+                seed=0,
+            )
+        )
+    )
+    names = [c.name for c in calendar.subcomponents]
+    assert names[0] == "VTIMEZONE"
+    assert 0 < names.count("VTODO") < 32
+    assert names.count("VEVENT") == 2 * (32 - names.count("VTODO"))
+    override = next(c for c in calendar.subcomponents if "RECURRENCE-ID" in c)
+    assert override["RECURRENCE-ID"].dt.tzinfo is not None
+    master = next(c for c in calendar.subcomponents if "EXDATE" in c)
+    assert len(master["DESCRIPTION"]) == 200
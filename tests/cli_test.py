@@ -17,6 +17,7 @@
 
 import datetime
 import io
+import json
 import logging
 import pathlib
 import subprocess
@@ -24,8 +25,10 @@ import unittest.mock
 
 import _pytest.logging  # pylint: disable=import-private-name; tests
 import icalendar
+import pytest
 
 import ical2vdir
+import ical2vdir._cli
 
 # pylint: disable=protected-access
 
@@ -42,7 +45,7 @@ def test__main_create_all(
     with unittest.mock.patch("sys.stdin", google_calendar_file):
         with unittest.mock.patch("sys.argv", ["", "--output-dir", str(tmp_path)]):
             with caplog.at_level(logging.INFO):
-                ical2vdir._main()
+                ical2vdir._cli._main()
     created_item_paths = sorted(tmp_path.iterdir())
     assert [p.name for p in created_item_paths] == [
         "1234567890qwertyuiopasdfgh@google.com.ics",
@@ -70,7 +73,7 @@ def test__main_create_all_recurrence_id_date(
         with unittest.mock.patch("sys.stdin", calendar_file), unittest.mock.patch(
             "sys.argv", ["", "--output-dir", str(tmp_path)]
         ), caplog.at_level(logging.WARNING):
-            ical2vdir._main()
+            ical2vdir._cli._main()
     created_item_paths = sorted(tmp_path.iterdir())
     assert [p.name for p in created_item_paths] == [
         "b0fea373-389b-48d5-b739-9de3e298f555.20260101.ics",
@@ -94,7 +97,7 @@ def test__main_create_all_tasks(
         with unittest.mock.patch("sys.stdin", calendar_file), unittest.mock.patch(
             "sys.argv", ["", "--output-dir", str(tmp_path)]
         ), caplog.at_level(logging.WARNING):
-            ical2vdir._main()
+            ical2vdir._cli._main()
     created_item_paths = sorted(tmp_path.iterdir())
     assert [p.name for p in created_item_paths] == [
         "1e6554b1-7ec6-4b58-9688-1dd141ea22cd.ics",
@@ -115,13 +118,13 @@ def test__main_create_some(
 ) -> None:
     with unittest.mock.patch("sys.stdin", google_calendar_file):
         with unittest.mock.patch("sys.argv", ["", "--output-dir", str(tmp_path)]):
-            ical2vdir._main()
+            ical2vdir._cli._main()
             tmp_path.joinpath(
                 "recurr1234567890qwertyuiop@google.com.20150924T090000+0200.ics"
             ).unlink()
             google_calendar_file.seek(0)
             with caplog.at_level(logging.INFO):
-                ical2vdir._main()
+                ical2vdir._cli._main()
     assert len(caplog.records) == 1
     assert caplog.records[0].message.startswith("creating")
     assert caplog.records[0].message.endswith(
@@ -136,7 +139,7 @@ def test__main_update(
 ) -> None:
     with unittest.mock.patch("sys.stdin", google_calendar_file):
         with unittest.mock.patch("sys.argv", ["", "--output-dir", str(tmp_path)]):
-            ical2vdir._main()
+            ical2vdir._cli._main()
             tmp_path.joinpath(
                 "recurr1234567890qwertyuiop@google.com.20150924T090000+0200.ics"
             ).unlink()
@@ -148,7 +151,7 @@ def test__main_update(
                 updated_file.write(updated_ical)
             google_calendar_file.seek(0)
             with caplog.at_level(logging.INFO):
-                ical2vdir._main()
+                ical2vdir._cli._main()
     assert len(caplog.records) == 2
     log_records = sorted(caplog.records, key=lambda r: r.message)
     assert log_records[0].message.startswith("creating")
@@ -170,7 +173,7 @@ def test__main_update_silent(
         with unittest.mock.patch(
             "sys.argv", ["", "--output-dir", str(tmp_path), "--silent"]
         ):
-            ical2vdir._main()
+            ical2vdir._cli._main()
             tmp_path.joinpath(
                 "recurr1234567890qwertyuiop@google.com.20150924T090000+0200.ics"
             ).unlink()
@@ -182,7 +185,7 @@ def test__main_update_silent(
                 updated_file.write(updated_ical)
             google_calendar_file.seek(0)
             with caplog.at_level(logging.INFO):
-                ical2vdir._main()
+                ical2vdir._cli._main()
     assert len(caplog.records) == 0
 
 
@@ -195,7 +198,7 @@ def test__main_update_verbose(
         with unittest.mock.patch(
             "sys.argv", ["", "--output-dir", str(tmp_path), "--verbose"]
         ):
-            ical2vdir._main()
+            ical2vdir._cli._main()
             tmp_path.joinpath(
                 "recurr1234567890qwertyuiop@google.com.20150924T090000+0200.ics"
             ).unlink()
@@ -206,7 +209,7 @@ def test__main_update_verbose(
             with updated_path.open("wb") as updated_file:
                 updated_file.write(updated_ical)
             google_calendar_file.seek(0)
-            ical2vdir._main()
+            ical2vdir._cli._main()
     assert any(
         r.message.endswith("1234567890qwertyuiopasdfgh@google.com.ics is up to date")
         for r in caplog.records
@@ -234,8 +237,289 @@ def test__main_delete(
             "sys.argv", ["", "--output-dir", str(tmp_path), "--delete"]
         ):
             with caplog.at_level(logging.INFO):
-                ical2vdir._main()
+                ical2vdir._cli._main()
     assert len(list(tmp_path.iterdir())) == 3
     assert not any(p.name == "will-be-deleted.ics" for p in tmp_path.iterdir())
-    assert caplog.records[-1].message.startswith("removing")
-    assert caplog.records[-1].message.endswith("will-be-deleted.ics")
+    assert caplog.records[-1].message == "removed 1 items not in input"
+
+
+def test__main_delete_limit_exceeded(
+    caplog: _pytest.logging.LogCaptureFixture,
+    tmp_path: pathlib.Path,
+    google_calendar_file: io.BufferedReader,
+) -> None:
+    tmp_path.joinpath("will-not-be-deleted.ics").touch()
+    with unittest.mock.patch("sys.stdin", google_calendar_file), unittest.mock.patch(
+        "sys.argv",
+        ["", "--output-dir", str(tmp_path), "--delete", "--max-delete-fraction", "0"],
+    ), pytest.raises(SystemExit, match="^1$"):
+        ical2vdir._cli._main()
+    assert tmp_path.joinpath("will-not-be-deleted.ics").exists()
+    assert caplog.records[-1].levelno == logging.ERROR
+    assert caplog.records[-1].message == ("refusing to remove 1 of 1 items (limit: 0%)")
+
+
+def test__main_delete_batch_size_invalid(tmp_path: pathlib.Path) -> None:
+    with unittest.mock.patch(
+        "sys.argv", ["", "--output-dir", str(tmp_path), "--delete-batch-size", "0"]
+    ), pytest.raises(SystemExit):
+        ical2vdir._cli._main()
+
+
+@pytest.mark.parametrize(
+    "calendar_filename",
+    ["google-calendar.ics", "nextcloud-recurring.ics", "nextcloud-tasks.ics"],
+)
+def test__main_stream(tmp_path: pathlib.Path, calendar_filename: str) -> None:
+    calendar_path = pathlib.Path(__file__).parent.joinpath(
+        "resources", calendar_filename
+    )
+    for output_dir_path, stream_args in [
+        (tmp_path.joinpath("default"), []),
+        (tmp_path.joinpath("stream"), ["--stream"]),
+        (tmp_path.joinpath("input"), ["--input", str(calendar_path)]),
+    ]:
+        output_dir_path.mkdir()
+        with calendar_path.open("rb") as calendar_file, unittest.mock.patch(
+            "sys.stdin", calendar_file
+        ), unittest.mock.patch(
+            "sys.argv", ["", "--output-dir", str(output_dir_path)] + stream_args
+        ):
+            ical2vdir._cli._main()
+    default_paths = sorted(tmp_path.joinpath("default").iterdir())
+    for mode in ["stream", "input"]:
+        paths = sorted(tmp_path.joinpath(mode).iterdir())
+        assert [p.name for p in default_paths] == [p.name for p in paths]
+        for default_path, path in zip(default_paths, paths):
+            assert default_path.read_bytes() == path.read_bytes()
+
+
+def test__main_state(
+    caplog: _pytest.logging.LogCaptureFixture,
+    tmp_path: pathlib.Path,
+    google_calendar_file: io.BufferedReader,
+) -> None:
+    with unittest.mock.patch("sys.stdin", google_calendar_file):
+        with unittest.mock.patch(
+            "sys.argv", ["", "--output-dir", str(tmp_path), "--state"]
+        ):
+            ical2vdir._cli._main()
+            state = json.loads(tmp_path.joinpath(".ical2vdir-state").read_bytes())
+            assert state["version"] == 1
+            assert sorted(state["items"].keys()) == [
+                "1234567890qwertyuiopasdfgh@google.com.ics",
+                "recurr1234567890qwertyuiop@google.com.20150908T090000+0200.ics",
+                "recurr1234567890qwertyuiop@google.com.20150924T090000+0200.ics",
+            ]
+            assert (
+                state["items"][
+                    "recurr1234567890qwertyuiop@google.com.20150908T090000+0200.ics"
+                ]["recurrence_id"]
+                == "20150908T090000"
+            )
+            updated_path = tmp_path.joinpath(
+                "recurr1234567890qwertyuiop@google.com.20150908T090000+0200.ics"
+            )
+            updated_path.write_bytes(
+                updated_path.read_bytes().replace(b"20150908", b"20140703")
+            )
+            google_calendar_file.seek(0)
+            caplog.clear()
+            with caplog.at_level(logging.INFO):
+                ical2vdir._cli._main()
+    assert len(caplog.records) == 1
+    assert caplog.records[0].message.startswith("updating")
+    assert caplog.records[0].message.endswith(updated_path.name)
+
+
+def test__main_incremental(
+    tmp_path: pathlib.Path, google_calendar_file: io.BufferedReader
+) -> None:
+    with unittest.mock.patch("sys.stdin", google_calendar_file):
+        with unittest.mock.patch(
+            "sys.argv", ["", "--output-dir", str(tmp_path), "--incremental"]
+        ):
+            ical2vdir._cli._main()
+    state = json.loads(tmp_path.joinpath(".ical2vdir-state").read_bytes())
+    assert len(state["items"]) == 3
+    assert sorted(e["filename"] for e in state["components"].values()) == sorted(
+        state["items"].keys()
+    )
+    assert (
+        state["components"][
+            "UID:recurr1234567890qwertyuiop@google.com\n"
+            "RECURRENCE-ID;TZID=Europe/Vienna:20150908T090000"
+        ]["filename"]
+        == "recurr1234567890qwertyuiop@google.com.20150908T090000+0200.ics"
+    )
+
+
+def test__main_fsync_batch(
+    tmp_path: pathlib.Path, google_calendar_file: io.BufferedReader
+) -> None:
+    with unittest.mock.patch("sys.stdin", google_calendar_file), unittest.mock.patch(
+        "sys.argv", ["", "--output-dir", str(tmp_path), "--fsync", "batch"]
+    ), unittest.mock.patch("os.fsync") as fsync_mock:
+        ical2vdir._cli._main()
+    assert fsync_mock.call_count == 3 + 1  # items + directory
+
+
+def test__main_jobs(
+    caplog: _pytest.logging.LogCaptureFixture, tmp_path: pathlib.Path
+) -> None:
+    calendar_ical = (
+        pathlib.Path(__file__)
+        .parent.joinpath("resources", "google-calendar.ics")
+        .read_bytes()
+    )
+    messages = {}
+    for jobs in ["1", "4"]:
+        output_dir_path = tmp_path.joinpath(jobs)
+        output_dir_path.mkdir()
+        caplog.clear()
+        for _ in range(2):  # create, then compare with pre-existing items
+            with unittest.mock.patch(
+                "sys.stdin", io.BytesIO(calendar_ical)
+            ), unittest.mock.patch(
+                "sys.argv",
+                ["", "--output-dir", str(output_dir_path), "--jobs", jobs, "--verbose"],
+            ):
+                ical2vdir._cli._main()
+        # debug messages include reprs of components (memory addresses)
+        messages[jobs] = [
+            r.message.replace(str(output_dir_path), "")
+            for r in caplog.records
+            if r.levelno >= logging.INFO or r.message.endswith("is up to date")
+        ]
+    assert messages["1"] == messages["4"]
+    assert any(m.startswith("creating") for m in messages["4"])
+    assert any(m.endswith("is up to date") for m in messages["4"])
+    assert sorted(p.name for p in tmp_path.joinpath("1").iterdir()) == sorted(
+        p.name for p in tmp_path.joinpath("4").iterdir()
+    )
+
+
+def test__main_progress_counter(
+    caplog: _pytest.logging.LogCaptureFixture,
+    tmp_path: pathlib.Path,
+    google_calendar_file: io.BufferedReader,
+) -> None:
+    output_dir_path = tmp_path.joinpath("output")
+    output_dir_path.mkdir()
+    output_dir_path.joinpath("will-be-deleted.ics").touch()
+    event_log_path = tmp_path.joinpath("events.jsonl")
+    with unittest.mock.patch("sys.stdin", google_calendar_file), unittest.mock.patch(
+        "sys.argv",
+        [
+            "",
+            "--output-dir",
+            str(output_dir_path),
+            "--delete",
+            "--progress",
+            "counter",
+            "--event-log",
+            str(event_log_path),
+        ],
+    ), caplog.at_level(logging.INFO):
+        ical2vdir._cli._main()
+    assert [r.message for r in caplog.records] == [
+        "removed 1 items not in input",
+        "3 created, 0 updated, 0 unchanged, 1 removed, 1 skipped",
+    ]
+    events = [json.loads(line) for line in event_log_path.read_text().splitlines()]
+    assert [e["action"] for e in events] == ["created"] * 3 + ["removed"]
+    assert events[-1]["path"] == str(output_dir_path.joinpath("will-be-deleted.ics"))
+
+
+def test__main_event_log_batch(tmp_path: pathlib.Path) -> None:
+    with unittest.mock.patch(
+        "sys.argv",
+        ["", "--batch", "manifest.json", "--event-log", str(tmp_path / "e.jsonl")],
+    ), pytest.raises(SystemExit):
+        ical2vdir._cli._main()
+
+
+def test__main_jobs_invalid(tmp_path: pathlib.Path) -> None:
+    with unittest.mock.patch(
+        "sys.argv", ["", "--output-dir", str(tmp_path), "--jobs", "0"]
+    ), pytest.raises(SystemExit):
+        ical2vdir._cli._main()
+
+
+@pytest.mark.parametrize("stream_args", [[], ["--stream"]])
+def test__main_stats_json(
+    capsys: pytest.CaptureFixture[str],
+    tmp_path: pathlib.Path,
+    google_calendar_file: io.BufferedReader,
+    stream_args: list[str],
+) -> None:
+    calendar_size = len(google_calendar_file.read())
+    tmp_path.joinpath("will-be-deleted.ics").touch()
+    stats_list = []
+    for _ in range(2):
+        google_calendar_file.seek(0)
+        with unittest.mock.patch(
+            "sys.stdin", google_calendar_file
+        ), unittest.mock.patch(
+            "sys.argv",
+            ["", "--output-dir", str(tmp_path), "--delete", "--stats", "json"]
+            + stream_args,
+        ):
+            ical2vdir._cli._main()
+        stats_list.append(json.loads(capsys.readouterr().out))
+    created_stats = stats_list[0]
+    unchanged_stats = stats_list[1]
+    assert set(created_stats["seconds"].keys()) == {
+        "parse_input",
+        "scan",
+        "read_items",
+        "compare",
+        "write",
+        "delete",
+        "total",
+    }
+    assert created_stats["seconds"]["total"] > created_stats["seconds"]["write"] > 0
+    created_stats.pop("seconds")
+    item_bytes = created_stats["item_bytes_written"]
+    assert item_bytes > 0
+    assert created_stats == {
+        "created": 3,
+        "updated": 0,
+        "unchanged": 0,
+        "removed": 1,
+        "skipped": 1,  # VTIMEZONE
+        "duplicates": 0,
+        "input_bytes": calendar_size,
+        "item_bytes_read": 0,
+        "item_bytes_written": item_bytes,
+    }
+    unchanged_stats.pop("seconds")
+    assert unchanged_stats == {
+        "created": 0,
+        "updated": 0,
+        "unchanged": 3,
+        "removed": 0,
+        "skipped": 1,
+        "duplicates": 0,
+        "input_bytes": calendar_size,
+        "item_bytes_read": item_bytes,
+        "item_bytes_written": 0,
+    }
+
+
+def test__main_stats_text(
+    capsys: pytest.CaptureFixture[str],
+    tmp_path: pathlib.Path,
+    google_calendar_file: io.BufferedReader,
+) -> None:
+    with unittest.mock.patch("sys.stdin", google_calendar_file), unittest.mock.patch(
+        "sys.argv", ["", "--output-dir", str(tmp_path), "--stats", "--silent"]
+    ):
+        ical2vdir._cli._main()
+    captured = capsys.readouterr()
+    assert not captured.out
+    stats_lines = captured.err.splitlines()
+    assert stats_lines[0].startswith("parse_input: ")
+    assert stats_lines[0].endswith("s")
+    assert "created: 3" in stats_lines
+    assert "skipped: 1" in stats_lines
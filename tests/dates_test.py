@@ -0,0 +1,221 @@
+# ical2vdir - convert .ics file to vdir directory
+#
+# Copyright (C) 2020 Fabian Peter Hammerle <fabian@hammerle.me>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import concurrent.futures
+import contextlib
+import datetime
+import pathlib
+import threading
+import unittest.mock
+import uuid
+
+import icalendar
+import pytest
+
+import ical2vdir
+import ical2vdir._dates
+
+# pylint: disable=protected-access
+
+
+def test__memoized_date_parsing() -> None:
+    from_ical = icalendar.prop.vDDDTypes.from_ical
+    expected = from_ical("20201024T100000", "Europe/Vienna")
+    with ical2vdir._dates._memoized_date_parsing():
+        assert icalendar.prop.vDDDTypes.from_ical is not from_ical
+        value = icalendar.prop.vDDDTypes.from_ical("20201024T100000Z")
+        assert value == datetime.datetime(
+            2020, 10, 24, 10, tzinfo=datetime.timezone.utc
+        )
+        assert icalendar.prop.vDDDTypes.from_ical("20201024T100000Z") is value
+        value = icalendar.prop.vDDDTypes.from_ical("20201024T100000", "Europe/Vienna")
+        assert value == expected
+        assert value.tzinfo == expected.tzinfo
+        assert (
+            icalendar.prop.vDDDTypes.from_ical("20201024T100000", "Europe/Vienna")
+            is value
+        )
+        assert icalendar.prop.vDDDTypes.from_ical("20201024") == datetime.date(
+            2020, 10, 24
+        )
+        assert icalendar.prop.vDDDLists.from_ical(
+            "20201024T100000Z,20201031T100000Z"
+        ) == [
+            datetime.datetime(2020, 10, 24, 10, tzinfo=datetime.timezone.utc),
+            datetime.datetime(2020, 10, 31, 10, tzinfo=datetime.timezone.utc),
+        ]
+        # not memoized
+        vddd = icalendar.prop.vDDDTypes(datetime.date(2020, 10, 24))
+        assert icalendar.prop.vDDDTypes.from_ical(vddd) == datetime.date(2020, 10, 24)
+        with pytest.raises(ValueError, match=r"^Expected datetime"):
+            icalendar.prop.vDDDTypes.from_ical("2020")
+    assert icalendar.prop.vDDDTypes.from_ical == from_ical
+
+
+def _custom_timezone_ical(timezone_id: bytes) -> bytes:
+    return b"\r\n".join(
+        [
+            b"BEGIN:VTIMEZONE",
+            b"TZID:" + timezone_id,
+            b"BEGIN:STANDARD",
+            b"DTSTART:19700101T000000",
+            b"TZOFFSETFROM:+0500",
+            b"TZOFFSETTO:+0500",
+            b"END:STANDARD",
+            b"END:VTIMEZONE",
+            b"",
+        ]
+    )
+
+
+def test__memoized_date_parsing_timezone_defined_later() -> None:
+    # icalendar keeps parsed VTIMEZONEs, unique TZID per run
+    timezone_id = f"Custom Zone {uuid.uuid4()}"
+    with ical2vdir._dates._memoized_date_parsing():
+        value = icalendar.prop.vDDDTypes.from_ical("20200601T100000", timezone_id)
+        assert value.tzinfo is None
+        period = icalendar.prop.vDDDTypes.from_ical("20200601T100000/PT1H", timezone_id)
+        assert period[0].tzinfo is None
+        icalendar.Calendar.from_ical(
+            b"BEGIN:VCALENDAR\r\n"
+            + _custom_timezone_ical(timezone_id.encode())
+            + b"END:VCALENDAR\r\n"
+        )
+        value = icalendar.prop.vDDDTypes.from_ical("20200601T100000", timezone_id)
+        assert value.utcoffset() == datetime.timedelta(hours=5)
+        assert (
+            icalendar.prop.vDDDTypes.from_ical("20200601T100000", timezone_id) is value
+        )
+        period = icalendar.prop.vDDDTypes.from_ical("20200601T100000/PT1H", timezone_id)
+    # icalendar<5 ignores TZID of periods
+    assert period == icalendar.prop.vDDDTypes.from_ical(
+        "20200601T100000/PT1H", timezone_id
+    )
+
+
+def test__memoized_date_parsing_maxsize() -> None:
+    with unittest.mock.patch("ical2vdir._dates._MEMO_MAXSIZE", 2):
+        with ical2vdir._dates._memoized_date_parsing():
+            value = icalendar.prop.vDDDTypes.from_ical("20201024")
+            icalendar.prop.vDDDTypes.from_ical("20201025")
+            assert icalendar.prop.vDDDTypes.from_ical("20201024") is value
+            icalendar.prop.vDDDTypes.from_ical("20201026")  # cleared
+            assert icalendar.prop.vDDDTypes.from_ical("20201024") is not value
+
+
+def test__memoized_date_parsing_concurrent() -> None:
+    from_ical = icalendar.prop.vDDDTypes.from_ical
+    barrier = threading.Barrier(4)
+
+    def parse(_: int) -> datetime.datetime:
+        with ical2vdir._dates._memoized_date_parsing():
+            barrier.wait()
+            value = icalendar.prop.vDDDTypes.from_ical("20201024T100000Z")
+            barrier.wait()
+        assert isinstance(value, datetime.datetime)
+        return value
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+        values = list(executor.map(parse, range(4)))
+    assert len(set(map(id, values))) == 1  # shared memo
+    assert icalendar.prop.vDDDTypes.from_ical == from_ical
+
+
+def test__memoized_date_parsing_other_thread() -> None:
+    started = threading.Event()
+    stop = threading.Event()
+
+    def sync() -> None:
+        with ical2vdir._dates._memoized_date_parsing():
+            started.set()
+            stop.wait()
+
+    thread = threading.Thread(target=sync)
+    thread.start()
+    try:
+        started.wait()
+        # installed, but not memoizing outside of sync
+        assert icalendar.prop.vDDDTypes.from_ical(
+            "20201024T100000Z"
+        ) is not icalendar.prop.vDDDTypes.from_ical("20201024T100000Z")
+    finally:
+        stop.set()
+        thread.join()
+
+
+def _calendar_ical_timezone_defined_later(timezone_id: bytes) -> bytes:
+    return (
+        b"\r\n".join(
+            [
+                b"BEGIN:VCALENDAR",
+                b"BEGIN:VEVENT",
+                b"UID:e1",
+                b"DTSTART;TZID=" + timezone_id + b":20200601T100000",
+                b"RECURRENCE-ID;TZID=" + timezone_id + b":20200601T100000",
+                b"END:VEVENT",
+                b"BEGIN:VEVENT",
+                b"UID:e2",
+                b"DTSTART;TZID=" + timezone_id + b":20200601T100000",
+                b"RECURRENCE-ID;TZID=" + timezone_id + b":20200601T100000",
+                b"END:VEVENT",
+            ]
+        )
+        + b"\r\n"
+        + _custom_timezone_ical(timezone_id)
+        + b"END:VCALENDAR\r\n"
+    )
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_sync_custom_timezone_defined_later(
+    tmp_path: pathlib.Path, stream: bool
+) -> None:
+    # icalendar keeps parsed VTIMEZONEs: unique TZID per run,
+    # compared with a run without memo on the same icalendar version
+    output_path = tmp_path.joinpath("output")
+    output_path.mkdir()
+    result = ical2vdir.sync(
+        _calendar_ical_timezone_defined_later(f"Custom Zone {uuid.uuid4()}".encode()),
+        output_path,
+        stream=stream,
+    )
+    expected_path = tmp_path.joinpath("expected")
+    expected_path.mkdir()
+    with unittest.mock.patch(
+        "ical2vdir._memoized_date_parsing", contextlib.nullcontext
+    ):
+        expected = ical2vdir.sync(
+            _calendar_ical_timezone_defined_later(
+                f"Custom Zone {uuid.uuid4()}".encode()
+            ),
+            expected_path,
+            stream=stream,
+        )
+    assert sorted(p.name for p in result.created) == sorted(
+        p.name for p in expected.created
+    )
+
+
+def test_sync_memoized_date_parsing(tmp_path: pathlib.Path) -> None:
+    calendar_ical = (
+        pathlib.Path(__file__)
+        .parent.joinpath("resources", "google-calendar.ics")
+        .read_bytes()
+    )
+    from_ical = icalendar.prop.vDDDTypes.from_ical
+    result = ical2vdir.sync(calendar_ical, tmp_path, stream=True)
+    assert len(result.created) == 3
+    assert icalendar.prop.vDDDTypes.from_ical == from_ical
@@ -20,6 +20,7 @@ import datetime
 import pytest
 
 import ical2vdir
+import ical2vdir._common
 
 _CEST = datetime.timezone(datetime.timedelta(hours=+2))
 
@@ -38,4 +39,4 @@ def test__datetime_basic_isoformat(
     dt_obj: datetime.datetime, expected_str: str
 ) -> None:
     # pylint: disable=protected-access
-    assert ical2vdir._datetime_basic_isoformat(dt_obj) == expected_str
+    assert ical2vdir._common._datetime_basic_isoformat(dt_obj) == expected_str
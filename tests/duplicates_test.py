@@ -0,0 +1,129 @@
+# ical2vdir - convert .ics file to vdir directory
+#
+# Copyright (C) 2020 Fabian Peter Hammerle <fabian@hammerle.me>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import logging
+import pathlib
+
+import icalendar
+import pytest
+
+import ical2vdir
+import ical2vdir._duplicates
+
+# pylint: disable=protected-access
+
+
+def _event_ical(summary: str, extra_lines: str = "") -> bytes:
+    return (
+        "BEGIN:VEVENT\r\n"
+        f"SUMMARY:{summary}\r\n"
+        "DTSTART:20260301T100000Z\r\n"
+        "DTSTAMP:20260201T100000Z\r\n"
+        "UID:duplicate@example.com\r\n"
+        f"{extra_lines}"
+        "END:VEVENT\r\n"
+    ).encode()
+
+
+def _calendar_ical(*event_icals: bytes) -> bytes:
+    return (
+        b"BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:-//test//EN\r\n"
+        + b"".join(event_icals)
+        + b"BEGIN:VEVENT\r\nUID:other@example.com\r\nDTSTAMP:20260201T100000Z\r\n"
+        b"SUMMARY:other\r\nEND:VEVENT\r\nEND:VCALENDAR\r\n"
+    )
+
+
+@pytest.mark.parametrize(
+    ("extra_lines", "expected_precedence"),
+    [
+        ("", (0, float("-inf"))),
+        ("SEQUENCE:2\r\n", (2, float("-inf"))),
+        ("LAST-MODIFIED:20260101T000000Z\r\n", (0, 1767225600.0)),
+        ("LAST-MODIFIED:20260101T000000\r\n", (0, 1767225600.0)),  # floating
+        ("SEQUENCE:1\r\nLAST-MODIFIED:20260101\r\n", (1, float("-inf"))),
+    ],
+)
+def test__precedence(extra_lines: str, expected_precedence: tuple[int, float]) -> None:
+    event = icalendar.cal.Component.from_ical(_event_ical("test", extra_lines))
+    assert ical2vdir._duplicates._precedence(event) == expected_precedence
+
+
+_OLD_EVENT_ICAL = _event_ical("old", "SEQUENCE:1\r\n")
+_CHANGED_EVENT_ICAL = _event_ical(
+    "changed", "SEQUENCE:2\r\nLAST-MODIFIED:20260101T000000Z\r\n"
+)
+_NEW_EVENT_ICAL = _event_ical("new", "SEQUENCE:2\r\nLAST-MODIFIED:20260102T000000Z\r\n")
+
+
+@pytest.mark.parametrize("stream", [False, True])
+@pytest.mark.parametrize(
+    "event_icals",
+    [
+        (_NEW_EVENT_ICAL, _OLD_EVENT_ICAL, _CHANGED_EVENT_ICAL),
+        (_OLD_EVENT_ICAL, _CHANGED_EVENT_ICAL, _NEW_EVENT_ICAL),
+        (_CHANGED_EVENT_ICAL, _NEW_EVENT_ICAL, _OLD_EVENT_ICAL),
+    ],
+)
+def test_sync_duplicates(
+    caplog: pytest.LogCaptureFixture,
+    tmp_path: pathlib.Path,
+    event_icals: tuple[bytes, ...],
+    stream: bool,
+) -> None:
+    with caplog.at_level(logging.INFO):
+        result = ical2vdir.sync(_calendar_ical(*event_icals), tmp_path, stream=stream)
+    item_path = tmp_path.joinpath("duplicate@example.com.ics")
+    assert b"SUMMARY:new\r\n" in item_path.read_bytes()
+    assert result.stats["duplicates"] == 2
+    assert (
+        "2 components with UID & RECURRENCE-ID of a previous component"
+        in caplog.messages
+    )
+    if not stream:  # synced once
+        assert result.created == [item_path, tmp_path.joinpath("other@example.com.ics")]
+        assert not result.updated
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_sync_duplicates_jobs(tmp_path: pathlib.Path, stream: bool) -> None:
+    # sequential & concurrent sync result in equal items
+    calendar_ical = _calendar_ical(
+        _event_ical("high", "SEQUENCE:2\r\n"), _event_ical("low", "SEQUENCE:1\r\n")
+    )
+    results = {}
+    for jobs in (1, 4):
+        output_dir_path = tmp_path.joinpath(str(jobs))
+        output_dir_path.mkdir()
+        results[jobs] = ical2vdir.sync(
+            calendar_ical, output_dir_path, stream=stream, jobs=jobs
+        )
+        assert (
+            b"SUMMARY:high\r\n"
+            in output_dir_path.joinpath("duplicate@example.com.ics").read_bytes()
+        )
+    assert results[1].stats["duplicates"] == results[4].stats["duplicates"] == 1
+
+
+def test_sync_duplicates_calendar(tmp_path: pathlib.Path) -> None:
+    calendar = icalendar.Calendar.from_ical(
+        _calendar_ical(_NEW_EVENT_ICAL, _OLD_EVENT_ICAL)
+    )
+    result = ical2vdir.sync(calendar, tmp_path)
+    assert len(result.created) == 2
+    assert result.stats["duplicates"] == 1
+    assert len(calendar.subcomponents) == 3  # unchanged
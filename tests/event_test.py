@@ -217,3 +217,70 @@ def test__events_equal(
     event_b = icalendar.cal.Event.from_ical(event_b_ical)
     # pylint: disable=protected-access
     assert ical2vdir._events_equal(event_a, event_b) == expected_result
+    if ical2vdir._ical_digest(ical2vdir._event_ical(event_a)) == ical2vdir._ical_digest(
+        ical2vdir._event_ical(event_b)
+    ):
+        assert expected_result
+
+
+_DIGEST_EVENT_ICAL = b"""BEGIN:VEVENT\r
+SUMMARY:party\r
+DTSTART:20201024T100000Z\r
+DTSTAMP:20200205T160640Z\r
+UID:123456789@google.com\r
+DESCRIPTION:long description\r
+END:VEVENT\r
+"""
+
+
+@pytest.mark.parametrize(
+    ("event_b_ical", "expected_result"),
+    [
+        (_DIGEST_EVENT_ICAL, True),
+        (_DIGEST_EVENT_ICAL.replace(b"\r\n", b"\n"), True),
+        (_DIGEST_EVENT_ICAL.replace(b"20200205T160640Z", b"20260101T000000Z"), True),
+        (
+            _DIGEST_EVENT_ICAL.replace(b"long description", b"long\r\n  description"),
+            True,
+        ),
+        (_DIGEST_EVENT_ICAL.replace(b"DTSTAMP:", b"DTSTAMP;X-TEST=1:"), True),
+        (_DIGEST_EVENT_ICAL.replace(b"party", b"meeting"), False),
+        (
+            _DIGEST_EVENT_ICAL.replace(b"long description", b"long\r\n description"),
+            False,
+        ),
+        (_DIGEST_EVENT_ICAL.replace(b"DTSTART:20201024T100000Z\r\n", b""), False),
+    ],
+)
+def test__ical_digest(event_b_ical: bytes, expected_result: bool) -> None:
+    # pylint: disable=protected-access
+    assert (
+        ical2vdir._ical_digest(_DIGEST_EVENT_ICAL)
+        == ical2vdir._ical_digest(event_b_ical)
+    ) == expected_result
+
+
+@pytest.mark.parametrize(
+    ("event_b_ical", "expected_result"),
+    [
+        (_DIGEST_EVENT_ICAL, True),
+        (_DIGEST_EVENT_ICAL.replace(b"20200205T160640Z", b"20260101T000000Z"), True),
+        (_DIGEST_EVENT_ICAL.replace(b"DTSTAMP:", b"dtstamp;X-TEST=1:"), True),
+        (_DIGEST_EVENT_ICAL.replace(b"DTSTAMP:20200205T160640Z\r\n", b""), True),
+        (_DIGEST_EVENT_ICAL.replace(b"party", b"meeting"), False),
+        # equal digests, but differing bytes
+        (_DIGEST_EVENT_ICAL.replace(b"\r\n", b"\n"), False),
+        (
+            _DIGEST_EVENT_ICAL.replace(b"long description", b"long\r\n  description"),
+            False,
+        ),
+    ],
+)
+def test__icals_equal_ignoring_dtstamp(
+    event_b_ical: bytes, expected_result: bool
+) -> None:
+    # pylint: disable=protected-access
+    assert (
+        ical2vdir._icals_equal_ignoring_dtstamp(_DIGEST_EVENT_ICAL, event_b_ical)
+        == expected_result
+    )
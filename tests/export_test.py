@@ -0,0 +1,307 @@
+# ical2vdir - convert .ics file to vdir directory
+#
+# Copyright (C) 2020 Fabian Peter Hammerle <fabian@hammerle.me>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import io
+import logging
+import pathlib
+import typing
+import unittest.mock
+
+import _pytest.capture  # pylint: disable=import-private-name; tests
+import _pytest.logging  # pylint: disable=import-private-name; tests
+import icalendar
+import pytest
+
+import ical2vdir
+import ical2vdir._cli
+import ical2vdir._export
+
+# pylint: disable=protected-access
+
+_GOOGLE_CALENDAR_PATH = pathlib.Path(__file__).parent.joinpath(
+    "resources", "google-calendar.ics"
+)
+
+_TIMEZONE_ICAL = (
+    b"BEGIN:VTIMEZONE\r\nTZID:Europe/Vienna\r\n"
+    b"BEGIN:STANDARD\r\nDTSTART:19701025T030000\r\n"
+    b"TZOFFSETFROM:+0200\r\nTZOFFSETTO:+0100\r\nEND:STANDARD\r\n"
+    b"END:VTIMEZONE\r\n"
+)
+
+
+def _generated_timezone_ical(timezone_id: str) -> bytes:
+    # icalendar<6 does not generate VTIMEZONE components
+    if not hasattr(icalendar.Timezone, "from_tzid"):
+        return b""
+    return typing.cast(bytes, icalendar.Timezone.from_tzid(timezone_id).to_ical())
+
+
+def _export(output_dir_path: pathlib.Path, jobs: int = 1) -> bytes:
+    output = io.BytesIO()
+    ical2vdir._export._export(output_dir_path, output, jobs=jobs)
+    return output.getvalue()
+
+
+def _item_ical(uid: str) -> bytes:
+    return (
+        b"BEGIN:VCALENDAR\nVERSION:2.0\nPRODID:-//other//EN\n"
+        + _TIMEZONE_ICAL.replace(b"\r\n", b"\n")
+        + b"BEGIN:VEVENT\nUID:"
+        + uid.encode()
+        + b"\nDTSTART;TZID=Europe/Vienna:20200101T100000\nEND:VEVENT\n"
+        + b"END:VCALENDAR\n"
+    )
+
+
+@pytest.mark.parametrize("layout", ["flat", "sharded"])
+@pytest.mark.parametrize("jobs", [1, 2])
+def test__export(tmp_path: pathlib.Path, layout: str, jobs: int) -> None:
+    ical2vdir.sync(_GOOGLE_CALENDAR_PATH.read_bytes(), tmp_path, layout=layout)
+    exported = _export(tmp_path, jobs=jobs)
+    item_paths = sorted(tmp_path.glob("*.ics"))
+    assert len(item_paths) == 3
+    assert exported == (
+        ical2vdir._export._CALENDAR_HEADER
+        + b"".join(p.read_bytes() for p in item_paths)
+        + _generated_timezone_ical("Europe/Vienna")
+        + ical2vdir._export._CALENDAR_FOOTER
+    )
+    calendar = icalendar.Calendar.from_ical(exported)
+    assert sorted(str(e["UID"]) for e in calendar.walk("VEVENT")) == sorted(
+        str(e["UID"])
+        for e in icalendar.Calendar.from_ical(_GOOGLE_CALENDAR_PATH.read_bytes()).walk(
+            "VEVENT"
+        )
+    )
+    # round trip
+    other_path = tmp_path.joinpath("other")
+    other_path.mkdir()
+    result = ical2vdir.sync(exported, other_path)
+    assert sorted(p.name for p in result.created) == [p.name for p in item_paths]
+
+
+def test__export_empty(tmp_path: pathlib.Path) -> None:
+    assert (
+        _export(tmp_path)
+        == b"BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:-//ical2vdir//EN\r\nEND:VCALENDAR\r\n"
+    )
+
+
+def test__export_timezones(
+    tmp_path: pathlib.Path, caplog: _pytest.logging.LogCaptureFixture
+) -> None:
+    tmp_path.joinpath("a.ics").write_bytes(_item_ical("a"))
+    tmp_path.joinpath("b.ics").write_bytes(_item_ical("b"))
+    # without TZID
+    tmp_path.joinpath("c.ics").write_bytes(
+        b"BEGIN:VCALENDAR\r\nBEGIN:VTIMEZONE\r\nEND:VTIMEZONE\r\n"
+        b"BEGIN:VTIMEZONE\r\nEND:VTIMEZONE\r\nEND:VCALENDAR\r\n"
+    )
+    # without trailing line break
+    tmp_path.joinpath("d.ics").write_bytes(b"BEGIN:VTODO\r\nUID:d\r\nEND:VTODO")
+    tmp_path.joinpath("e.ics").write_bytes(b"")
+    tmp_path.joinpath("f.ics").write_bytes(b"BEGIN:VCALENDAR\r\n")
+    tmp_path.joinpath("not-an-item.txt").write_bytes(b"BEGIN:VTODO\r\nEND:VTODO\r\n")
+    with caplog.at_level(logging.WARNING):
+        exported = _export(tmp_path, jobs=2)
+    assert exported == (
+        ical2vdir._export._CALENDAR_HEADER
+        + _TIMEZONE_ICAL.replace(b"\r\n", b"\n")
+        + b"BEGIN:VEVENT\nUID:a\nDTSTART;TZID=Europe/Vienna:20200101T100000\nEND:VEVENT\n"
+        + b"BEGIN:VEVENT\nUID:b\nDTSTART;TZID=Europe/Vienna:20200101T100000\nEND:VEVENT\n"
+        + b"BEGIN:VTIMEZONE\r\nEND:VTIMEZONE\r\n"
+        + b"BEGIN:VTODO\r\nUID:d\r\nEND:VTODO\r\n"
+        + ical2vdir._export._CALENDAR_FOOTER
+    )
+    assert caplog.record_tuples == [
+        (
+            "ical2vdir._export",
+            logging.WARNING,
+            f"ignoring item {tmp_path.joinpath('e.ics')} without component",
+        ),
+        (
+            "ical2vdir._export",
+            logging.WARNING,
+            f"ignoring invalid item {tmp_path.joinpath('f.ics')}:"
+            " unexpected end of input, VCALENDAR was not closed",
+        ),
+    ]
+
+
+def test__referenced_timezone_ids() -> None:
+    assert ical2vdir._export._referenced_timezone_ids(
+        b"BEGIN:VEVENT\r\nUID:a\r\n"
+        b"DTSTART;VALUE=DATE-TIME;TZID=Europe/Vienna:20200101T100000\r\n"
+        b'DTEND;TZID="America/New_York":20200101T100000\r\n'
+        b"RDATE;tzid=Asia/\r\n Tokyo:20200101T100000\r\n"
+        b'EXDATE;X-LINK="a:b;c";TZID=Europe/Berlin:20200101T100000\r\n'
+        b"DESCRIPTION:DTSTART\\;TZID=Ignored\r\n"
+        b"END:VEVENT\r\n"
+    ) == {b"Europe/Vienna", b"America/New_York", b"Asia/Tokyo", b"Europe/Berlin"}
+
+
+@pytest.mark.skipif(not hasattr(icalendar.Timezone, "from_tzid"), reason="icalendar<6")
+def test__export_generated_timezones(
+    tmp_path: pathlib.Path, caplog: _pytest.logging.LogCaptureFixture
+) -> None:
+    item_ical = (
+        b"BEGIN:VEVENT\r\nUID:a\r\n"
+        b"DTSTART;TZID=Europe/Vienna:20200101T100000\r\n"
+        b"DTEND;TZID=Unknown/Zone:20200101T110000\r\n"
+        b"END:VEVENT\r\n"
+    )
+    tmp_path.joinpath("a.ics").write_bytes(item_ical)
+    with caplog.at_level(logging.WARNING):
+        exported = _export(tmp_path)
+    assert exported == (
+        ical2vdir._export._CALENDAR_HEADER
+        + item_ical
+        + _generated_timezone_ical("Europe/Vienna")
+        + ical2vdir._export._CALENDAR_FOOTER
+    )
+    assert len(caplog.records) == 1
+    assert caplog.records[0].message.startswith("missing VTIMEZONE Unknown/Zone: ")
+    calendar = icalendar.Calendar.from_ical(exported)
+    assert [str(t["TZID"]) for t in calendar.walk("VTIMEZONE")] == ["Europe/Vienna"]
+
+
+def test__export_generated_timezones_unsupported(
+    tmp_path: pathlib.Path, caplog: _pytest.logging.LogCaptureFixture
+) -> None:
+    item_ical = (
+        b"BEGIN:VEVENT\r\nUID:a\r\n"
+        b"DTSTART;TZID=Europe/Vienna:20200101T100000\r\n"
+        b"END:VEVENT\r\n"
+    )
+    tmp_path.joinpath("a.ics").write_bytes(item_ical)
+    with unittest.mock.patch.object(
+        icalendar.Timezone, "from_tzid", None, create=True
+    ), caplog.at_level(logging.WARNING):
+        exported = _export(tmp_path)
+    assert exported == (
+        ical2vdir._export._CALENDAR_HEADER
+        + item_ical
+        + ical2vdir._export._CALENDAR_FOOTER
+    )
+    assert caplog.messages == [
+        "missing VTIMEZONE Europe/Vienna (generating requires icalendar>=6)"
+    ]
+
+
+def test__export_removed_since_listed(tmp_path: pathlib.Path) -> None:
+    ical2vdir.sync(_GOOGLE_CALENDAR_PATH.read_bytes(), tmp_path)
+    item_paths = sorted(tmp_path.glob("*.ics"))
+    item_icals = [p.read_bytes() for p in item_paths]
+    read_item = ical2vdir._export._read_item
+
+    def read_item_after_removal(path: pathlib.Path) -> list[bytes]:
+        item_paths[1].unlink(missing_ok=True)
+        return read_item(path)
+
+    with unittest.mock.patch(
+        "ical2vdir._export._read_item", side_effect=read_item_after_removal
+    ):
+        exported = _export(tmp_path)
+    assert exported == (
+        ical2vdir._export._CALENDAR_HEADER
+        + item_icals[0]
+        + item_icals[2]
+        + _generated_timezone_ical("Europe/Vienna")
+        + ical2vdir._export._CALENDAR_FOOTER
+    )
+
+
+def _cache_paths(output_dir_path: pathlib.Path) -> list[pathlib.Path]:
+    return list(output_dir_path.glob(".ical2vdir-export-*"))
+
+
+def test__export_cached(tmp_path: pathlib.Path) -> None:
+    calendar_ical = _GOOGLE_CALENDAR_PATH.read_bytes()
+    ical2vdir.sync(calendar_ical, tmp_path, state=True)
+    exported = _export(tmp_path)
+    (cache_path,) = _cache_paths(tmp_path)
+    assert cache_path.read_bytes() == exported
+    assert not list(tmp_path.glob(".ical2vdir-*.tmp"))
+    with unittest.mock.patch("ical2vdir._export._read_item") as read_item_mock:
+        assert _export(tmp_path, jobs=2) == exported
+    read_item_mock.assert_not_called()
+    # modified by another process
+    item_path = sorted(tmp_path.glob("*.ics"))[0]
+    item_path.write_bytes(
+        item_path.read_bytes().replace(b"SUMMARY:", b"SUMMARY:changed ")
+    )
+    changed_exported = _export(tmp_path)
+    assert b"SUMMARY:changed " in changed_exported
+    assert _cache_paths(tmp_path) == [cache_path]
+    # synced again, previous export removed
+    ical2vdir.sync(
+        calendar_ical.replace(b"SUMMARY:simple", b"SUMMARY:updated"),
+        tmp_path,
+        state=True,
+    )
+    exported = _export(tmp_path)
+    assert b"SUMMARY:updated" in exported
+    assert _cache_paths(tmp_path) != [cache_path]
+    (cache_path,) = _cache_paths(tmp_path)
+    assert cache_path.read_bytes() == exported
+    # item not in index
+    tmp_path.joinpath("other.ics").write_bytes(b"BEGIN:VTODO\r\nEND:VTODO\r\n")
+    assert b"BEGIN:VTODO\r\nEND:VTODO\r\n" in _export(tmp_path)
+    assert _cache_paths(tmp_path) == [cache_path]
+
+
+def test__export_cache_failed(tmp_path: pathlib.Path) -> None:
+    ical2vdir.sync(_GOOGLE_CALENDAR_PATH.read_bytes(), tmp_path, state=True)
+    with unittest.mock.patch(
+        "tempfile.mkstemp", side_effect=PermissionError("read-only")
+    ):
+        exported = _export(tmp_path)
+    assert exported.count(b"BEGIN:VEVENT") == 3
+    assert not _cache_paths(tmp_path)
+    with unittest.mock.patch(
+        "ical2vdir._export._read_item", side_effect=OSError("read failed")
+    ), pytest.raises(OSError, match=r"^read failed$"):
+        _export(tmp_path)
+    assert not list(tmp_path.glob(".ical2vdir-*"))[1:]  # index only
+
+
+def test__main_export(
+    tmp_path: pathlib.Path, capsysbinary: _pytest.capture.CaptureFixture[bytes]
+) -> None:
+    ical2vdir.sync(_GOOGLE_CALENDAR_PATH.read_bytes(), tmp_path)
+    with unittest.mock.patch(
+        "sys.argv", ["", "--export", "--output-dir", str(tmp_path), "--jobs", "2"]
+    ):
+        ical2vdir._cli._main()
+    assert capsysbinary.readouterr().out == _export(tmp_path)
+
+
+@pytest.mark.parametrize(
+    "args",
+    [["--delete"], ["--dry-run"], ["--batch", "manifest.toml"]],
+)
+def test__main_export_invalid(
+    args: list[str], capsys: _pytest.capture.CaptureFixture[str]
+) -> None:
+    with unittest.mock.patch("sys.argv", ["", "--export"] + args), pytest.raises(
+        SystemExit
+    ):
+        ical2vdir._cli._main()
+    assert capsys.readouterr().err.endswith(
+        "error: --export does not support --batch, --delete & --dry-run\n"
+    )
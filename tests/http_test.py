@@ -0,0 +1,163 @@
+# ical2vdir - convert .ics file to vdir directory
+#
+# Copyright (C) 2020 Fabian Peter Hammerle <fabian@hammerle.me>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import http.server
+import json
+import pathlib
+import threading
+import typing
+import unittest.mock
+import urllib.error
+
+import pytest
+
+import ical2vdir
+import ical2vdir._cli
+import ical2vdir._http
+
+# pylint: disable=protected-access
+
+_GOOGLE_CALENDAR_PATH = pathlib.Path(__file__).parent.joinpath(
+    "resources", "google-calendar.ics"
+)
+_ETAG = '"v1"'
+_LAST_MODIFIED = "Wed, 05 Feb 2020 16:06:40 GMT"
+
+
+class _CalendarRequestHandler(http.server.BaseHTTPRequestHandler):
+
+    requests: list[dict[str, str]] = []
+
+    def do_GET(self) -> None:  # pylint: disable=invalid-name
+        self.requests.append(dict(self.headers))
+        if self.path == "/error.html":  # e.g. captive portal
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html")
+            self.end_headers()
+            self.wfile.write(b"<html>error</html>\n")
+            return
+        if self.path != "/calendar.ics":
+            self.send_error(404)
+            return
+        if self.headers.get("If-None-Match") == _ETAG:
+            self.send_response(304)
+            self.end_headers()
+            return
+        calendar_ical = _GOOGLE_CALENDAR_PATH.read_bytes()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/calendar")
+        self.send_header("Content-Length", str(len(calendar_ical)))
+        self.send_header("ETag", _ETAG)
+        self.send_header("Last-Modified", _LAST_MODIFIED)
+        self.end_headers()
+        self.wfile.write(calendar_ical)
+
+    def log_message(self, *args: typing.Any) -> None:
+        pass
+
+
+@pytest.fixture(name="server_url")
+def _server_url_fixture() -> typing.Iterator[str]:
+    _CalendarRequestHandler.requests = []
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _CalendarRequestHandler)
+    thread = threading.Thread(
+        target=server.serve_forever, kwargs={"poll_interval": 0.01}
+    )
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}"
+    finally:
+        server.shutdown()
+        thread.join()
+        server.server_close()
+
+
+def test__sync_url(tmp_path: pathlib.Path, server_url: str) -> None:
+    url = server_url + "/calendar.ics"
+    result = ical2vdir._http._sync_url(url, tmp_path, delete=True, fsync="batch")
+    assert len(result.created) == 3
+    assert json.loads(tmp_path.joinpath(".ical2vdir-http").read_bytes()) == {
+        "url": url,
+        "etag": _ETAG,
+        "last_modified": _LAST_MODIFIED,
+    }
+    assert "If-None-Match" not in _CalendarRequestHandler.requests[0]
+    with unittest.mock.patch("ical2vdir.sync") as sync_mock:
+        result = ical2vdir._http._sync_url(url, tmp_path, delete=True)
+    sync_mock.assert_not_called()
+    assert not result.created and not result.unchanged
+    assert result.stats["created"] == 0
+    assert _CalendarRequestHandler.requests[1]["If-None-Match"] == _ETAG
+    assert _CalendarRequestHandler.requests[1]["If-Modified-Since"] == _LAST_MODIFIED
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        ".ical2vdir-http",
+        "1234567890qwertyuiopasdfgh@google.com.ics",
+        "recurr1234567890qwertyuiop@google.com.20150908T090000+0200.ics",
+        "recurr1234567890qwertyuiop@google.com.20150924T090000+0200.ics",
+    ]
+
+
+def test__sync_url_dry_run(tmp_path: pathlib.Path, server_url: str) -> None:
+    url = server_url + "/calendar.ics"
+    result = ical2vdir._http._sync_url(url, tmp_path, dry_run=True)
+    assert result.plan is not None and len(result.plan["items"]) == 3
+    assert not list(tmp_path.iterdir())  # neither items nor validators
+    ical2vdir._http._sync_url(url, tmp_path)
+    result = ical2vdir._http._sync_url(url, tmp_path, dry_run=True)
+    assert result.plan is not None and not result.plan["items"]  # not modified
+
+
+def test__sync_url_other_url(tmp_path: pathlib.Path, server_url: str) -> None:
+    tmp_path.joinpath(".ical2vdir-http").write_text(
+        json.dumps({"url": "https://example.com/", "etag": _ETAG})
+    )
+    result = ical2vdir._http._sync_url(server_url + "/calendar.ics", tmp_path)
+    assert len(result.created) == 3
+    assert "If-None-Match" not in _CalendarRequestHandler.requests[0]
+
+
+def test__sync_url_invalid_validators(
+    caplog: pytest.LogCaptureFixture, tmp_path: pathlib.Path, server_url: str
+) -> None:
+    tmp_path.joinpath(".ical2vdir-http").write_text("{")
+    result = ical2vdir._http._sync_url(server_url + "/calendar.ics", tmp_path)
+    assert len(result.created) == 3
+    assert caplog.records[0].message.startswith("ignoring invalid")
+
+
+def test__sync_url_not_found(tmp_path: pathlib.Path, server_url: str) -> None:
+    with pytest.raises(urllib.error.HTTPError, match=r"Not Found"):
+        ical2vdir._http._sync_url(server_url + "/missing.ics", tmp_path)
+    assert not list(tmp_path.iterdir())
+
+
+def test__main_url(tmp_path: pathlib.Path, server_url: str) -> None:
+    with unittest.mock.patch(
+        "sys.argv",
+        ["", "--output-dir", str(tmp_path), "--url", server_url + "/calendar.ics"],
+    ):
+        ical2vdir._cli._main()
+    assert len(list(tmp_path.glob("*.ics"))) == 3
+
+
+def test__sync_url_not_calendar_delete(tmp_path: pathlib.Path, server_url: str) -> None:
+    ical2vdir._http._sync_url(server_url + "/calendar.ics", tmp_path)
+    names = sorted(p.name for p in tmp_path.iterdir())
+    with pytest.raises(
+        ValueError, match=r"^input does not start with BEGIN:VCALENDAR$"
+    ):
+        ical2vdir._http._sync_url(server_url + "/error.html", tmp_path, delete=True)
+    assert sorted(p.name for p in tmp_path.iterdir()) == names
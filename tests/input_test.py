@@ -0,0 +1,123 @@
+# ical2vdir - convert .ics file to vdir directory
+#
+# Copyright (C) 2020 Fabian Peter Hammerle <fabian@hammerle.me>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import hashlib
+import io
+import pathlib
+
+import pytest
+
+import ical2vdir
+import ical2vdir._input
+
+# pylint: disable=protected-access
+
+_GOOGLE_CALENDAR_PATH = pathlib.Path(__file__).parent.joinpath(
+    "resources", "google-calendar.ics"
+)
+
+
+def test__iter_paths_component_icals() -> None:
+    with _GOOGLE_CALENDAR_PATH.open("rb") as calendar_file:
+        assert list(
+            ical2vdir._input._iter_paths_component_icals([_GOOGLE_CALENDAR_PATH])
+        ) == list(ical2vdir._input._iter_component_icals(calendar_file))
+
+
+@pytest.mark.parametrize("line_break", [b"\r\n", b"\n"])
+def test__iter_mapped_component_icals_nested(line_break: bytes) -> None:
+    calendar_ical = line_break.join(
+        [
+            b"BEGIN:VCALENDAR",
+            b"VERSION:2.0",
+            b"BEGIN:VEVENT",
+            b"UID:a",
+            b"DESCRIPTION:folded",
+            b" END:VEVENT",
+            b"BEGIN:VALARM",
+            b"ACTION:DISPLAY",
+            b"END:VALARM",
+            b"END:VEVENT",
+            b"begin:vtodo",
+            b"UID:b",
+            b"end:vtodo",
+            b"END:VCALENDAR",
+        ]
+    )
+    assert list(ical2vdir._input._iter_mapped_component_icals(calendar_ical)) == list(
+        ical2vdir._input._iter_component_icals(io.BytesIO(calendar_ical))
+    )
+
+
+def test__iter_mapped_component_icals_truncated() -> None:
+    component_icals = ical2vdir._input._iter_mapped_component_icals(
+        b"BEGIN:VCALENDAR\r\nBEGIN:VEVENT\r\nUID:a\r\n"
+    )
+    with pytest.raises(ValueError, match=r"^unexpected end of input"):
+        list(component_icals)
+
+
+def test__iter_mapped_component_icals_truncated_between_components() -> None:
+    component_icals = ical2vdir._input._iter_mapped_component_icals(
+        b"BEGIN:VCALENDAR\nBEGIN:VEVENT\nUID:a\nEND:VEVENT\n"
+    )
+    assert next(component_icals) == b"BEGIN:VEVENT\nUID:a\nEND:VEVENT\n"
+    with pytest.raises(
+        ValueError, match=r"^unexpected end of input, VCALENDAR was not closed$"
+    ):
+        next(component_icals)
+
+
+def test_sync_input_truncated_delete(tmp_path: pathlib.Path) -> None:
+    output_dir_path = tmp_path.joinpath("output")
+    output_dir_path.mkdir()
+    ical2vdir.sync([_GOOGLE_CALENDAR_PATH], output_dir_path)
+    item_names = sorted(p.name for p in output_dir_path.iterdir())
+    assert len(item_names) == 3
+    calendar_ical = _GOOGLE_CALENDAR_PATH.read_bytes()
+    truncated_path = tmp_path.joinpath("truncated.ics")
+    truncated_path.write_bytes(
+        calendar_ical[: calendar_ical.index(b"END:VEVENT\n") + 11]
+    )
+    with pytest.raises(ValueError, match=r"VCALENDAR was not closed$"):
+        ical2vdir.sync([truncated_path], output_dir_path, delete=True)
+    assert sorted(p.name for p in output_dir_path.iterdir()) == item_names
+
+
+def test__paths_digest(tmp_path: pathlib.Path) -> None:
+    empty_path = tmp_path.joinpath("empty.ics")
+    empty_path.touch()
+    assert (
+        ical2vdir._input._paths_digest([_GOOGLE_CALENDAR_PATH, empty_path])
+        == hashlib.sha256(_GOOGLE_CALENDAR_PATH.read_bytes()).hexdigest()
+    )
+
+
+@pytest.mark.parametrize("ical", [b"", b"<html>error</html>\n"])
+def test_sync_input_not_calendar_delete(tmp_path: pathlib.Path, ical: bytes) -> None:
+    output_dir_path = tmp_path.joinpath("output")
+    output_dir_path.mkdir()
+    ical2vdir.sync([_GOOGLE_CALENDAR_PATH], output_dir_path)
+    item_names = sorted(p.name for p in output_dir_path.iterdir())
+    input_path = tmp_path.joinpath("input.ics")
+    input_path.write_bytes(ical)
+    with pytest.raises(ValueError, match=r"VCALENDAR"):
+        ical2vdir.sync([input_path], output_dir_path, delete=True)
+    with pytest.raises(ValueError, match=r"VCALENDAR"):
+        ical2vdir.sync(
+            [_GOOGLE_CALENDAR_PATH, input_path], output_dir_path, delete=True
+        )
+    assert sorted(p.name for p in output_dir_path.iterdir()) == item_names
@@ -0,0 +1,346 @@
+# ical2vdir - convert .ics file to vdir directory
+#
+# Copyright (C) 2020 Fabian Peter Hammerle <fabian@hammerle.me>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import io
+import json
+import logging
+import os
+import pathlib
+import threading
+import unittest.mock
+
+import icalendar
+import pytest
+
+import ical2vdir
+import ical2vdir._cli
+import ical2vdir._common
+import ical2vdir._layout
+import ical2vdir._plan
+
+# pylint: disable=protected-access
+
+_GOOGLE_CALENDAR_PATH = pathlib.Path(__file__).parent.joinpath(
+    "resources", "google-calendar.ics"
+)
+_GOOGLE_CALENDAR_ITEM_NAMES = sorted(
+    ical2vdir._common._event_vdir_filename(event)
+    for event in icalendar.Calendar.from_ical(_GOOGLE_CALENDAR_PATH.read_bytes()).walk(
+        "VEVENT"
+    )
+)
+
+
+def _shard_path(output_dir_path: pathlib.Path, filename: str) -> pathlib.Path:
+    return output_dir_path.joinpath(".shards", ical2vdir._layout._shard_name(filename))
+
+
+def _scanned_paths(
+    output_dir_path: pathlib.Path, delete: bool = True
+) -> list[pathlib.Path]:
+    scandir = os.scandir
+    with unittest.mock.patch(
+        "os.scandir", side_effect=scandir
+    ) as scandir_mock, unittest.mock.patch(
+        "ical2vdir._layout._SHARD_MTIME_MARGIN_NS", 0
+    ):
+        ical2vdir.sync(
+            _GOOGLE_CALENDAR_PATH.read_bytes(),
+            output_dir_path,
+            layout="sharded",
+            state=True,
+            delete=delete,
+        )
+    return [pathlib.Path(c.args[0]) for c in scandir_mock.call_args_list]
+
+
+def _reset_input_digest(output_dir_path: pathlib.Path) -> None:
+    # enforces sync of unchanged input
+    state_path = output_dir_path.joinpath(".ical2vdir-state")
+    state_path.write_bytes(
+        json.dumps({**json.loads(state_path.read_bytes()), "input": None}).encode()
+    )
+
+
+def test__shard_name() -> None:
+    assert ical2vdir._layout._shard_name("a.ics") == "bd"
+    assert {ical2vdir._layout._shard_name(n) for n in _GOOGLE_CALENDAR_ITEM_NAMES} == {
+        "1c",
+        "94",
+    }
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_sync_sharded(tmp_path: pathlib.Path, stream: bool) -> None:
+    result = ical2vdir.sync(
+        _GOOGLE_CALENDAR_PATH.read_bytes(), tmp_path, layout="sharded", stream=stream
+    )
+    assert sorted(p.name for p in result.created) == _GOOGLE_CALENDAR_ITEM_NAMES
+    assert sorted(result.created) == sorted(tmp_path.glob("*.ics"))
+    for name in _GOOGLE_CALENDAR_ITEM_NAMES:
+        link_path = tmp_path.joinpath(name)
+        assert link_path.is_symlink()
+        assert os.readlink(link_path) == os.path.join(
+            ".shards", ical2vdir._layout._shard_name(name), name
+        )
+        item_path = _shard_path(tmp_path, name).joinpath(name)
+        assert not item_path.is_symlink()
+        assert link_path.read_bytes() == item_path.read_bytes()
+    flat_path = tmp_path.joinpath("flat")
+    flat_path.mkdir()
+    ical2vdir.sync(_GOOGLE_CALENDAR_PATH.read_bytes(), flat_path)
+    assert all(
+        tmp_path.joinpath(n).read_bytes() == flat_path.joinpath(n).read_bytes()
+        for n in _GOOGLE_CALENDAR_ITEM_NAMES
+    )
+    result = ical2vdir.sync(
+        _GOOGLE_CALENDAR_PATH.read_bytes(), tmp_path, layout="sharded", stream=stream
+    )
+    assert sorted(p.name for p in result.unchanged) == _GOOGLE_CALENDAR_ITEM_NAMES
+
+
+def test_sync_sharded_update(tmp_path: pathlib.Path) -> None:
+    ical2vdir.sync(_GOOGLE_CALENDAR_PATH.read_bytes(), tmp_path, layout="sharded")
+    updated_path = tmp_path.joinpath(_GOOGLE_CALENDAR_ITEM_NAMES[1])
+    # written via symlink
+    updated_path.write_bytes(
+        updated_path.read_bytes().replace(b"SUMMARY:recurring", b"SUMMARY:changed")
+    )
+    result = ical2vdir.sync(
+        _GOOGLE_CALENDAR_PATH.read_bytes(), tmp_path, layout="sharded"
+    )
+    assert result.updated == [updated_path]
+    assert updated_path.is_symlink()
+    assert b"SUMMARY:recurring" in updated_path.read_bytes()
+
+
+@pytest.mark.parametrize("state", [False, True])
+def test_sync_sharded_relink(
+    tmp_path: pathlib.Path, caplog: pytest.LogCaptureFixture, state: bool
+) -> None:
+    calendar_ical = _GOOGLE_CALENDAR_PATH.read_bytes()
+    ical2vdir.sync(calendar_ical, tmp_path, layout="sharded", state=state)
+    # removed by vdir reader
+    removed_path = tmp_path.joinpath(_GOOGLE_CALENDAR_ITEM_NAMES[0])
+    removed_path.unlink()
+    misdirected_path = tmp_path.joinpath(_GOOGLE_CALENDAR_ITEM_NAMES[1])
+    misdirected_path.unlink()
+    misdirected_path.symlink_to(tmp_path.joinpath(_GOOGLE_CALENDAR_ITEM_NAMES[2]))
+    replaced_path = tmp_path.joinpath(_GOOGLE_CALENDAR_ITEM_NAMES[2])
+    replaced_ical = replaced_path.read_bytes()
+    replaced_path.unlink()
+    replaced_path.write_bytes(replaced_ical)
+    ical2vdir.sync(calendar_ical, tmp_path, layout="sharded", dry_run=True)
+    assert not removed_path.is_symlink()
+    # with state: input unchanged since last run
+    with caplog.at_level(logging.INFO):
+        result = ical2vdir.sync(calendar_ical, tmp_path, layout="sharded", state=state)
+    assert sorted(p.name for p in result.unchanged) == _GOOGLE_CALENDAR_ITEM_NAMES
+    for path in (removed_path, misdirected_path, replaced_path):
+        assert os.readlink(path) == ical2vdir._layout._shard_link_target(path.name)
+    assert sorted(caplog.messages) == sorted(
+        f"restored symlink {p}" for p in (removed_path, misdirected_path, replaced_path)
+    )
+
+
+def test_sync_sharded_relink_jobs(
+    tmp_path: pathlib.Path, caplog: pytest.LogCaptureFixture
+) -> None:
+    calendar_ical = b"".join(
+        [b"BEGIN:VCALENDAR\r\n"]
+        + [
+            f"BEGIN:VEVENT\r\nUID:{index}\r\nSUMMARY:event\r\nEND:VEVENT\r\n".encode()
+            for index in range(32)
+        ]
+        + [b"END:VCALENDAR\r\n"]
+    )
+    ical2vdir.sync(calendar_ical, tmp_path, layout="sharded")
+    for index in range(32):
+        tmp_path.joinpath(f"{index}.ics").unlink()
+    emitting_threads = set()
+
+    class _Handler(logging.Handler):
+        def emit(self, record: logging.LogRecord) -> None:
+            emitting_threads.add(threading.get_ident())
+
+    handler = _Handler()
+    logging.getLogger("ical2vdir").addHandler(handler)
+    try:
+        with caplog.at_level(logging.INFO):
+            ical2vdir.sync(calendar_ical, tmp_path, layout="sharded", jobs=4)
+    finally:
+        logging.getLogger("ical2vdir").removeHandler(handler)
+    # emitted by main thread in input order
+    assert caplog.messages == [
+        f"restored symlink {tmp_path.joinpath(f'{index}.ics')}" for index in range(32)
+    ]
+    assert emitting_threads == {threading.get_ident()}
+
+
+def test_sync_flat_to_sharded(tmp_path: pathlib.Path) -> None:
+    ical2vdir.sync(_GOOGLE_CALENDAR_PATH.read_bytes(), tmp_path)
+    result = ical2vdir.sync(
+        _GOOGLE_CALENDAR_PATH.read_bytes(), tmp_path, layout="sharded"
+    )
+    # regular files replaced by symlinks
+    assert sorted(p.name for p in result.created) == _GOOGLE_CALENDAR_ITEM_NAMES
+    assert all(tmp_path.joinpath(n).is_symlink() for n in _GOOGLE_CALENDAR_ITEM_NAMES)
+    assert not list(tmp_path.glob(".ical2vdir-*.tmp"))
+
+
+def test_sync_sharded_delete(tmp_path: pathlib.Path) -> None:
+    calendar_ical = _GOOGLE_CALENDAR_PATH.read_bytes()
+    ical2vdir.sync(calendar_ical, tmp_path, layout="sharded")
+    # symlink replaced with regular file
+    replaced_path = tmp_path.joinpath(_GOOGLE_CALENDAR_ITEM_NAMES[2])
+    replaced_ical = replaced_path.read_bytes()
+    replaced_path.unlink()
+    replaced_path.write_bytes(replaced_ical)
+    # left by --layout flat
+    tmp_path.joinpath("flat.ics").write_bytes(replaced_ical)
+    calendar_ical = calendar_ical.replace(b"UID:1234567890qwertyuiopasdfgh", b"UID:a")
+    calendar_ical = calendar_ical.replace(b"UID:recurr1234567890qwertyuiop", b"UID:b")
+    result = ical2vdir.sync(calendar_ical, tmp_path, layout="sharded", delete=True)
+    assert sorted(p.name for p in result.removed) == sorted(
+        _GOOGLE_CALENDAR_ITEM_NAMES + ["flat.ics"]
+    )
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        ".shards",
+        "a@google.com.ics",
+        "b@google.com.20150908T090000+0200.ics",
+        "b@google.com.20150924T090000+0200.ics",
+    ]
+    assert not any(
+        _shard_path(tmp_path, n).joinpath(n).exists()
+        for n in _GOOGLE_CALENDAR_ITEM_NAMES
+    )
+
+
+@pytest.mark.parametrize("state", [False, True])
+def test_sync_flat_to_sharded_delete(tmp_path: pathlib.Path, state: bool) -> None:
+    calendar_ical = _GOOGLE_CALENDAR_PATH.read_bytes()
+    ical2vdir.sync(calendar_ical, tmp_path, state=state, delete=True)
+    smaller_ical = calendar_ical.replace(b"UID:recurr1234567890qwertyuiop", b"UID:b")
+    result = ical2vdir.sync(
+        smaller_ical, tmp_path, layout="sharded", state=state, delete=True
+    )
+    assert sorted(p.name for p in result.removed) == _GOOGLE_CALENDAR_ITEM_NAMES[1:]
+    assert all(p.is_symlink() for p in tmp_path.glob("*.ics"))
+    assert len(list(tmp_path.glob("*.ics"))) == 3
+
+
+def test_sync_sharded_state_delete_scan(tmp_path: pathlib.Path) -> None:
+    shards_path = tmp_path.joinpath(".shards")
+    # shards modified within timestamp granularity are not indexed
+    ical2vdir.sync(
+        _GOOGLE_CALENDAR_PATH.read_bytes(),
+        tmp_path,
+        layout="sharded",
+        state=True,
+        delete=True,
+    )
+    state = json.loads(tmp_path.joinpath(".ical2vdir-state").read_bytes())
+    assert state["shards"] == {}
+    _reset_input_digest(tmp_path)
+    assert set(_scanned_paths(tmp_path)) == {
+        shards_path,
+        *(_shard_path(tmp_path, n) for n in _GOOGLE_CALENDAR_ITEM_NAMES),
+    }
+    state = json.loads(tmp_path.joinpath(".ical2vdir-state").read_bytes())
+    assert sorted(state["shards"]) == ["1c", "94"]
+    # input unchanged
+    assert _scanned_paths(tmp_path) == [shards_path]
+    _reset_input_digest(tmp_path)
+    # listing of shards & their modification times for the index
+    assert _scanned_paths(tmp_path) == [shards_path] * 2
+    modified_shard_path = _shard_path(tmp_path, _GOOGLE_CALENDAR_ITEM_NAMES[0])
+    assert modified_shard_path == _shard_path(tmp_path, "removed327.ics")
+    modified_shard_path.joinpath("removed327.ics").touch()
+    # ignored
+    modified_shard_path.joinpath("misplaced.ics").touch()
+    os.utime(modified_shard_path, ns=(0, 0))
+    tmp_path.joinpath("removed327.ics").symlink_to(
+        modified_shard_path.joinpath("removed327.ics")
+    )
+    _reset_input_digest(tmp_path)
+    assert _scanned_paths(tmp_path) == [
+        shards_path,
+        modified_shard_path,
+        shards_path,
+    ]
+    assert not tmp_path.joinpath("removed327.ics").is_symlink()
+    assert sorted(p.name for p in modified_shard_path.iterdir()) == [
+        _GOOGLE_CALENDAR_ITEM_NAMES[0],
+        "misplaced.ics",
+    ]
+    # without --delete, shards may contain items not in the index
+    _reset_input_digest(tmp_path)
+    _scanned_paths(tmp_path, delete=False)
+    state = json.loads(tmp_path.joinpath(".ical2vdir-state").read_bytes())
+    assert state["shards"] is None
+
+
+def test_sync_sharded_fsync_batch(tmp_path: pathlib.Path) -> None:
+    with unittest.mock.patch("os.fsync") as fsync_mock:
+        ical2vdir.sync(
+            _GOOGLE_CALENDAR_PATH.read_bytes(),
+            tmp_path,
+            layout="sharded",
+            fsync="batch",
+        )
+    # items + shards + .shards + output directory
+    assert fsync_mock.call_count == 3 + 2 + 1 + 1
+
+
+def test__apply_plan_sharded(tmp_path: pathlib.Path) -> None:
+    ical2vdir.sync(_GOOGLE_CALENDAR_PATH.read_bytes(), tmp_path, layout="sharded")
+    updated_path = tmp_path.joinpath(_GOOGLE_CALENDAR_ITEM_NAMES[1])
+    updated_path.write_bytes(
+        updated_path.read_bytes().replace(b"SUMMARY:recurring", b"SUMMARY:changed")
+    )
+    created_path = tmp_path.joinpath(_GOOGLE_CALENDAR_ITEM_NAMES[0])
+    _shard_path(tmp_path, created_path.name).joinpath(created_path.name).unlink()
+    created_path.unlink()
+    removed_path = _shard_path(tmp_path, "a.ics").joinpath("a.ics")
+    removed_path.parent.mkdir()
+    removed_path.touch()
+    result = ical2vdir.sync(
+        _GOOGLE_CALENDAR_PATH.read_bytes(),
+        tmp_path,
+        layout="sharded",
+        delete=True,
+        dry_run=True,
+    )
+    assert result.plan is not None and result.plan["layout"] == "sharded"
+    applied = ical2vdir._plan._apply_plan(json.loads(json.dumps(result.plan)))
+    assert applied.created == [created_path]
+    assert applied.updated == [updated_path]
+    assert applied.removed == [tmp_path.joinpath("a.ics")]
+    assert created_path.is_symlink()
+    assert b"SUMMARY:recurring" in updated_path.read_bytes()
+    assert not removed_path.exists()
+
+
+def test__main_layout_sharded(
+    tmp_path: pathlib.Path, google_calendar_file: io.BufferedReader
+) -> None:
+    with unittest.mock.patch("sys.stdin", google_calendar_file), unittest.mock.patch(
+        "sys.argv", ["", "--output-dir", str(tmp_path), "--layout", "sharded"]
+    ):
+        ical2vdir._cli._main()
+    assert sorted(p.name for p in tmp_path.glob("*.ics")) == _GOOGLE_CALENDAR_ITEM_NAMES
+    assert all(tmp_path.joinpath(n).is_symlink() for n in _GOOGLE_CALENDAR_ITEM_NAMES)
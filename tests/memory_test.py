@@ -0,0 +1,64 @@
+# ical2vdir - convert .ics file to vdir directory
+#
+# Copyright (C) 2020 Fabian Peter Hammerle <fabian@hammerle.me>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import io
+import pathlib
+import tracemalloc
+
+import ical2vdir
+
+
+def _calendar_ical(events_count: int) -> bytes:
+    return (
+        b"BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:-//test//EN\r\n"
+        + b"".join(
+            b"BEGIN:VEVENT\r\nUID:%d@example.com\r\nSUMMARY:event\r\n"
+            b"DTSTAMP:20260101T000000Z\r\nDTSTART:20260102T100000Z\r\n"
+            b"END:VEVENT\r\n" % index
+            for index in range(events_count)
+        )
+        + b"END:VCALENDAR\r\n"
+    )
+
+
+def _sync_peak_memory(events_count: int, output_dir_path: pathlib.Path) -> int:
+    # peak size of memory blocks allocated by python during sync
+    calendar_ical = _calendar_ical(events_count)
+    output_dir_path.mkdir()
+    tracemalloc.start()
+    try:
+        result = ical2vdir.sync(
+            io.BytesIO(calendar_ical),
+            output_dir_path,
+            stream=True,
+            delete=True,
+            collect_paths=False,
+        )
+        _, peak_size = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert result.stats["created"] == events_count
+    return peak_size
+
+
+def test_sync_peak_memory(tmp_path: pathlib.Path) -> None:
+    _sync_peak_memory(1, tmp_path.joinpath("warmup"))  # lazy imports
+    small = _sync_peak_memory(100, tmp_path.joinpath("small"))
+    large = _sync_peak_memory(1000, tmp_path.joinpath("large"))
+    # only names of synced items are kept (for --delete),
+    # previously >600 bytes per event (paths & stats of written items)
+    assert (large - small) / 900 < 256
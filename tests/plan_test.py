@@ -0,0 +1,214 @@
+# ical2vdir - convert .ics file to vdir directory
+#
+# Copyright (C) 2020 Fabian Peter Hammerle <fabian@hammerle.me>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import io
+import json
+import logging
+import pathlib
+import typing
+import unittest.mock
+
+import pytest
+
+import ical2vdir
+import ical2vdir._cli
+import ical2vdir._plan
+
+# pylint: disable=protected-access
+
+_GOOGLE_CALENDAR_PATH = pathlib.Path(__file__).parent.joinpath(
+    "resources", "google-calendar.ics"
+)
+_CREATED_NAME = "1234567890qwertyuiopasdfgh@google.com.ics"
+_UPDATED_NAME = "recurr1234567890qwertyuiop@google.com.20150908T090000+0200.ics"
+
+
+def _dir_contents(path: pathlib.Path) -> dict[str, bytes]:
+    return {p.name: p.read_bytes() for p in path.iterdir()}
+
+
+def _prepare_output_dir(path: pathlib.Path) -> None:
+    ical2vdir.sync(_GOOGLE_CALENDAR_PATH.read_bytes(), path, state=True)
+    path.joinpath(_CREATED_NAME).unlink()
+    updated_path = path.joinpath(_UPDATED_NAME)
+    updated_path.write_bytes(
+        updated_path.read_bytes().replace(b"SUMMARY:recurring", b"SUMMARY:changed")
+    )
+    path.joinpath("removed.ics").write_bytes(b"removed")
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_sync_dry_run(
+    caplog: pytest.LogCaptureFixture, tmp_path: pathlib.Path, stream: bool
+) -> None:
+    _prepare_output_dir(tmp_path)
+    contents = _dir_contents(tmp_path)
+    with caplog.at_level(logging.INFO):
+        result = ical2vdir.sync(
+            _GOOGLE_CALENDAR_PATH.read_bytes(),
+            tmp_path,
+            delete=True,
+            state=True,
+            stream=stream,
+            dry_run=True,
+        )
+    assert _dir_contents(tmp_path) == contents  # including index
+    assert [r.message for r in caplog.records] == [
+        f"would create {tmp_path.joinpath(_CREATED_NAME)}",
+        f"would update {tmp_path.joinpath(_UPDATED_NAME)}",
+        "would remove 1 items not in input",
+    ]
+    assert result.created == [tmp_path.joinpath(_CREATED_NAME)]
+    assert result.updated == [tmp_path.joinpath(_UPDATED_NAME)]
+    assert result.removed == [tmp_path.joinpath("removed.ics")]
+    assert result.plan is not None
+    assert result.plan["version"] == 1
+    assert result.plan["output_dir"] == str(tmp_path.absolute())
+    items = {i["filename"]: i for i in result.plan["items"]}
+    assert items[_CREATED_NAME].keys() == {"action", "filename", "ical"}
+    assert items[_UPDATED_NAME]["action"] == "updated"
+    assert "SUMMARY:recurring" in items[_UPDATED_NAME]["ical"]
+    assert items[_UPDATED_NAME]["size"] == len(contents[_UPDATED_NAME])
+    assert items["removed.ics"]["action"] == "removed"
+    assert "ical" not in items["removed.ics"]
+
+
+def test_sync_dry_run_input_unchanged(tmp_path: pathlib.Path) -> None:
+    ical2vdir.sync(_GOOGLE_CALENDAR_PATH.read_bytes(), tmp_path, state=True)
+    result = ical2vdir.sync(
+        _GOOGLE_CALENDAR_PATH.read_bytes(), tmp_path, state=True, dry_run=True
+    )
+    assert result.plan is not None and not result.plan["items"]
+
+
+def test_sync_dry_run_duplicates(tmp_path: pathlib.Path) -> None:
+    calendar_ical = _GOOGLE_CALENDAR_PATH.read_bytes()
+    event_start = calendar_ical.index(b"BEGIN:VEVENT")
+    event_end = calendar_ical.index(b"END:VEVENT\n") + len(b"END:VEVENT\n")
+    event_ical = calendar_ical[event_start:event_end]
+    calendar_ical = calendar_ical.replace(
+        event_ical, event_ical + event_ical.replace(b"SEQUENCE:0", b"SEQUENCE:1"), 1
+    ).replace(b"END:VCALENDAR", event_ical + b"END:VCALENDAR")
+    ical2vdir.sync(_GOOGLE_CALENDAR_PATH.read_bytes(), tmp_path)
+    contents = _dir_contents(tmp_path)
+    result = ical2vdir.sync(calendar_ical, tmp_path, stream=True, dry_run=True)
+    assert result.stats["duplicates"] == 2
+    assert _dir_contents(tmp_path) == contents
+    assert result.plan is not None
+    assert [i["action"] for i in result.plan["items"]] == ["updated"]
+    assert "SEQUENCE:1" in result.plan["items"][0]["ical"]
+
+
+def test__apply_plan(tmp_path: pathlib.Path) -> None:
+    planned_path = tmp_path.joinpath("planned")
+    planned_path.mkdir()
+    _prepare_output_dir(planned_path)
+    result = ical2vdir.sync(
+        _GOOGLE_CALENDAR_PATH.read_bytes(), planned_path, delete=True, dry_run=True
+    )
+    assert result.plan is not None
+    synced_path = tmp_path.joinpath("synced")
+    synced_path.mkdir()
+    _prepare_output_dir(synced_path)
+    ical2vdir.sync(_GOOGLE_CALENDAR_PATH.read_bytes(), synced_path, delete=True)
+    with unittest.mock.patch("os.fsync") as fsync_mock:
+        applied = ical2vdir._plan._apply_plan(
+            json.loads(json.dumps(result.plan)), fsync="batch"
+        )
+    assert fsync_mock.call_count == 2 + 1  # items + directory
+    assert applied.created == [planned_path.joinpath(_CREATED_NAME)]
+    assert applied.updated == [planned_path.joinpath(_UPDATED_NAME)]
+    assert applied.removed == [planned_path.joinpath("removed.ics")]
+    assert applied.stats["removed"] == 1
+    planned_contents = _dir_contents(planned_path)
+    synced_contents = _dir_contents(synced_path)
+    # index of items written by the first run
+    assert planned_contents.pop(".ical2vdir-state")
+    assert synced_contents.pop(".ical2vdir-state")
+    assert planned_contents == synced_contents
+
+
+@pytest.mark.parametrize(
+    "modify",
+    [
+        lambda p: p.joinpath(_CREATED_NAME).write_bytes(b"created"),
+        lambda p: p.joinpath(_UPDATED_NAME).write_bytes(b"modified"),
+        lambda p: p.joinpath(_UPDATED_NAME).unlink(),
+        lambda p: p.joinpath("removed.ics").write_bytes(b"modified"),
+    ],
+)
+def test__apply_plan_modified(tmp_path: pathlib.Path, modify: typing.Any) -> None:
+    _prepare_output_dir(tmp_path)
+    result = ical2vdir.sync(
+        _GOOGLE_CALENDAR_PATH.read_bytes(), tmp_path, delete=True, dry_run=True
+    )
+    assert result.plan is not None
+    modify(tmp_path)
+    contents = _dir_contents(tmp_path)
+    with pytest.raises(ValueError, match=r"^1 items were modified since"):
+        ical2vdir._plan._apply_plan(result.plan)
+    assert _dir_contents(tmp_path) == contents
+
+
+def test__apply_plan_unsupported_version(tmp_path: pathlib.Path) -> None:
+    with pytest.raises(ValueError, match=r"^unsupported plan version$"):
+        ical2vdir._plan._apply_plan(
+            {"version": 0, "output_dir": str(tmp_path), "items": []}
+        )
+
+
+def test__main_dry_run_apply(
+    capsys: pytest.CaptureFixture[str], tmp_path: pathlib.Path
+) -> None:
+    output_dir_path = tmp_path.joinpath("output")
+    output_dir_path.mkdir()
+    _prepare_output_dir(output_dir_path)
+    contents = _dir_contents(output_dir_path)
+    with unittest.mock.patch(
+        "sys.stdin", io.BytesIO(_GOOGLE_CALENDAR_PATH.read_bytes())
+    ), unittest.mock.patch(
+        "sys.argv",
+        ["", "--output-dir", str(output_dir_path), "--delete", "--dry-run"],
+    ):
+        ical2vdir._cli._main()
+    assert _dir_contents(output_dir_path) == contents
+    plan_path = tmp_path.joinpath("plan.json")
+    plan_path.write_text(capsys.readouterr().out)
+    assert len(json.loads(plan_path.read_text())["items"]) == 3
+    with unittest.mock.patch("sys.argv", ["", "--apply", str(plan_path)]):
+        ical2vdir._cli._main()
+    assert sorted(p.name for p in output_dir_path.iterdir()) == sorted(
+        [".ical2vdir-state", _CREATED_NAME, _UPDATED_NAME]
+        + ["recurr1234567890qwertyuiop@google.com.20150924T090000+0200.ics"]
+    )
+    with unittest.mock.patch(
+        "sys.argv", ["", "--apply", str(plan_path)]
+    ), pytest.raises(SystemExit, match="^1$"):
+        ical2vdir._cli._main()  # already applied
+
+
+@pytest.mark.parametrize(
+    "args",
+    [
+        ["--dry-run", "--batch", "manifest.json"],
+        ["--dry-run", "--apply", "plan.json"],
+        ["--dry-run", "--stats", "json"],
+    ],
+)
+def test__main_dry_run_invalid(args: list[str]) -> None:
+    with unittest.mock.patch("sys.argv", ["", *args]), pytest.raises(SystemExit):
+        ical2vdir._cli._main()
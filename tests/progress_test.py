@@ -0,0 +1,92 @@
+# ical2vdir - convert .ics file to vdir directory
+#
+# Copyright (C) 2020 Fabian Peter Hammerle <fabian@hammerle.me>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import json
+import logging
+import pathlib
+import unittest.mock
+
+import pytest
+
+import ical2vdir._progress
+import ical2vdir._stats
+
+# pylint: disable=protected-access
+
+
+@pytest.mark.parametrize(
+    ("mode", "expected_messages"),
+    [
+        ("items", ["creating /a.ics", "updating /b.ics"]),
+        ("none", []),
+    ],
+)
+def test__progress_reporter_items(
+    caplog: pytest.LogCaptureFixture, mode: str, expected_messages: list[str]
+) -> None:
+    reporter = ical2vdir._progress._ProgressReporter(mode=mode)
+    stats = ical2vdir._stats._Stats()
+    with caplog.at_level(logging.INFO):
+        for action, path in [
+            ("created", "/a.ics"),
+            ("updated", "/b.ics"),
+            ("unchanged", "/c.ics"),
+            ("removed", "/d.ics"),
+        ]:
+            reporter.item(action, pathlib.Path(path), stats)
+        reporter.finish(stats)
+    assert [r.message for r in caplog.records] == expected_messages
+
+
+def test__progress_reporter_counter(caplog: pytest.LogCaptureFixture) -> None:
+    stats = ical2vdir._stats._Stats()
+    with unittest.mock.patch("time.monotonic", return_value=0):
+        reporter = ical2vdir._progress._ProgressReporter(mode="counter", interval=10)
+    with caplog.at_level(logging.INFO):
+        for time_monotonic, action in [
+            (4, "created"),
+            (11, "unchanged"),
+            (12, "created"),
+        ]:
+            stats.count(action)
+            with unittest.mock.patch("time.monotonic", return_value=time_monotonic):
+                reporter.item(action, pathlib.Path("/a.ics"), stats)
+        reporter.finish(stats)
+    assert [r.message for r in caplog.records] == [
+        "1 created, 0 updated, 1 unchanged, 0 removed, 0 skipped",
+        "2 created, 0 updated, 1 unchanged, 0 removed, 0 skipped",
+    ]
+
+
+def test__progress_reporter_event_log(tmp_path: pathlib.Path) -> None:
+    event_log_path = tmp_path.joinpath("events.jsonl")
+    event_log_path.write_text('{"action": "created", "path": "/x.ics"}\n')
+    reporter = ical2vdir._progress._ProgressReporter(
+        mode="none", event_log_path=event_log_path
+    )
+    stats = ical2vdir._stats._Stats()
+    with reporter.open_event_log():
+        reporter.item("updated", pathlib.Path("/a.ics"), stats)
+        reporter.item("unchanged", pathlib.Path("/b.ics"), stats)
+        reporter.item("removed", pathlib.Path("/c.ics"), stats)
+    reporter.item("created", pathlib.Path("/d.ics"), stats)  # event log closed
+    with event_log_path.open(encoding="utf-8") as event_log:
+        assert [json.loads(line) for line in event_log] == [
+            {"action": "created", "path": "/x.ics"},
+            {"action": "updated", "path": "/a.ics"},
+            {"action": "removed", "path": "/c.ics"},
+        ]
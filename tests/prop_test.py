@@ -19,7 +19,15 @@ import datetime
 import typing
 
 import pytest
-from icalendar.prop import vCalAddress, vDDDLists, vDDDTypes, vInt, vRecur, vText
+from icalendar.prop import (
+    vCalAddress,
+    vCategory,
+    vDDDLists,
+    vDDDTypes,
+    vInt,
+    vRecur,
+    vText,
+)
 
 from ical2vdir import _event_prop_equal
 
@@ -201,6 +209,17 @@ def _parametrize(obj: typing.Any, params: dict[str, str]) -> typing.Any:
             ],
             True,
         ),
+        (vCategory(["a", "b"]), vCategory(["a", "b"]), True),
+        (vCategory(["a", "b"]), vCategory(["a", "c"]), False),
+        (vCategory(["a"]), vText("a"), False),
+        (
+            vDDDTypes(datetime.datetime(2012, 7, 3, 18, 39, 2)),
+            _parametrize(
+                vDDDTypes(datetime.datetime(2012, 7, 3, 18, 39, 2)),
+                {"TZID": "Europe/Vienna"},
+            ),
+            False,
+        ),
     ],
 )
 def test__event_prop_equal(
@@ -0,0 +1,88 @@
+# ical2vdir - convert .ics file to vdir directory
+#
+# Copyright (C) 2020 Fabian Peter Hammerle <fabian@hammerle.me>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import pathlib
+
+import ical2vdir._scan
+
+# pylint: disable=protected-access
+
+
+def test__directory_scan(tmp_path: pathlib.Path) -> None:
+    tmp_path.joinpath("a.ics").write_bytes(b"a")
+    tmp_path.joinpath("b.ics").write_bytes(b"bb")
+    tmp_path.joinpath("dir.ics").mkdir()
+    tmp_path.joinpath("c.txt").touch()
+    scan = ical2vdir._scan._DirectoryScan(tmp_path)
+    assert scan.file_names(".ics") == {"a.ics", "b.ics"}
+    assert scan.exists("dir.ics")
+    assert not scan.exists("d.ics")
+    stat = scan.stat("b.ics")
+    assert stat is not None and stat.st_size == 2
+    assert scan.stat("d.ics") is None
+    tmp_path.joinpath("b.ics").write_bytes(b"bbb")
+    assert scan.stat("b.ics") is stat  # cached
+    tmp_path.joinpath("a.ics").unlink()
+    assert scan.exists("a.ics")
+    assert scan.stat("a.ics") is None
+    tmp_path.joinpath("d.ics").write_bytes(b"dddd")
+    scan.written("d.ics")
+    assert scan.exists("d.ics")
+    d_stat = scan.stat("d.ics")
+    assert d_stat is not None and d_stat.st_size == 4
+    scan.written("b.ics")
+    b_stat = scan.stat("b.ics")
+    assert b_stat is not None and b_stat.st_size == 3  # not cached
+    scan.removed("b.ics")
+    assert not scan.exists("b.ics")
+    assert scan.stat("b.ics") is None
+
+
+def test__item_stat(tmp_path: pathlib.Path) -> None:
+    path = tmp_path.joinpath("a.ics")
+    assert ical2vdir._scan._item_stat(path, None) is None
+    path.write_bytes(b"a")
+    stat = ical2vdir._scan._item_stat(path, None)
+    assert stat is not None and stat.st_size == 1
+
+
+def test__directory_scan_names(tmp_path: pathlib.Path) -> None:
+    tmp_path.joinpath("a.ics").write_bytes(b"a")
+    tmp_path.joinpath("c.ics").touch()  # not listed
+    scan = ical2vdir._scan._DirectoryScan(tmp_path, names=["a.ics", "b.ics"])
+    assert scan.file_names(".ics") == {"a.ics", "b.ics"}
+    assert not scan.exists("c.ics")
+    stat = scan.stat("a.ics")
+    assert stat is not None and stat.st_size == 1
+    assert scan.stat("b.ics") is None
+    assert scan.stat("c.ics") is None
+
+
+def test__directory_scan_invalidate(tmp_path: pathlib.Path) -> None:
+    tmp_path.joinpath("a.ics").write_bytes(b"a")
+    scan = ical2vdir._scan._DirectoryScan(tmp_path)
+    assert scan.stat("a.ics") is not None
+    tmp_path.joinpath("a.ics").write_bytes(b"aa")
+    tmp_path.joinpath("b.ics").write_bytes(b"b")
+    scan.invalidate("a.ics")
+    scan.invalidate("b.ics")
+    a_stat = scan.stat("a.ics")
+    assert a_stat is not None and a_stat.st_size == 2
+    assert scan.file_names(".ics") == {"a.ics", "b.ics"}
+    tmp_path.joinpath("a.ics").unlink()
+    scan.invalidate("a.ics")
+    assert not scan.exists("a.ics")
+    assert scan.file_names(".ics") == {"b.ics"}
@@ -0,0 +1,179 @@
+# ical2vdir - convert .ics file to vdir directory
+#
+# Copyright (C) 2020 Fabian Peter Hammerle <fabian@hammerle.me>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import io
+import pathlib
+import typing
+
+import icalendar.cal
+import pytest
+
+import ical2vdir
+import ical2vdir._input
+
+# pylint: disable=protected-access
+
+
+def test__iter_content_lines_unfold() -> None:
+    lines = [
+        b"BEGIN:VEVENT\r\n",
+        b"DESCRIPTION:folded\r\n",
+        b"  description\r\n",
+        b"\tcontinued\r\n",
+        b"END:VEVENT",
+    ]
+    assert list(ical2vdir._input._iter_content_lines(lines)) == [
+        (b"BEGIN:VEVENT", [b"BEGIN:VEVENT\r\n"]),
+        (b"DESCRIPTION:folded descriptioncontinued", lines[1:4]),
+        (b"END:VEVENT", [b"END:VEVENT"]),
+    ]
+
+
+def test__iter_component_icals() -> None:
+    calendar_ical = (
+        pathlib.Path(__file__)
+        .parent.joinpath("resources", "google-calendar.ics")
+        .read_bytes()
+    )
+    component_icals = list(
+        ical2vdir._input._iter_component_icals(io.BytesIO(calendar_ical))
+    )
+    calendar = icalendar.Calendar.from_ical(calendar_ical)
+    assert len(component_icals) == len(calendar.subcomponents)
+    for component_ical, component in zip(component_icals, calendar.subcomponents):
+        assert component_ical.startswith(b"BEGIN:" + component.name.encode())
+        # icalendar<5: properties are not comparable
+        assert (
+            icalendar.cal.Component.from_ical(component_ical).to_ical()
+            == component.to_ical()
+        )
+
+
+def test__iter_component_icals_nested() -> None:
+    component_icals = list(
+        ical2vdir._input._iter_component_icals(
+            io.BytesIO(
+                b"BEGIN:VCALENDAR\r\nVERSION:2.0\r\n"
+                b"BEGIN:VEVENT\r\nUID:a\r\n"
+                b"BEGIN:VALARM\r\nACTION:DISPLAY\r\nEND:VALARM\r\n"
+                b"END:VEVENT\r\n"
+                b"begin:vtodo\r\nUID:b\r\nend:vtodo\r\n"
+                b"END:VCALENDAR\r\n"
+            )
+        )
+    )
+    assert component_icals == [
+        b"BEGIN:VEVENT\r\nUID:a\r\n"
+        b"BEGIN:VALARM\r\nACTION:DISPLAY\r\nEND:VALARM\r\n"
+        b"END:VEVENT\r\n",
+        b"begin:vtodo\r\nUID:b\r\nend:vtodo\r\n",
+    ]
+
+
+def test__iter_component_icals_truncated() -> None:
+    component_icals = ical2vdir._input._iter_component_icals(
+        io.BytesIO(b"BEGIN:VCALENDAR\r\nBEGIN:VEVENT\r\nUID:a\r\n")
+    )
+    with pytest.raises(ValueError, match=r"^unexpected end of input"):
+        list(component_icals)
+
+
+def test__iter_component_icals_truncated_between_components() -> None:
+    component_icals = ical2vdir._input._iter_component_icals(
+        io.BytesIO(b"BEGIN:VCALENDAR\r\nBEGIN:VEVENT\r\nUID:a\r\nEND:VEVENT\r\n")
+    )
+    assert next(component_icals) == b"BEGIN:VEVENT\r\nUID:a\r\nEND:VEVENT\r\n"
+    with pytest.raises(
+        ValueError, match=r"^unexpected end of input, VCALENDAR was not closed$"
+    ):
+        next(component_icals)
+
+
+@pytest.mark.parametrize(
+    ("ical", "expected_message"),
+    [
+        (b"", r"^input does not contain a VCALENDAR$"),
+        (b"\r\n", r"^input does not contain a VCALENDAR$"),
+        (b"<html>error</html>\r\n", r"^input does not start with BEGIN:VCALENDAR$"),
+        (
+            b"BEGIN:VEVENT\r\nUID:a\r\nEND:VEVENT\r\n",
+            r"^input does not start with BEGIN:VCALENDAR$",
+        ),
+        (
+            b"PRODID:x\r\nBEGIN:VCALENDAR\r\nEND:VCALENDAR\r\n",
+            r"^input does not start with BEGIN:VCALENDAR$",
+        ),
+        (
+            b"BEGIN:VCALENDAR\r\nEND:VCALENDAR\r\nBEGIN:VCALENDAR\r\n",
+            r"^unexpected content after END:VCALENDAR$",
+        ),
+        (
+            b"BEGIN:VCALENDAR\r\nEND:VCALENDAR\r\n<html>\r\n",
+            r"^unexpected content after END:VCALENDAR$",
+        ),
+    ],
+)
+def test__iter_component_icals_not_calendar(ical: bytes, expected_message: str) -> None:
+    with pytest.raises(ValueError, match=expected_message):
+        list(ical2vdir._input._iter_component_icals(io.BytesIO(ical)))
+    with pytest.raises(ValueError, match=expected_message):
+        list(ical2vdir._input._iter_mapped_component_icals(ical))
+
+
+def test__iter_component_icals_blank_lines() -> None:
+    ical = b"\r\nbegin:vcalendar\r\nBEGIN:VTODO\r\nEND:VTODO\r\nEND:VCALENDAR\r\n\r\n"
+    assert list(ical2vdir._input._iter_component_icals(io.BytesIO(ical))) == [
+        b"BEGIN:VTODO\r\nEND:VTODO\r\n"
+    ]
+    assert list(ical2vdir._input._iter_mapped_component_icals(ical)) == [
+        b"BEGIN:VTODO\r\nEND:VTODO\r\n"
+    ]
+
+
+@pytest.mark.parametrize("ical", [b"", b"<html>error</html>\r\n"])
+@pytest.mark.parametrize(
+    "sync_kwargs",
+    [{"stream": True}, {"incremental": True}, {"stream": True, "jobs": 2}],
+)
+def test_sync_stream_not_calendar_delete(
+    tmp_path: pathlib.Path, ical: bytes, sync_kwargs: dict[str, typing.Any]
+) -> None:
+    calendar_ical = (
+        pathlib.Path(__file__)
+        .parent.joinpath("resources", "google-calendar.ics")
+        .read_bytes()
+    )
+    ical2vdir.sync(calendar_ical, tmp_path, state=True)
+    item_names = sorted(p.name for p in tmp_path.iterdir())
+    with pytest.raises(ValueError, match=r"VCALENDAR"):
+        ical2vdir.sync(io.BytesIO(ical), tmp_path, delete=True, **sync_kwargs)
+    assert sorted(p.name for p in tmp_path.iterdir()) == item_names
+
+
+def test_sync_stream_truncated_delete(tmp_path: pathlib.Path) -> None:
+    calendar_ical = (
+        pathlib.Path(__file__)
+        .parent.joinpath("resources", "google-calendar.ics")
+        .read_bytes()
+    )
+    ical2vdir.sync(calendar_ical, tmp_path)
+    item_names = sorted(p.name for p in tmp_path.iterdir())
+    assert len(item_names) == 3
+    truncated_ical = calendar_ical[: calendar_ical.index(b"END:VEVENT\n") + 11]
+    with pytest.raises(ValueError, match=r"VCALENDAR was not closed$"):
+        ical2vdir.sync(io.BytesIO(truncated_ical), tmp_path, stream=True, delete=True)
+    assert sorted(p.name for p in tmp_path.iterdir()) == item_names
@@ -0,0 +1,364 @@
+# ical2vdir - convert .ics file to vdir directory
+#
+# Copyright (C) 2020 Fabian Peter Hammerle <fabian@hammerle.me>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import logging
+import os
+import pathlib
+import subprocess
+import sys
+import typing
+import unittest.mock
+
+import icalendar
+import pytest
+
+import ical2vdir
+
+_GOOGLE_CALENDAR_PATH = pathlib.Path(__file__).parent.joinpath(
+    "resources", "google-calendar.ics"
+)
+_GOOGLE_CALENDAR_ITEM_NAMES = [
+    "1234567890qwertyuiopasdfgh@google.com.ics",
+    "recurr1234567890qwertyuiop@google.com.20150908T090000+0200.ics",
+    "recurr1234567890qwertyuiop@google.com.20150924T090000+0200.ics",
+]
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_sync_bytes(tmp_path: pathlib.Path, stream: bool) -> None:
+    result = ical2vdir.sync(
+        _GOOGLE_CALENDAR_PATH.read_bytes(), str(tmp_path), stream=stream
+    )
+    assert sorted(p.name for p in result.created) == _GOOGLE_CALENDAR_ITEM_NAMES
+    assert sorted(result.created) == sorted(tmp_path.iterdir())
+    assert not result.updated
+    assert not result.unchanged
+    assert not result.removed
+    assert result.stats["created"] == 3
+    assert result.stats["input_bytes"] == _GOOGLE_CALENDAR_PATH.stat().st_size
+
+
+def test_sync_collect_paths_disabled(tmp_path: pathlib.Path) -> None:
+    tmp_path.joinpath("removed.ics").touch()
+    result = ical2vdir.sync(
+        _GOOGLE_CALENDAR_PATH.read_bytes(), tmp_path, delete=True, collect_paths=False
+    )
+    assert not result.created and not result.removed
+    assert result.stats["created"] == 3
+    assert result.stats["removed"] == 1
+    assert sorted(p.name for p in tmp_path.iterdir()) == _GOOGLE_CALENDAR_ITEM_NAMES
+
+
+def test_sync_file(tmp_path: pathlib.Path) -> None:
+    ical2vdir.sync(_GOOGLE_CALENDAR_PATH.read_bytes(), tmp_path)
+    updated_path = tmp_path.joinpath(_GOOGLE_CALENDAR_ITEM_NAMES[1])
+    updated_path.write_bytes(
+        updated_path.read_bytes().replace(b"SUMMARY:recurring", b"SUMMARY:changed")
+    )
+    removed_path = tmp_path.joinpath("removed.ics")
+    removed_path.touch()
+    with _GOOGLE_CALENDAR_PATH.open("rb") as calendar_file:
+        result = ical2vdir.sync(calendar_file, tmp_path, delete=True, jobs=2)
+    assert not result.created
+    assert result.updated == [updated_path]
+    assert sorted(p.name for p in result.unchanged) == [
+        _GOOGLE_CALENDAR_ITEM_NAMES[0],
+        _GOOGLE_CALENDAR_ITEM_NAMES[2],
+    ]
+    assert result.removed == [removed_path]
+    assert not removed_path.exists()
+
+
+def test_sync_calendar(tmp_path: pathlib.Path) -> None:
+    calendar = icalendar.Calendar.from_ical(_GOOGLE_CALENDAR_PATH.read_bytes())
+    for _ in range(2):
+        result = ical2vdir.sync(calendar, tmp_path, state=True)
+    assert sorted(p.name for p in result.unchanged) == _GOOGLE_CALENDAR_ITEM_NAMES
+    assert result.stats["skipped"] == 1
+    assert result.stats["item_bytes_read"] == 0  # index
+
+
+def test_sync_logging_unconfigured(tmp_path: pathlib.Path) -> None:
+    root_logger = logging.getLogger()
+    handlers = list(root_logger.handlers)
+    level = root_logger.level
+    ical2vdir.sync(_GOOGLE_CALENDAR_PATH.read_bytes(), tmp_path)
+    assert root_logger.handlers == handlers
+    assert root_logger.level == level
+
+
+def test_import_lazy() -> None:
+    subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import sys, ical2vdir; assert 'icalendar' not in sys.modules",
+        ],
+        check=True,
+    )
+
+
+def test_sync_input_unchanged(tmp_path: pathlib.Path) -> None:
+    calendar_ical = _GOOGLE_CALENDAR_PATH.read_bytes()
+    ical2vdir.sync(calendar_ical, tmp_path, state=True)
+    with unittest.mock.patch.dict("sys.modules", {"icalendar": None}):
+        with _GOOGLE_CALENDAR_PATH.open("rb") as calendar_file:
+            result = ical2vdir.sync(calendar_file, tmp_path, state=True, delete=True)
+    assert sorted(p.name for p in result.unchanged) == _GOOGLE_CALENDAR_ITEM_NAMES
+    assert result.stats["input_bytes"] == len(calendar_ical)
+    assert result.stats["unchanged"] == 3
+    assert result.stats["item_bytes_read"] == 0
+
+
+def test_sync_input_unchanged_extra_item(tmp_path: pathlib.Path) -> None:
+    calendar_ical = _GOOGLE_CALENDAR_PATH.read_bytes()
+    ical2vdir.sync(calendar_ical, tmp_path, state=True)
+    extra_path = tmp_path.joinpath("extra.ics")
+    extra_path.touch()
+    result = ical2vdir.sync(calendar_ical, tmp_path, state=True)
+    assert not result.removed  # without --delete
+    assert len(result.unchanged) == 3
+    result = ical2vdir.sync(calendar_ical, tmp_path, state=True, delete=True)
+    assert result.removed == [extra_path]
+    assert len(result.unchanged) == 3
+
+
+def test_sync_input_unchanged_item_removed(tmp_path: pathlib.Path) -> None:
+    calendar_ical = _GOOGLE_CALENDAR_PATH.read_bytes()
+    ical2vdir.sync(calendar_ical, tmp_path, state=True)
+    removed_path = tmp_path.joinpath(_GOOGLE_CALENDAR_ITEM_NAMES[0])
+    removed_path.unlink()
+    result = ical2vdir.sync(calendar_ical, tmp_path, state=True)
+    assert result.created == [removed_path]
+
+
+def test_sync_input_changed(tmp_path: pathlib.Path) -> None:
+    calendar_ical = _GOOGLE_CALENDAR_PATH.read_bytes()
+    ical2vdir.sync(calendar_ical, tmp_path, state=True)
+    result = ical2vdir.sync(
+        calendar_ical.replace(b"DTSTAMP:20200205", b"DTSTAMP:20200206"),
+        tmp_path,
+        state=True,
+    )
+    assert len(result.unchanged) == 3
+    assert result.stats["skipped"] == 1  # parsed
+
+
+def test_sync_incremental(tmp_path: pathlib.Path) -> None:
+    calendar_ical = _GOOGLE_CALENDAR_PATH.read_bytes()
+    result = ical2vdir.sync(calendar_ical, tmp_path, incremental=True)
+    assert len(result.created) == 3
+    changed_ical = calendar_ical.replace(
+        b"DTSTAMP:20200205", b"DTSTAMP:20200206"
+    ).replace(b"SUMMARY:recurring", b"SUMMARY:changed", 1)
+    assert changed_ical.count(b"SUMMARY:changed") == 1
+    with unittest.mock.patch(
+        "icalendar.cal.Component.from_ical", wraps=icalendar.cal.Component.from_ical
+    ) as from_ical_mock:
+        result = ical2vdir.sync(changed_ical, tmp_path, incremental=True)
+    # VTIMEZONE, changed event & its previous version in output dir
+    assert from_ical_mock.call_count == 3
+    assert [p.name for p in result.updated] == [_GOOGLE_CALENDAR_ITEM_NAMES[2]]
+    assert sorted(p.name for p in result.unchanged) == _GOOGLE_CALENDAR_ITEM_NAMES[:2]
+    assert result.stats["skipped"] == 1
+    assert b"SUMMARY:changed" in result.updated[0].read_bytes()
+
+
+def test_sync_incremental_unchanged(tmp_path: pathlib.Path) -> None:
+    calendar_ical = _GOOGLE_CALENDAR_PATH.read_bytes()
+    ical2vdir.sync(calendar_ical, tmp_path, incremental=True)
+    with unittest.mock.patch(
+        "icalendar.cal.Component.from_ical", side_effect=AssertionError
+    ):
+        result = ical2vdir.sync(
+            calendar_ical.replace(b"DTSTAMP:20200205", b"DTSTAMP:20200206"),
+            tmp_path,
+            incremental=True,
+            delete=True,
+        )
+    assert sorted(p.name for p in result.unchanged) == _GOOGLE_CALENDAR_ITEM_NAMES
+    assert not result.removed
+    assert result.stats["skipped"] == 1  # VTIMEZONE not parsed
+
+
+def test_sync_incremental_component_removed(tmp_path: pathlib.Path) -> None:
+    calendar_ical = _GOOGLE_CALENDAR_PATH.read_bytes()
+    ical2vdir.sync(calendar_ical, tmp_path, incremental=True)
+    calendar = icalendar.Calendar.from_ical(calendar_ical)
+    calendar.subcomponents = [
+        c for c in calendar.subcomponents if "RECURRENCE-ID" not in c
+    ]
+    result = ical2vdir.sync(calendar.to_ical(), tmp_path, incremental=True, delete=True)
+    assert sorted(p.name for p in result.removed) == _GOOGLE_CALENDAR_ITEM_NAMES[1:]
+    assert sorted(p.name for p in tmp_path.glob("*.ics")) == [
+        _GOOGLE_CALENDAR_ITEM_NAMES[0]
+    ]
+    # re-added
+    with _GOOGLE_CALENDAR_PATH.open("rb") as calendar_file:
+        result = ical2vdir.sync(calendar_file, tmp_path, incremental=True)
+    assert sorted(p.name for p in result.created) == _GOOGLE_CALENDAR_ITEM_NAMES[1:]
+
+
+def test_sync_state_then_incremental(tmp_path: pathlib.Path) -> None:
+    calendar_ical = _GOOGLE_CALENDAR_PATH.read_bytes()
+    ical2vdir.sync(calendar_ical, tmp_path, state=True)
+    changed_ical = calendar_ical.replace(b"DTSTAMP:20200205", b"DTSTAMP:20200206")
+    result = ical2vdir.sync(changed_ical, tmp_path, incremental=True, delete=True)
+    assert sorted(p.name for p in result.unchanged) == _GOOGLE_CALENDAR_ITEM_NAMES
+    assert not result.removed
+    # components recorded by the --incremental run
+    with unittest.mock.patch(
+        "icalendar.cal.Component.from_ical", side_effect=AssertionError
+    ):
+        result = ical2vdir.sync(
+            changed_ical.replace(b"DTSTAMP:20200206", b"DTSTAMP:20200207"),
+            tmp_path,
+            incremental=True,
+        )
+    assert len(result.unchanged) == 3
+
+
+def test_sync_incremental_item_modified(tmp_path: pathlib.Path) -> None:
+    calendar_ical = _GOOGLE_CALENDAR_PATH.read_bytes()
+    ical2vdir.sync(calendar_ical, tmp_path, incremental=True)
+    modified_path = tmp_path.joinpath(_GOOGLE_CALENDAR_ITEM_NAMES[0])
+    modified_path.write_bytes(
+        modified_path.read_bytes().replace(b"SUMMARY:simple", b"SUMMARY:modified")
+    )
+    result = ical2vdir.sync(
+        calendar_ical.replace(b"DTSTAMP:20200205", b"DTSTAMP:20200206"),
+        tmp_path,
+        incremental=True,
+    )
+    assert result.updated == [modified_path]
+    assert len(result.unchanged) == 2
+
+
+def test_sync_paths(tmp_path: pathlib.Path) -> None:
+    calendar = icalendar.Calendar.from_ical(_GOOGLE_CALENDAR_PATH.read_bytes())
+    other_calendar_path = tmp_path.joinpath("other.ics")
+    other_calendar = icalendar.Calendar()
+    other_calendar.add_component(calendar.subcomponents.pop())
+    other_calendar_path.write_bytes(other_calendar.to_ical())
+    calendar_path = tmp_path.joinpath("calendar.ics")
+    calendar_path.write_bytes(calendar.to_ical())
+    output_dir_path = tmp_path.joinpath("output")
+    output_dir_path.mkdir()
+    for _ in range(2):
+        result = ical2vdir.sync(
+            [calendar_path, other_calendar_path],
+            output_dir_path,
+            state=True,
+            delete=True,
+        )
+    assert sorted(p.name for p in result.unchanged) == _GOOGLE_CALENDAR_ITEM_NAMES
+    assert not result.removed
+    assert result.stats["input_bytes"] == (
+        calendar_path.stat().st_size + other_calendar_path.stat().st_size
+    )
+    assert result.stats["item_bytes_read"] == 0
+    result = ical2vdir.sync([calendar_path], output_dir_path, delete=True)
+    assert sorted(p.name for p in result.unchanged + result.removed) == (
+        _GOOGLE_CALENDAR_ITEM_NAMES
+    )
+    assert len(result.removed) == 1
+
+
+def test_sync_single_scan(tmp_path: pathlib.Path) -> None:
+    calendar_ical = _GOOGLE_CALENDAR_PATH.read_bytes()
+    ical2vdir.sync(calendar_ical, tmp_path, state=True)
+    updated_path = tmp_path.joinpath(_GOOGLE_CALENDAR_ITEM_NAMES[1])
+    updated_path.write_bytes(
+        updated_path.read_bytes().replace(b"SUMMARY:recurring", b"SUMMARY:changed")
+    )
+    tmp_path.joinpath(_GOOGLE_CALENDAR_ITEM_NAMES[2]).unlink()
+    tmp_path.joinpath("extra.ics").touch()
+    with unittest.mock.patch(
+        "os.scandir", wraps=os.scandir
+    ) as scandir_mock, unittest.mock.patch(
+        "pathlib.Path.stat", side_effect=AssertionError
+    ), unittest.mock.patch(
+        "pathlib.Path.exists", side_effect=AssertionError
+    ), unittest.mock.patch(
+        "pathlib.Path.is_file", side_effect=AssertionError
+    ), unittest.mock.patch(
+        "pathlib.Path.is_dir", side_effect=AssertionError
+    ):
+        result = ical2vdir.sync(
+            calendar_ical, tmp_path, state=True, delete=True, jobs=2
+        )
+    scandir_mock.assert_called_once_with(tmp_path)
+    assert [p.name for p in result.unchanged] == [_GOOGLE_CALENDAR_ITEM_NAMES[0]]
+    assert result.updated == [updated_path]
+    assert [p.name for p in result.created] == [_GOOGLE_CALENDAR_ITEM_NAMES[2]]
+    assert [p.name for p in result.removed] == ["extra.ics"]
+    result = ical2vdir.sync(calendar_ical, tmp_path, state=True, delete=True)
+    assert len(result.unchanged) == 3
+    assert result.stats["item_bytes_read"] == 0
+
+
+@pytest.mark.parametrize(
+    ("limits", "removed_count"),
+    [
+        ({"max_delete": 2}, 2),
+        ({"max_delete": 1}, None),
+        ({"max_delete_fraction": 0.4}, 2),
+        ({"max_delete_fraction": 0.3}, None),
+        ({"max_delete": 2, "max_delete_fraction": 0.3}, None),
+    ],
+)
+def test_sync_delete_limit(
+    tmp_path: pathlib.Path, limits: dict[str, typing.Any], removed_count: int | None
+) -> None:
+    ical2vdir.sync(_GOOGLE_CALENDAR_PATH.read_bytes(), tmp_path)
+    for name in ["a.ics", "b.ics"]:
+        tmp_path.joinpath(name).touch()
+    if removed_count is None:
+        with pytest.raises(
+            ical2vdir.DeleteLimitExceeded, match=r"^refusing to remove 2 of 5 items"
+        ):
+            ical2vdir.sync(
+                _GOOGLE_CALENDAR_PATH.read_bytes(), tmp_path, delete=True, **limits
+            )
+        assert len(list(tmp_path.iterdir())) == 5
+    else:
+        result = ical2vdir.sync(
+            _GOOGLE_CALENDAR_PATH.read_bytes(), tmp_path, delete=True, **limits
+        )
+        assert len(result.removed) == removed_count
+        assert sorted(p.name for p in tmp_path.iterdir()) == _GOOGLE_CALENDAR_ITEM_NAMES
+
+
+def test_sync_delete_batches(
+    caplog: pytest.LogCaptureFixture, tmp_path: pathlib.Path
+) -> None:
+    names = [f"{i}.ics" for i in range(7)]
+    for name in names:
+        tmp_path.joinpath(name).touch()
+    with unittest.mock.patch("time.sleep") as sleep_mock, caplog.at_level(logging.INFO):
+        result = ical2vdir.sync(
+            _GOOGLE_CALENDAR_PATH.read_bytes(),
+            tmp_path,
+            delete=True,
+            delete_batch_size=3,
+            delete_interval=0.5,
+        )
+    assert sorted(p.name for p in result.removed) == names
+    assert sleep_mock.call_args_list == [unittest.mock.call(0.5)] * 2
+    assert [r.message for r in caplog.records if r.message.startswith("remov")] == [
+        "removed 7 items not in input"
+    ]
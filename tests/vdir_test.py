@@ -16,15 +16,17 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 import copy
+import datetime
 import os
 import pathlib
-import tempfile
 import unittest.mock
 
 import icalendar.cal
+import icalendar.prop
 import pytest
 
 import ical2vdir
+import ical2vdir._common
 
 
 def _normalize_ical(ical: bytes) -> bytes:
@@ -52,25 +54,82 @@ END:VEVENT
 # tmp_path fixture: https://github.com/pytest-dev/pytest/blob/5.4.3/src/_pytest/tmpdir.py#L191
 
 
-def test__write_event_cleanup(tmp_path: pathlib.Path) -> None:
+def test__atomic_writer_cleanup(tmp_path: pathlib.Path) -> None:
     event = icalendar.cal.Event.from_ical(_SINGLE_EVENT_ICAL)
     with pytest.raises(IsADirectoryError):
-        ical2vdir._write_event(event, tmp_path)
+        ical2vdir._common._AtomicWriter().write(ical2vdir._event_ical(event), tmp_path)
     assert tmp_path.is_dir()  # did not overwrite
 
 
-def test__write_event_move_failed(tmp_path: pathlib.Path) -> None:
+def test__atomic_writer_move_failed(tmp_path: pathlib.Path) -> None:
     event = icalendar.cal.Event.from_ical(_SINGLE_EVENT_ICAL)
     output_path = tmp_path.joinpath("test.ics")
     with unittest.mock.patch("os.unlink") as unlink_mock, unittest.mock.patch(
-        "shutil.move", side_effect=Exception("test")
+        "os.replace", side_effect=Exception("test")
     ), pytest.raises(Exception, match=r"^test$"):
-        ical2vdir._write_event(event, output_path)
+        ical2vdir._common._AtomicWriter().write(
+            ical2vdir._event_ical(event), output_path
+        )
     assert not output_path.exists()
     unlink_mock.assert_called_once()  # cleanup temporary file
     unlink_args, _ = unlink_mock.call_args
     (temp_path,) = unlink_args
-    assert os.path.dirname(temp_path) == os.path.dirname(tempfile.mkdtemp())
+    # same filesystem as target, not picked up as vdir item
+    assert os.path.dirname(temp_path) == str(tmp_path)
+    assert os.path.basename(temp_path).startswith(".")
+    assert not temp_path.endswith(".ics")
+
+
+def test__atomic_writer_no_temp_files_left(tmp_path: pathlib.Path) -> None:
+    event = icalendar.cal.Event.from_ical(_SINGLE_EVENT_ICAL)
+    ical2vdir._common._AtomicWriter().write(
+        ical2vdir._event_ical(event), tmp_path.joinpath("test.ics")
+    )
+    assert [p.name for p in tmp_path.iterdir()] == ["test.ics"]
+
+
+@pytest.mark.parametrize(
+    ("fsync", "expected_write_fsync_count", "expected_flush_fsync_count"),
+    [("never", 0, 0), ("batch", 0, 3), ("always", 2, 1)],
+)
+def test__atomic_writer_fsync(
+    tmp_path: pathlib.Path,
+    fsync: str,
+    expected_write_fsync_count: int,
+    expected_flush_fsync_count: int,
+) -> None:
+    writer = ical2vdir._common._AtomicWriter(fsync=fsync)
+    with unittest.mock.patch("os.fsync") as fsync_mock:
+        writer.write(b"a", tmp_path.joinpath("a.ics"))
+        writer.write(b"b", tmp_path.joinpath("b.ics"))
+        assert fsync_mock.call_count == expected_write_fsync_count
+        writer.flush()
+        assert (
+            fsync_mock.call_count
+            == expected_write_fsync_count + expected_flush_fsync_count
+        )
+        writer.flush()
+        assert (
+            fsync_mock.call_count
+            == expected_write_fsync_count + expected_flush_fsync_count
+        )
+    assert tmp_path.joinpath("a.ics").read_bytes() == b"a"
+
+
+def test__atomic_writer_mkdir_concurrent(tmp_path: pathlib.Path) -> None:
+    writer = ical2vdir._common._AtomicWriter(fsync="batch")
+    path = tmp_path.joinpath("parent", "dir")
+    mkdir = writer.mkdir
+
+    def mkdir_concurrent(dir_path: pathlib.Path) -> None:
+        mkdir(dir_path)
+        if dir_path == path.parent:  # by other thread
+            path.mkdir()
+
+    with unittest.mock.patch.object(writer, "mkdir", side_effect=mkdir_concurrent):
+        writer.mkdir(path)
+    assert path.is_dir()
+    assert writer._unsynced_dir_paths == {tmp_path}
 
 
 @pytest.mark.parametrize(
@@ -115,7 +174,7 @@ END:VTODO
 )
 def test__event_vdir_filename(event_ical: bytes, expected_filename: str) -> None:
     event = icalendar.cal.Event.from_ical(event_ical)
-    assert ical2vdir._event_vdir_filename(event) == expected_filename
+    assert ical2vdir._common._event_vdir_filename(event) == expected_filename
 
 
 @pytest.mark.parametrize("event_ical", [_SINGLE_EVENT_ICAL])
@@ -149,3 +208,199 @@ def test__sync_event_unchanged(tmp_path: pathlib.Path, event_ical: bytes) -> Non
     ical2vdir._sync_event(event, tmp_path)
     assert ics_path.stat() == old_stat
     assert ics_path.read_bytes() == _SINGLE_EVENT_ICAL
+
+
+@pytest.mark.parametrize("event_ical", [_SINGLE_EVENT_ICAL])
+def test__sync_event_unchanged_dtstamp_skip_parse(
+    tmp_path: pathlib.Path, event_ical: bytes
+) -> None:
+    event = icalendar.cal.Event.from_ical(event_ical)
+    ical2vdir._sync_event(event, tmp_path)
+    event["DTSTAMP"] = icalendar.prop.vDDDTypes(
+        datetime.datetime(2026, 1, 1, tzinfo=datetime.timezone.utc)
+    )
+    with unittest.mock.patch(
+        "icalendar.Event.from_ical", side_effect=Exception("parsed")
+    ), unittest.mock.patch("ical2vdir._write_item") as write_mock:
+        ical2vdir._sync_event(event, tmp_path)
+    write_mock.assert_not_called()
+
+
+@pytest.mark.parametrize("event_ical", [_SINGLE_EVENT_ICAL])
+def test__sync_event_serialized_once(tmp_path: pathlib.Path, event_ical: bytes) -> None:
+    event = icalendar.cal.Event.from_ical(event_ical)
+    with unittest.mock.patch.object(
+        icalendar.cal.Component,
+        "to_ical",
+        autospec=True,
+        side_effect=icalendar.cal.Component.to_ical,
+    ) as to_ical_mock:
+        assert ical2vdir._sync_event(event, tmp_path)[1] == "created"
+        to_ical_mock.assert_called_once()
+        event["SUMMARY"] = "changed"
+        assert ical2vdir._sync_event(event, tmp_path)[1] == "updated"
+        assert to_ical_mock.call_count == 2
+    (item_path,) = tmp_path.iterdir()
+    assert item_path.read_bytes() == event.to_ical()
+
+
+@pytest.mark.parametrize("event_ical", [_SINGLE_EVENT_ICAL])
+def test__sync_event_unchanged_identical(
+    tmp_path: pathlib.Path, event_ical: bytes
+) -> None:
+    event = icalendar.cal.Event.from_ical(event_ical)
+    ical2vdir._sync_event(event, tmp_path)
+    with unittest.mock.patch(
+        "ical2vdir._ical_digest", wraps=ical2vdir._ical_digest
+    ) as digest_mock:
+        assert ical2vdir._sync_event(event, tmp_path)[1] == "unchanged"
+    digest_mock.assert_called_once()  # item not hashed
+    event["DTSTAMP"] = icalendar.prop.vDDDTypes(
+        datetime.datetime(2026, 1, 1, tzinfo=datetime.timezone.utc)
+    )
+    with unittest.mock.patch(
+        "ical2vdir._ical_digest", wraps=ical2vdir._ical_digest
+    ) as digest_mock, unittest.mock.patch(
+        "icalendar.Event.from_ical", side_effect=Exception("parsed")
+    ):
+        assert ical2vdir._sync_event(event, tmp_path)[1] == "unchanged"
+    digest_mock.assert_called_once()
+
+
+@pytest.mark.parametrize("event_ical", [_SINGLE_EVENT_ICAL])
+def test__sync_event_unchanged_line_breaks(
+    tmp_path: pathlib.Path, event_ical: bytes
+) -> None:
+    event = icalendar.cal.Event.from_ical(event_ical)
+    tmp_path.joinpath("1qa2ws3ed4rf5tg@google.com.ics").write_bytes(
+        event.to_ical().replace(b"\r\n", b"\n")
+    )
+    with unittest.mock.patch(
+        "icalendar.Event.from_ical", side_effect=Exception("parsed")
+    ), unittest.mock.patch("ical2vdir._write_item") as write_mock:
+        assert ical2vdir._sync_event(event, tmp_path)[1] == "unchanged"
+    write_mock.assert_not_called()
+
+
+@pytest.mark.parametrize("event_ical", [_SINGLE_EVENT_ICAL])
+def test__sync_event_unchanged_digest_mismatch(
+    tmp_path: pathlib.Path, event_ical: bytes
+) -> None:
+    tmp_path.joinpath("1qa2ws3ed4rf5tg@google.com.ics").write_bytes(
+        # parameter order differs from icalendar's serialization
+        event_ical.replace(
+            b"DTSTART:20201024T100000Z",
+            b"DTSTART;X-B=2;X-A=1:20201024T100000Z",
+        )
+    )
+    event = icalendar.cal.Event.from_ical(
+        event_ical.replace(
+            b"DTSTART:20201024T100000Z",
+            b"DTSTART;X-A=1;X-B=2:20201024T100000Z",
+        )
+    )
+    with unittest.mock.patch("ical2vdir._write_item") as write_mock:
+        ical2vdir._sync_event(event, tmp_path)
+    write_mock.assert_not_called()
+
+
+@pytest.mark.parametrize("event_ical", [_SINGLE_EVENT_ICAL])
+def test__sync_event_state_skip(tmp_path: pathlib.Path, event_ical: bytes) -> None:
+    event = icalendar.cal.Event.from_ical(event_ical)
+    state: ical2vdir._common._State = {}
+    ical2vdir._sync_event(
+        event, tmp_path, context=ical2vdir._common._SyncContext(state=state)
+    )
+    (ics_path,) = tmp_path.iterdir()
+    assert state == {
+        ics_path.name: {
+            "uid": "1qa2ws3ed4rf5tg@google.com",
+            "recurrence_id": None,
+            "digest": ical2vdir._ical_digest(event_ical),
+            "mtime_ns": ics_path.stat().st_mtime_ns,
+            "size": len(event_ical),
+        }
+    }
+    with unittest.mock.patch(
+        "pathlib.Path.open", side_effect=Exception("opened")
+    ), unittest.mock.patch("ical2vdir._write_item") as write_mock:
+        assert ical2vdir._sync_event(
+            event, tmp_path, context=ical2vdir._common._SyncContext(state=state)
+        ) == (ics_path, "unchanged")
+    write_mock.assert_not_called()
+
+
+@pytest.mark.parametrize("event_ical", [_SINGLE_EVENT_ICAL])
+def test__sync_event_state_external_modification(
+    tmp_path: pathlib.Path, event_ical: bytes
+) -> None:
+    event = icalendar.cal.Event.from_ical(event_ical)
+    state: ical2vdir._common._State = {}
+    ical2vdir._sync_event(
+        event, tmp_path, context=ical2vdir._common._SyncContext(state=state)
+    )
+    (ics_path,) = tmp_path.iterdir()
+    ics_path.write_bytes(event_ical.replace(b"party", b"modified"))
+    ical2vdir._sync_event(
+        event, tmp_path, context=ical2vdir._common._SyncContext(state=state)
+    )
+    assert ics_path.read_bytes() == event_ical
+    assert state[ics_path.name]["mtime_ns"] == ics_path.stat().st_mtime_ns
+
+
+@pytest.mark.parametrize("event_ical", [_SINGLE_EVENT_ICAL])
+def test__sync_event_state_external_removal(
+    tmp_path: pathlib.Path, event_ical: bytes
+) -> None:
+    event = icalendar.cal.Event.from_ical(event_ical)
+    state: ical2vdir._common._State = {}
+    ical2vdir._sync_event(
+        event, tmp_path, context=ical2vdir._common._SyncContext(state=state)
+    )
+    (ics_path,) = tmp_path.iterdir()
+    ics_path.unlink()
+    ical2vdir._sync_event(
+        event, tmp_path, context=ical2vdir._common._SyncContext(state=state)
+    )
+    assert ics_path.read_bytes() == event_ical
+
+
+def test__read_state_file_missing(tmp_path: pathlib.Path) -> None:
+    assert not ical2vdir._common._read_state_file(tmp_path)
+
+
+@pytest.mark.parametrize("state_json", [b"{", b"[]", b'{"version":0,"items":{}}'])
+def test__read_state_file_invalid(tmp_path: pathlib.Path, state_json: bytes) -> None:
+    tmp_path.joinpath(".ical2vdir-state").write_bytes(state_json)
+    assert not ical2vdir._common._read_state_file(tmp_path)
+
+
+def test__save_state(tmp_path: pathlib.Path) -> None:
+    state: ical2vdir._common._State = {"a.ics": {"digest": "0123"}}
+    ical2vdir._common._save_state(state, tmp_path)
+    assert ical2vdir._common._read_state_file(tmp_path)["items"] == state
+
+
+@pytest.mark.parametrize("jobs", [1, 2, 8])
+def test__sync_events_order(tmp_path: pathlib.Path, jobs: int) -> None:
+    events = []
+    for index in range(32):
+        event = icalendar.cal.Event.from_ical(_SINGLE_EVENT_ICAL)
+        event["UID"] = f"{index % 8}@test"
+        event["SUMMARY"] = f"party {index}"
+        events.append(event)
+    calendar = icalendar.cal.Calendar()
+    calendar.add_component(icalendar.cal.Timezone(TZID="Europe/Vienna"))
+    output_paths = list(
+        ical2vdir._sync_events(
+            [calendar.subcomponents[0]] + events, tmp_path, jobs=jobs
+        )
+    )
+    assert [p.name for p, _ in output_paths] == [f"{i % 8}@test.ics" for i in range(32)]
+    assert [a for _, a in output_paths] == ["created"] * 8 + ["updated"] * 24
+    assert len(list(tmp_path.iterdir())) == 8
+    for index in range(8):  # last one wins
+        event = icalendar.cal.Event.from_ical(
+            tmp_path.joinpath(f"{index}@test.ics").read_bytes()
+        )
+        assert event["SUMMARY"] == f"party {24 + index}"
@@ -0,0 +1,276 @@
+# ical2vdir - convert .ics file to vdir directory
+#
+# Copyright (C) 2020 Fabian Peter Hammerle <fabian@hammerle.me>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import json
+import logging
+import pathlib
+import threading
+import unittest.mock
+
+import _pytest.capture  # pylint: disable=import-private-name; tests
+import _pytest.logging  # pylint: disable=import-private-name; tests
+import pytest
+
+import ical2vdir
+import ical2vdir._cli
+import ical2vdir._common
+import ical2vdir._layout
+import ical2vdir._watch
+
+# pylint: disable=protected-access
+
+_GOOGLE_CALENDAR_PATH = pathlib.Path(__file__).parent.joinpath(
+    "resources", "google-calendar.ics"
+)
+_ITEM_NAME = "1234567890qwertyuiopasdfgh@google.com.ics"
+
+
+def _write_later(path: pathlib.Path, data: bytes) -> threading.Timer:
+    timer = threading.Timer(0.1, path.write_bytes, args=(data,))
+    timer.start()
+    return timer
+
+
+def test__file_signature(tmp_path: pathlib.Path) -> None:
+    path = tmp_path.joinpath("a.ics")
+    assert ical2vdir._watch._file_signature(path) is None
+    path.write_bytes(b"a")
+    stat = path.stat()
+    assert ical2vdir._watch._file_signature(path) == (
+        stat.st_ino,
+        stat.st_mtime_ns,
+        1,
+    )
+
+
+def test_sync_cache(tmp_path: pathlib.Path) -> None:
+    cache = ical2vdir._watch._SyncCache(tmp_path)
+    calendar_ical = _GOOGLE_CALENDAR_PATH.read_bytes()
+    ical2vdir.sync(calendar_ical, tmp_path, state=True, cache=cache)
+    scan = cache.scan
+    assert scan is not None
+    with unittest.mock.patch(
+        "ical2vdir._new_scan"
+    ) as new_scan_mock, unittest.mock.patch("json.load") as json_load_mock:
+        result = ical2vdir.sync(
+            calendar_ical.replace(b"SUMMARY:simple", b"SUMMARY:changed"),
+            tmp_path,
+            state=True,
+            cache=cache,
+        )
+    new_scan_mock.assert_not_called()
+    json_load_mock.assert_not_called()  # index
+    assert cache.scan is scan
+    assert [p.name for p in result.updated] == [_ITEM_NAME]
+    # removed by another process
+    tmp_path.joinpath(_ITEM_NAME).unlink()
+    cache.invalidate(_ITEM_NAME)
+    cache.invalidate(ical2vdir._common._STATE_FILENAME)  # ignored
+    result = ical2vdir.sync(calendar_ical, tmp_path, state=True, cache=cache)
+    assert [p.name for p in result.created] == [_ITEM_NAME]
+    # index modified by another process
+    state_path = tmp_path.joinpath(ical2vdir._common._STATE_FILENAME)
+    state_path.write_bytes(
+        json.dumps({**json.loads(state_path.read_bytes()), "input": None}).encode()
+    )
+    with unittest.mock.patch("json.load", side_effect=json.load) as json_load_mock:
+        ical2vdir.sync(calendar_ical, tmp_path, state=True, cache=cache)
+    json_load_mock.assert_called_once()
+
+
+def test_sync_cache_sharded(tmp_path: pathlib.Path) -> None:
+    cache = ical2vdir._watch._SyncCache(tmp_path)
+    calendar_ical = _GOOGLE_CALENDAR_PATH.read_bytes()
+    ical2vdir.sync(calendar_ical, tmp_path, layout="sharded", cache=cache)
+    item_path = ical2vdir._layout._item_path(tmp_path, _ITEM_NAME, "sharded")
+    item_path.unlink()
+    cache.invalidate(_ITEM_NAME)
+    result = ical2vdir.sync(calendar_ical, tmp_path, layout="sharded", cache=cache)
+    assert [p.name for p in result.created] == [_ITEM_NAME]
+    assert item_path.exists()
+    # regular file written by another process
+    tmp_path.joinpath("other.ics").write_bytes(b"BEGIN:VTODO\r\nEND:VTODO\r\n")
+    cache.invalidate("other.ics")
+    result = ical2vdir.sync(
+        calendar_ical, tmp_path, layout="sharded", delete=True, cache=cache
+    )
+    assert [p.name for p in result.removed] == ["other.ics"]
+    assert not tmp_path.joinpath("other.ics").exists()
+
+
+def test__watcher_inotify(tmp_path: pathlib.Path) -> None:
+    input_path = tmp_path.joinpath("input.ics")
+    input_path.write_bytes(b"")
+    output_dir_path = tmp_path.joinpath("output")
+    shard_path = output_dir_path.joinpath(".shards", "00")
+    shard_path.mkdir(parents=True)
+    watcher = ical2vdir._watch._Watcher(
+        [input_path], output_dir_path, debounce=0.05, poll_interval=60
+    )
+    cache = ical2vdir._watch._SyncCache(output_dir_path)
+    cache.scan = unittest.mock.MagicMock()
+    # other files in input directory are ignored
+    tmp_path.joinpath("other.ics").write_bytes(b"")
+    output_dir_path.joinpath("a.ics").write_bytes(b"")
+    shard_path.joinpath("b.ics").write_bytes(b"")
+    timer = _write_later(input_path, b"changed")
+    try:
+        watcher.wait(cache)
+    finally:
+        timer.join()
+        watcher.close()
+    # per event (create, modify & close)
+    assert {c.args[0] for c in cache.scan.invalidate.call_args_list} == {
+        "a.ics",
+        "b.ics",
+    }
+
+
+def test__watcher_inotify_overflow(tmp_path: pathlib.Path) -> None:
+    watcher = ical2vdir._watch._Watcher([], tmp_path, debounce=0, poll_interval=60)
+    cache = ical2vdir._watch._SyncCache(tmp_path)
+    cache.scan = unittest.mock.MagicMock()
+    with unittest.mock.patch.object(
+        ical2vdir._watch._Inotify,
+        "read",
+        return_value=[(None, ical2vdir._watch._IN_Q_OVERFLOW, "")],
+    ):
+        watcher.wait(cache)
+    watcher.close()
+    assert cache.scan is None  # listed again by next run
+
+
+def test__inotify_unavailable() -> None:
+    with unittest.mock.patch("ctypes.CDLL", return_value=object()):
+        with pytest.raises(OSError, match=r"^inotify is not supported$"):
+            ical2vdir._watch._Inotify()
+    libc_mock = unittest.mock.MagicMock()
+    libc_mock.inotify_init1.return_value = -1
+    with unittest.mock.patch("ctypes.CDLL", return_value=libc_mock):
+        with pytest.raises(OSError):
+            ical2vdir._watch._Inotify()
+
+
+def test__inotify_add_watch_failed(tmp_path: pathlib.Path) -> None:
+    inotify = ical2vdir._watch._Inotify()
+    with pytest.raises(FileNotFoundError):
+        inotify.add_watch(tmp_path.joinpath("missing"), ical2vdir._watch._IN_CREATE)
+    inotify.close()
+
+
+def test__watcher_poll(
+    tmp_path: pathlib.Path, caplog: _pytest.logging.LogCaptureFixture
+) -> None:
+    input_path = tmp_path.joinpath("input.ics")
+    input_path.write_bytes(b"")
+    with unittest.mock.patch(
+        "ical2vdir._watch._Inotify", side_effect=OSError("inotify is not supported")
+    ), caplog.at_level(logging.WARNING):
+        watcher = ical2vdir._watch._Watcher(
+            [input_path], tmp_path, debounce=0.05, poll_interval=0.01
+        )
+    assert caplog.record_tuples == [
+        (
+            "ical2vdir._watch",
+            logging.WARNING,
+            "inotify unavailable (inotify is not supported), polling every 0.01 seconds",
+        )
+    ]
+    cache = ical2vdir._watch._SyncCache(tmp_path)
+    cache.scan = unittest.mock.MagicMock()
+    timer = _write_later(input_path, b"changed")
+    try:
+        watcher.wait(cache)
+    finally:
+        timer.join()
+        watcher.close()
+    assert cache.scan is None
+
+
+def test__main_watch(
+    tmp_path: pathlib.Path,
+    caplog: _pytest.logging.LogCaptureFixture,
+    capsys: _pytest.capture.CaptureFixture[str],
+) -> None:
+    input_path = tmp_path.joinpath("input.ics")
+    input_path.write_bytes(_GOOGLE_CALENDAR_PATH.read_bytes())
+    output_dir_path = tmp_path.joinpath("output")
+    output_dir_path.mkdir()
+    waits: list[ical2vdir._watch._SyncCache] = []
+
+    def wait(cache: ical2vdir._watch._SyncCache) -> None:
+        waits.append(cache)
+        if len(waits) == 1:
+            input_path.write_bytes(b"BEGIN:VCALENDAR\r\nBEGIN:VEVENT\r\n")
+        elif len(waits) == 2:
+            input_path.write_bytes(
+                _GOOGLE_CALENDAR_PATH.read_bytes().replace(
+                    b"SUMMARY:simple", b"SUMMARY:changed"
+                )
+            )
+        else:
+            raise KeyboardInterrupt()
+
+    with unittest.mock.patch(
+        "sys.argv",
+        [
+            "",
+            "--input",
+            str(input_path),
+            "--output-dir",
+            str(output_dir_path),
+            "--watch",
+            "--stats",
+            "json",
+        ],
+    ), unittest.mock.patch.object(
+        ical2vdir._watch._Watcher, "wait", side_effect=wait
+    ), caplog.at_level(
+        logging.INFO
+    ):
+        ical2vdir._cli._main()
+    assert len(waits) == 3
+    # index & listing kept after successful runs
+    assert waits[0] is not waits[1] and waits[1] is waits[2]
+    assert waits[2].scan is not None
+    assert output_dir_path.joinpath(ical2vdir._common._STATE_FILENAME).exists()
+    assert b"SUMMARY:changed" in output_dir_path.joinpath(_ITEM_NAME).read_bytes()
+    messages = [r.message for r in caplog.records]
+    assert messages[3] == "unexpected end of input within component"
+    assert messages[-1] == f"updating {output_dir_path.joinpath(_ITEM_NAME)}"
+    stats = json.loads("[" + capsys.readouterr().out.replace("}\n{", "},{") + "]")
+    assert [s["created"] for s in stats] == [3, 0]
+    assert [s["updated"] for s in stats] == [0, 1]
+    assert stats[1]["unchanged"] == 2
+
+
+@pytest.mark.parametrize(
+    ("args", "message"),
+    [
+        (["--watch"], "--watch requires --input"),
+        (
+            ["--watch", "--input", "input.ics", "--dry-run"],
+            "--dry-run is not supported with --watch",
+        ),
+    ],
+)
+def test__main_watch_invalid(
+    args: list[str], message: str, capsys: _pytest.capture.CaptureFixture[str]
+) -> None:
+    with unittest.mock.patch("sys.argv", [""] + args), pytest.raises(SystemExit):
+        ical2vdir._cli._main()
+    assert capsys.readouterr().err.endswith(f"error: {message}\n")